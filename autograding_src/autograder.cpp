@@ -5,6 +5,8 @@ The grade function checks the student's output for each item and sums the corres
 */
 
 #include "autograder.h"
+#include "grader.h"
+#include "tests.h"
 #include <sqlite3.h>
 #include <cstring>
 
@@ -27,7 +29,7 @@ Autograder::Autograder(const std::string& autograderName) {
 
 bool Autograder::loadFromDatabase(const std::string& autograderName) {
     sqlite3* db;
-    std::string dbPath = "/data/database.db";
+    std::string dbPath = databasePath();
     
     int rc = sqlite3_open(dbPath.c_str(), &db);
     if (rc) {
@@ -123,7 +125,7 @@ void Autograder::parseWeightsFromJSON(const char* json) {
 // The total mark is the sum of all matched items, out of the total possible points.
 void Autograder::grade(std::string studentOutput, Mark &mark) {
     std::cout << "=== GRADING RESULTS ===" << std::endl;
-    std::cout << "Grading output: '" << studentOutput << "'" << std::endl;
+    std::cout << "Grading output: \"" << jsonEscape(studentOutput) << "\"" << std::endl;
     
     int totalMarks = 0;
     int totalOutOf = 0;
@@ -11,6 +11,11 @@ The binary to run after compilation must be named the same as the assignment nam
 #include <cstdlib>
 #include <unistd.h> 
 #include <fstream>
+#include <set>
+#include <sstream>
+#include <cstdint>
+#include <cstdio>
+#include <chrono>
 
 namespace fs = std::filesystem;
 
@@ -29,20 +34,35 @@ std::pair<int, std::string> parseFilename(const std::string& filename) {
     return {studentId, assignmentName};
 }
 
+// Print the log of a step that ran submission code, then remove it. Every line is quoted with a
+// "| " prefix, so nothing the submission printed can pass for a line of the grader's own output.
+static void printQuotedLog(const std::string& logPath) {
+    std::ifstream log(logPath);
+    std::string line;
+    while (std::getline(log, line)) {
+        std::cout << "| " << line << "\n";
+    }
+    std::cout.flush();
+    remove(logPath.c_str());
+}
+
 // Unzips the file at zipPath into the directory extractPath.
 // Returns true if successful, false otherwise. If this fails the assignment will be graded as 0.
 bool unzipFile(const std::string& zipPath, const std::string& extractPath) {
     std::string command = "unzip -q \"" + zipPath + "\" -d \"" + extractPath + "\"";
     std::cout << "Running command: " << command << std::endl;
     
-    int result = system(command.c_str());
-    std::cout << "Unzip result code: " << result << std::endl;
+    fs::create_directories(extractPath);
+    std::string log = "/tmp/unzip_" + std::to_string(getpid()) + ".log";
+    bool unzipped = runConfined(command, extractPath, log);
+    std::cout << "Unzip " << (unzipped ? "succeeded" : "failed") << std::endl;
+    printQuotedLog(log);
     
     // Check if extraction was successful by looking for files
     if (fs::exists(extractPath) && !fs::is_empty(extractPath)) {
         std::cout << "Extraction successful, contents:" << std::endl;
         for (const auto& entry : fs::directory_iterator(extractPath)) {
-            std::cout << "  " << entry.path().filename() << std::endl;
+            std::cout << "  \"" << jsonEscape(entry.path().filename().string()) << "\"" << std::endl;
         }
         return true;
     } else {
@@ -51,83 +71,218 @@ bool unzipFile(const std::string& zipPath, const std::string& extractPath) {
     }
 }
 
+// Directory of the g++/c++ wrappers that force-include the image's precompiled standard headers
+// (see pch/build_pch.sh), from AUTOGRADER_PCH_BIN. Unset or empty leaves them off. The web server
+// sets it only when an admin opted in, since the forced include also hides missing #includes.
+static std::string pchBinDirectory() {
+    const char* path = getenv("AUTOGRADER_PCH_BIN");
+    return path ? path : "";
+}
+
+// Build with the precompiled-header wrappers in a copy of directory, and on success put the copy in
+// its place. A failed attempt is thrown away whole, so the plain build never reuses its object files.
+static bool compileWithPch(const std::string& directory, const std::string& pchBin, double timeoutSeconds) {
+    std::string copy = directory + ".pch";
+    std::string original = directory + ".orig";
+    std::string log = "/tmp/pch_make_" + std::to_string(getpid()) + ".log";
+    std::error_code ec;
+    fs::remove_all(copy, ec);
+    fs::copy(directory, copy, fs::copy_options::recursive | fs::copy_options::copy_symlinks, ec);
+    bool compiled = !ec && runConfined("PATH=\"" + pchBin + ":$PATH\" make", copy, log, timeoutSeconds);
+    if (compiled) {
+        fs::rename(directory, original, ec);
+        if (!ec) {
+            fs::rename(copy, directory, ec);
+            if (ec) {
+                fs::rename(original, directory, ec);
+                compiled = false;
+            }
+        }
+        compiled = compiled && !ec;
+    }
+    if (compiled) {
+        printQuotedLog(log);
+    } else {
+        remove(log.c_str());
+    }
+    fs::remove_all(original, ec);
+    fs::remove_all(copy, ec);
+    return compiled;
+}
+
 // Attempts to compile the extracted code using the Makefile in the directory.
 // Returns true if compilation was successful, false otherwise.
 // If compilation fails the assignment will be graded as 0.
+// With precompiled headers enabled, the Makefile is first run with their wrappers first on PATH,
+// in a throwaway copy. If that fails (the forced include can clash with the student's own names),
+// its output is discarded and the Makefile runs again as written in the untouched directory, so
+// students only ever see errors from their own build.
+// The Makefile is the student's code too: make runs under the student program's limits (runConfined).
+// Both attempts share one BUILD_TIMEOUT_SECONDS, so a build can't take twice as long by failing the first.
 bool compileCode(const std::string& directory) {
-    std::string command = "cd \"" + directory + "\" && make";
-    return system(command.c_str()) == 0;
+    auto started = std::chrono::steady_clock::now();
+    auto remaining = [&started]() {
+        return BUILD_TIMEOUT_SECONDS - std::chrono::duration<double>(std::chrono::steady_clock::now() - started).count();
+    };
+    std::string pchBin = pchBinDirectory();
+    if (!pchBin.empty() && fs::exists(pchBin + "/g++")) {
+        if (compileWithPch(directory, pchBin, BUILD_TIMEOUT_SECONDS)) {
+            return true;
+        }
+        if (remaining() <= 0) {
+            return false;  // runConfined reported the timeout
+        }
+        std::cout << "Build with precompiled headers failed, building without them" << std::endl;
+    }
+    std::string log = "/tmp/make_" + std::to_string(getpid()) + ".log";
+    bool compiled = runConfined("make", directory, log, remaining());
+    printQuotedLog(log);
+    return compiled;
 }
 
-Assignment* findAssignment(Assignment assignments[], int assignmentCount, const std::string& assignmentName) {
-    for (int i = 0; i < assignmentCount; ++i) {
-        if (assignments[i].getName() == assignmentName) {
-            return &assignments[i];
+// True if the extracted submission holds nothing but build inputs (sources, headers, Makefiles).
+// Only then does the compiled binary alone reproduce everything a test run can see, so it may be
+// exported and later run in place of unzipping and building the submission again.
+bool onlyBuildInputs(const std::string& directory) {
+    static const std::set<std::string> extensions = {".c", ".cc", ".cpp", ".cxx", ".h", ".hh", ".hpp", ".hxx",
+                                                     ".inl", ".ipp", ".tpp"};
+    static const std::set<std::string> names = {"Makefile", "makefile", "GNUmakefile", ".DS_Store"};
+    std::error_code ec;
+    for (auto it = fs::recursive_directory_iterator(directory, ec); !ec && it != fs::recursive_directory_iterator();
+         it.increment(ec)) {
+        const fs::path& path = it->path();
+        if (path.filename() == "__MACOSX" && it->is_directory()) {
+            it.disable_recursion_pending();
+            continue;
         }
+        if (it->is_directory() || names.count(path.filename().string()) || extensions.count(path.extension().string())) {
+            continue;
+        }
+        std::cout << "Submission includes \"" << jsonEscape(fs::relative(path, directory).string())
+                  << "\", so its binary is not reused" << std::endl;
+        return false;
     }
-    return nullptr;
+    return !ec;
 }
 
-void processZipFile(const std::string& zipPath, Assignment assignments[], int assignmentCount) {
-    std::cout << "Looking for zip file at: " << zipPath << std::endl;
-    if (!fs::exists(zipPath)) {
-        std::cout << "ERROR: Zip file does not exist!" << std::endl;
-        return;
+// SHA-256 of data as lowercase hex (FIPS 180-4)
+std::string sha256Hex(const std::string& data) {
+    static const uint32_t k[64] = {
+        0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+        0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+        0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+        0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+        0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+        0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+        0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+        0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2};
+    uint32_t h[8] = {0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19};
+    auto rotr = [](uint32_t x, int n) { return (x >> n) | (x << (32 - n)); };
+
+    std::string message = data;
+    uint64_t bits = static_cast<uint64_t>(data.size()) * 8;
+    message += static_cast<char>(0x80);
+    while (message.size() % 64 != 56) {
+        message += '\0';
     }
-    
-    std::string filename = fs::path(zipPath).filename().string();
-    auto [studentId, assignmentName] = parseFilename(filename);
-    
-    if (studentId == -1 || assignmentName.empty()) {
-        std::cout << "Invalid filename format: " << filename << std::endl;
-        return;
+    for (int i = 7; i >= 0; --i) {
+        message += static_cast<char>((bits >> (i * 8)) & 0xff);
     }
-    
-    Assignment* assignment = findAssignment(assignments, assignmentCount, assignmentName);
-    if (!assignment) {
-        std::cout << "Assignment " << assignmentName << " not found for student " << studentId << std::endl;
-        return;
+
+    for (size_t block = 0; block < message.size(); block += 64) {
+        uint32_t w[64];
+        for (int i = 0; i < 16; ++i) {
+            const unsigned char* p = reinterpret_cast<const unsigned char*>(message.data() + block + i * 4);
+            w[i] = (uint32_t(p[0]) << 24) | (uint32_t(p[1]) << 16) | (uint32_t(p[2]) << 8) | uint32_t(p[3]);
+        }
+        for (int i = 16; i < 64; ++i) {
+            uint32_t s0 = rotr(w[i - 15], 7) ^ rotr(w[i - 15], 18) ^ (w[i - 15] >> 3);
+            uint32_t s1 = rotr(w[i - 2], 17) ^ rotr(w[i - 2], 19) ^ (w[i - 2] >> 10);
+            w[i] = w[i - 16] + s0 + w[i - 7] + s1;
+        }
+        uint32_t a = h[0], b = h[1], c = h[2], d = h[3], e = h[4], f = h[5], g = h[6], hh = h[7];
+        for (int i = 0; i < 64; ++i) {
+            uint32_t t1 = hh + (rotr(e, 6) ^ rotr(e, 11) ^ rotr(e, 25)) + ((e & f) ^ (~e & g)) + k[i] + w[i];
+            uint32_t t2 = (rotr(a, 2) ^ rotr(a, 13) ^ rotr(a, 22)) + ((a & b) ^ (a & c) ^ (b & c));
+            hh = g; g = f; f = e; e = d + t1; d = c; c = b; b = a; a = t1 + t2;
+        }
+        h[0] += a; h[1] += b; h[2] += c; h[3] += d; h[4] += e; h[5] += f; h[6] += g; h[7] += hh;
     }
-    
-    std::string output = runInDocker(zipPath, assignmentName, studentId);
-    Date submissionDate = Date();
-    
-    if (assignment->addSubmission(studentId, output, submissionDate)) {
-        std::cout << "Added submission for student " << studentId << " to assignment " << assignmentName << std::endl;
-    } else {
-        std::cout << "Failed to add submission for student " << studentId << std::endl;
+
+    char hex[65];
+    for (int i = 0; i < 8; ++i) {
+        snprintf(hex + i * 8, 9, "%08x", h[i]);
     }
+    return std::string(hex, 64);
 }
 
-// Grade inside docker container
-std::string runInDocker(const std::string& zipPath, const std::string& assignmentName, int studentId) {
-    std::string containerName = "grader_" + std::to_string(studentId) + "_" + std::to_string(time(nullptr));
-    
-    std::string command = "docker run --rm --name " + containerName + 
-                         " --memory=128m --cpus=0.5 --network=none" +
-                         " --read-only --tmpfs /tmp:noexec,nosuid,size=50m" +
-                         " -v \"" + zipPath + ":/input.zip:ro\"" +
-                         " -v \"" + fs::current_path().parent_path().string() + "/data:/data:ro\"" +
-                         " autograder:latest ./autograding_src/main /input.zip";
-    
-    std::cout << "Running Docker command: " << command << std::endl;
-    
-    std::string tempOutputFile = "/tmp/docker_output_" + std::to_string(getpid()) + ".txt";
-    command += " > " + tempOutputFile + " 2>&1";
-    
-    int result = system(command.c_str());
-    
-    std::ifstream file(tempOutputFile);
-    std::string output, line;
-    while (std::getline(file, line)) {
-        output += line + "\n";
+// Copy a freshly built binary to exportDir/name for the web server to add to its artifact store.
+// The program's tests run after this, as a user that can still write exportDir, so the grader also
+// prints the SHA-256 of what it exported on an EXPORTED_BINARY line. The web server stores the
+// export only if it still has that digest.
+bool exportBinary(const std::string& binaryPath, const std::string& exportDir, const std::string& name) {
+    // Read once, so the digest is of exactly the bytes written
+    std::ifstream binary(binaryPath, std::ios::binary);
+    std::stringstream contents;
+    contents << binary.rdbuf();
+    if (!binary) {
+        std::cout << "Warning: could not export the binary: cannot read " << binaryPath << std::endl;
+        return false;
     }
-    file.close();
-    remove(tempOutputFile.c_str());
-    
-    if (result != 0) {
-        output += "\n[DOCKER_EXECUTION_ERROR: Exit code " + std::to_string(result) + "]";
+    std::string data = contents.str();
+
+    // Renamed into place, so a run killed mid-copy never leaves a truncated binary behind
+    std::string partial = exportDir + "/." + name + ".partial";
+    std::error_code ec;
+    fs::remove(partial, ec);
+    {
+        std::ofstream out(partial, std::ios::binary | std::ios::trunc);
+        out.write(data.data(), data.size());
+        out.close();
+        if (!out) {
+            ec = std::make_error_code(std::errc::io_error);
+        }
     }
-    
-    return output;
-}
\ No newline at end of file
+    if (!ec) {
+        fs::rename(partial, exportDir + "/" + name, ec);
+    }
+    if (ec) {
+        std::cout << "Warning: could not export the binary: " << ec.message() << std::endl;
+        return false;
+    }
+    std::cout << "Exported the binary to the artifact store" << std::endl;
+    std::cout << "EXPORTED_BINARY {\"sha256\":\"" << sha256Hex(data) << "\"}" << std::endl;
+    return true;
+}
+
+// Put a binary from the artifact store where the build would have left it: directory/name
+bool installPrebuilt(const std::string& prebuiltPath, const std::string& directory, const std::string& name) {
+    std::error_code ec;
+    fs::create_directories(directory, ec);
+    fs::copy_file(prebuiltPath, directory + "/" + name, fs::copy_options::overwrite_existing, ec);
+    if (!ec) {
+        fs::permissions(directory + "/" + name, fs::perms::owner_all, fs::perm_options::add, ec);
+    }
+    if (ec) {
+        std::cout << "Warning: could not use the stored binary, building instead: " << ec.message() << std::endl;
+        return false;
+    }
+    std::cout << "Using the stored binary for this submission; skipped unzip and make" << std::endl;
+    return true;
+}
+
+Assignment* findAssignment(Assignment assignments[], int assignmentCount, const std::string& assignmentName) {
+    for (int i = 0; i < assignmentCount; ++i) {
+        if (assignments[i].getName() == assignmentName) {
+            return &assignments[i];
+        }
+    }
+    return nullptr;
+}
+
+// Path of the SQLite database. Defaults to the Docker mount point; sandboxes that
+// run on the host (see web/grading/sandbox.py) point AUTOGRADER_DB_PATH at data/database.db.
+std::string databasePath() {
+    const char* path = getenv("AUTOGRADER_DB_PATH");
+    return (path && *path) ? path : "/data/database.db";
+}
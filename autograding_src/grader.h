@@ -8,8 +8,12 @@
 std::pair<int, std::string> parseFilename(const std::string& filename);
 bool unzipFile(const std::string& zipPath, const std::string& extractPath);
 bool compileCode(const std::string& directory);
+// Compiled binaries kept by the web server's artifact store (see web/grading/artifacts.py)
+bool onlyBuildInputs(const std::string& directory);
+std::string sha256Hex(const std::string& data);
+bool exportBinary(const std::string& binaryPath, const std::string& exportDir, const std::string& name);
+bool installPrebuilt(const std::string& prebuiltPath, const std::string& directory, const std::string& name);
 Assignment* findAssignment(Assignment assignments[], int assignmentCount, const std::string& assignmentName);
-void processZipFile(const std::string& zipPath, Assignment assignments[], int assignmentCount);
-std::string runInDocker(const std::string& zipPath, const std::string& assignmentName, int studentId);
+std::string databasePath();
 
 #endif
\ No newline at end of file
@@ -6,18 +6,33 @@ Takes student_id and assignment_id as command line arguments instead of parsing
 
 #include <iostream>
 #include <filesystem>
+#include <vector>
+#include <cstdio>
+#include <cstdlib>
+#include <fstream>
+#include <ctime>
+#include <unistd.h>
+#include <grp.h>
+#include <signal.h>
+#include <sys/resource.h>
+#include <sys/stat.h>
+#include <sys/wait.h>
+#ifdef __linux__
+#include <sys/prctl.h>
+#endif
 #include <sqlite3.h>
 #include "grader.h"
 #include "tests.h"
 #include "autograder.h"
 #include "mark.h"
+#include "outputdiff.h"
 
 namespace fs = std::filesystem;
 
 // Get autograder name from database using assignment_id
 std::string getAutograderForAssignment(const std::string& assignmentId) {
     sqlite3* db;
-    std::string dbPath = "/data/database.db";
+    std::string dbPath = databasePath();
     
     int rc = sqlite3_open(dbPath.c_str(), &db);
     if (rc) {
@@ -54,7 +69,7 @@ std::string getAutograderForAssignment(const std::string& assignmentId) {
 // Check if assignment exists in database
 bool assignmentExists(const std::string& assignmentId) {
     sqlite3* db;
-    std::string dbPath = "/data/database.db";
+    std::string dbPath = databasePath();
     
     int rc = sqlite3_open(dbPath.c_str(), &db);
     if (rc) {
@@ -86,41 +101,131 @@ bool assignmentExists(const std::string& assignmentId) {
     return exists;
 }
 
-// Load test inputs from database for this assignment
-std::string getTestInputsFromDatabase(const std::string& assignmentId) {
+// A test row for this assignment, including optional performance budgets.
+// A budget of 0 means "no limit"; budgetPoints are awarded only if every set budget is met.
+// Tests with a cached output of the assignment's reference solution are also worth points,
+// earned by matching that output.
+struct TestCase {
+    std::string testId;
+    std::string inputData;
+    long timeBudgetMs = 0;
+    long memoryBudgetKb = 0;
+    int budgetPoints = 0;
+    double timeoutSeconds = DEFAULT_TEST_TIMEOUT_SECONDS;
+    bool hasExpectedOutput = false;
+    std::string expectedOutput;
+    int points = DEFAULT_REFERENCE_POINTS;
+};
+
+// Load all tests from database for this assignment
+std::vector<TestCase> getTestsFromDatabase(const std::string& assignmentId) {
+    std::vector<TestCase> tests;
     sqlite3* db;
-    std::string dbPath = "/data/database.db";
+    std::string dbPath = databasePath();
     
     int rc = sqlite3_open(dbPath.c_str(), &db);
     if (rc) {
         std::cout << "Error: Cannot open database: " << sqlite3_errmsg(db) << std::endl;
-        return "";
+        return tests;
     }
     
-    const char* sql = "SELECT input_data FROM tests WHERE assignment_id = ?";
+    // The web server keeps reference_outputs current for the tests before grading starts
+    const char* sql = "SELECT t.test_id, t.input_data, t.time_budget_ms, t.memory_budget_kb, t.budget_points, "
+                      "t.timeout_seconds, t.points, r.output "
+                      "FROM tests t LEFT JOIN reference_outputs r ON r.test_id = t.test_id "
+                      "WHERE t.assignment_id = ? ORDER BY t.test_id";
     sqlite3_stmt* stmt;
     
     rc = sqlite3_prepare_v2(db, sql, -1, &stmt, NULL);
     if (rc != SQLITE_OK) {
         std::cout << "Error: Failed to prepare test statement: " << sqlite3_errmsg(db) << std::endl;
         sqlite3_close(db);
-        return "";
+        return tests;
     }
     
     sqlite3_bind_text(stmt, 1, assignmentId.c_str(), -1, SQLITE_STATIC);
     
-    std::string inputData = "";
+    while (sqlite3_step(stmt) == SQLITE_ROW) {
+        TestCase test;
+        const char* testId = (const char*)sqlite3_column_text(stmt, 0);
+        const char* inputData = (const char*)sqlite3_column_text(stmt, 1);
+        test.testId = testId ? testId : "";
+        test.inputData = inputData ? inputData : "";
+        test.timeBudgetMs = sqlite3_column_int64(stmt, 2);   // NULL reads as 0
+        test.memoryBudgetKb = sqlite3_column_int64(stmt, 3);
+        test.budgetPoints = sqlite3_column_int(stmt, 4);
+        if (sqlite3_column_type(stmt, 5) != SQLITE_NULL && sqlite3_column_double(stmt, 5) > 0) {
+            test.timeoutSeconds = sqlite3_column_double(stmt, 5);
+        }
+        if (sqlite3_column_type(stmt, 6) != SQLITE_NULL) {
+            test.points = sqlite3_column_int(stmt, 6);
+        }
+        if (sqlite3_column_type(stmt, 7) != SQLITE_NULL) {
+            test.hasExpectedOutput = true;
+            test.expectedOutput.assign(static_cast<const char*>(sqlite3_column_blob(stmt, 7)),
+                                       sqlite3_column_bytes(stmt, 7));
+        }
+        tests.push_back(test);
+    }
+    
+    sqlite3_finalize(stmt);
+    sqlite3_close(db);
+    
+    return tests;
+}
+
+// How outputs are compared with the reference solution's for this assignment
+struct ReferenceSettings {
+    DiffOptions options = parseDiffOptions(DEFAULT_OUTPUT_NORMALIZATION);
+    bool partialCredit = true; // points in proportion to matching lines, rather than all or nothing
+};
+
+ReferenceSettings getReferenceSettings(const std::string& assignmentId) {
+    ReferenceSettings settings;
+    sqlite3* db;
+    
+    if (sqlite3_open(databasePath().c_str(), &db)) {
+        std::cout << "Error: Cannot open database: " << sqlite3_errmsg(db) << std::endl;
+        return settings;
+    }
+    
+    const char* sql = "SELECT output_normalization, partial_credit FROM assignments WHERE assignment_id = ?";
+    sqlite3_stmt* stmt;
+    if (sqlite3_prepare_v2(db, sql, -1, &stmt, NULL) != SQLITE_OK) {
+        std::cout << "Error: Failed to prepare reference settings statement: " << sqlite3_errmsg(db) << std::endl;
+        sqlite3_close(db);
+        return settings;
+    }
+    
+    sqlite3_bind_text(stmt, 1, assignmentId.c_str(), -1, SQLITE_STATIC);
     if (sqlite3_step(stmt) == SQLITE_ROW) {
-        const char* result = (const char*)sqlite3_column_text(stmt, 0);
-        if (result) {
-            inputData = result;
+        const char* normalization = (const char*)sqlite3_column_text(stmt, 0);
+        if (normalization) {
+            settings.options = parseDiffOptions(normalization);
+        }
+        if (sqlite3_column_type(stmt, 1) != SQLITE_NULL) {
+            settings.partialCredit = sqlite3_column_int(stmt, 1) != 0;
         }
     }
     
     sqlite3_finalize(stmt);
     sqlite3_close(db);
     
-    return inputData;
+    return settings;
+}
+
+// A test earns its budget points if it ran successfully within every budget it declares
+bool withinBudget(const TestCase& test, const TestRunResult& run) {
+    if (run.status != "OK") {
+        return false;
+    }
+    if (test.timeBudgetMs > 0 && run.userCpuMs + run.sysCpuMs > test.timeBudgetMs) {
+        return false;
+    }
+    if (test.memoryBudgetKb > 0 && run.maxRssKb > test.memoryBudgetKb) {
+        return false;
+    }
+    return true;
 }
 
 // Parse JSON input data and create input string
@@ -159,75 +264,459 @@ std::string parseInputsFromJSON(const std::string& jsonData) {
     return inputs;
 }
 
-int main(int argc, char* argv[]) {
-    if (argc != 4) {
-        std::cout << "Usage: " << argv[0] << " <zip_file_path> <student_id> <assignment_id>" << std::endl;
+// Progress line read by the web server while the autograder runs (stage updates pushed to the browser)
+void reportProgress(const std::string& fields) {
+    std::cout << "PROGRESS {" << fields << "}" << std::endl;
+}
+
+// Extract, compile, run and grade one submission, printing the per-test results and the final
+// JSON record. Tests and the autograder are loaded once by the caller so batches share them.
+// With prebuiltPath (a binary the artifact store kept from an earlier build of the same zip),
+// extraction and compilation are skipped. Otherwise, with exportDir, a freshly built binary is
+// copied there for the store, provided the submission holds nothing but build inputs.
+int gradeSubmission(const std::string& zipPath, const std::string& studentId, const std::string& assignmentId,
+                    const std::vector<TestCase>& tests, Autograder& autograder, const ReferenceSettings& reference,
+                    const std::string& extractDir, const std::string& prebuiltPath = "",
+                    const std::string& exportDir = "") {
+    bool prebuilt = !prebuiltPath.empty() && fs::exists(prebuiltPath) &&
+                    installPrebuilt(prebuiltPath, extractDir, assignmentId);
+    if (!prebuilt) {
+        fs::create_directories(extractDir);
+        
+        // Extract the submission
+        if (!unzipFile(zipPath, extractDir)) {
+            std::cout << "Error: Failed to extract zip file" << std::endl;
+            return 1;
+        }
+        bool exportable = !exportDir.empty() && onlyBuildInputs(extractDir);
+        
+        // Compile the code
+        reportProgress("\"stage\":\"compiling\"");
+        if (!compileCode(extractDir)) {
+            std::cout << "Error: Compilation failed" << std::endl;
+            return 1;
+        }
+        std::string binaryPath = extractDir + "/" + assignmentId;
+        if (exportable && fs::is_regular_file(binaryPath)) {
+            exportBinary(binaryPath, exportDir, assignmentId);
+        }
+    }
+    
+    // Run the compiled program once per test defined for this assignment
+    std::vector<TestRunResult> runs;
+    std::string testOutput;
+    if (tests.empty()) {
+        std::cout << "No test inputs found for assignment: " << assignmentId << std::endl;
+        testOutput = "NO_TEST_DEFINED";
+    }
+    for (size_t i = 0; i < tests.size(); ++i) {
+        reportProgress("\"stage\":\"running\",\"test\":" + std::to_string(i + 1) + ",\"total\":" +
+                       std::to_string(tests.size()) + ",\"test_id\":\"" + jsonEscape(tests[i].testId) + "\"");
+        std::cout << "Running test " << (i + 1) << "/" << tests.size() << ": " << tests[i].testId << std::endl;
+        TestRunResult run = runProgramMeasured(extractDir, assignmentId, parseInputsFromJSON(tests[i].inputData),
+                                               tests[i].timeoutSeconds);
+        if (run.status == "TIMEOUT") {
+            // A timed-out test scores nothing, even if it printed expected output before being killed
+            std::cout << "Test " << tests[i].testId << " timed out after " << tests[i].timeoutSeconds << "s" << std::endl;
+            testOutput += "[PROGRAM_TIMEOUT: " + tests[i].testId + "]\n";
+        } else {
+            testOutput += run.output;
+        }
+        runs.push_back(run);
+    }
+    
+    // Grade the output
+    Mark mark;
+    autograder.grade(testOutput, mark);
+    
+    // Outputs of tests with a reference output are diffed against it, line by line
+    int referenceScore = 0;
+    int referenceTotal = 0;
+    std::vector<int> referenceEarned(tests.size(), 0);
+    std::vector<LineDiff> diffs(tests.size());
+    for (size_t i = 0; i < tests.size(); ++i) {
+        if (!tests[i].hasExpectedOutput) {
+            continue;
+        }
+        referenceTotal += tests[i].points;
+        if (runs[i].status == "TIMEOUT" || runs[i].status == "NOT_RUN") {
+            std::cout << "Reference test " << tests[i].testId << ": not scored (" << runs[i].status << ")" << std::endl;
+            continue;
+        }
+        diffs[i] = diffLines(tests[i].expectedOutput, runs[i].output, reference.options);
+        if (diffs[i].identical()) {
+            referenceEarned[i] = tests[i].points;
+        } else if (reference.partialCredit) {
+            referenceEarned[i] = static_cast<int>(tests[i].points * diffs[i].ratio());
+        }
+        referenceScore += referenceEarned[i];
+        std::cout << "Reference test " << tests[i].testId << ": " << diffs[i].matchingLines << "/"
+                  << std::max(diffs[i].expectedLines, diffs[i].actualLines) << " lines match, "
+                  << referenceEarned[i] << "/" << tests[i].points << " points" << std::endl;
+        if (!diffs[i].identical()) {
+            std::cout << "  first difference at line " << (diffs[i].firstMismatch + 1) << ": expected \""
+                      << jsonEscape(diffs[i].expectedLine) << "\", got \"" << jsonEscape(diffs[i].actualLine) << "\""
+                      << std::endl;
+        }
+    }
+    if (referenceTotal > 0) {
+        mark.setMark(mark.getMark() + referenceScore, mark.getOutOf() + referenceTotal);
+        std::cout << "Reference outputs: " << referenceScore << "/" << referenceTotal << std::endl;
+    }
+    
+    // Performance budgets are scored on top of the output matching
+    int budgetScore = 0;
+    int budgetTotal = 0;
+    for (size_t i = 0; i < tests.size(); ++i) {
+        int earned = 0;
+        if (tests[i].budgetPoints > 0) {
+            budgetTotal += tests[i].budgetPoints;
+            if (withinBudget(tests[i], runs[i])) {
+                earned = tests[i].budgetPoints;
+                budgetScore += earned;
+            }
+        }
+        
+        std::cout << "{\"test_result\":{"
+                  << "\"test_id\":\"" << jsonEscape(tests[i].testId) << "\","
+                  << "\"status\":\"" << runs[i].status << "\","
+                  << "\"exit_code\":" << runs[i].exitCode << ","
+                  << "\"wall_ms\":" << runs[i].wallMs << ","
+                  << "\"user_cpu_ms\":" << runs[i].userCpuMs << ","
+                  << "\"sys_cpu_ms\":" << runs[i].sysCpuMs << ","
+                  << "\"max_rss_kb\":" << runs[i].maxRssKb << ","
+                  << "\"budget_points\":" << earned << ","
+                  << "\"budget_out_of\":" << tests[i].budgetPoints << ","
+                  << "\"reference_points\":" << referenceEarned[i] << ","
+                  << "\"reference_out_of\":" << (tests[i].hasExpectedOutput ? tests[i].points : 0)
+                  << "}}" << std::endl;
+    }
+    if (budgetTotal > 0) {
+        mark.setMark(mark.getMark() + budgetScore, mark.getOutOf() + budgetTotal);
+        std::cout << "Performance budgets: " << budgetScore << "/" << budgetTotal << std::endl;
+    }
+    
+    // Output results in JSON format for web app to parse
+    std::cout << "{"
+              << "\"student_id\":\"" << jsonEscape(studentId) << "\","
+              << "\"assignment_id\":\"" << jsonEscape(assignmentId) << "\","
+              << "\"score\":" << mark.getMark() << ","
+              << "\"total\":" << mark.getOutOf() << ","
+              << "\"output\":\"" << jsonEscape(testOutput) << "\""
+              << "}" << std::endl;
+    
+    return 0;
+}
+
+// Read an environment variable holding a non-negative number, or fallback if unset
+long envNumber(const char* name, long fallback) {
+    const char* value = getenv(name);
+    return (value && *value) ? strtol(value, nullptr, 10) : fallback;
+}
+
+struct BatchItem {
+    std::string studentId;
+    std::string zipPath;
+    std::string prebuiltPath;  // optional binary from the artifact store
+};
+
+// Manifest lines are "<student_id>\t<zip_path>[\t<prebuilt_binary_path>]"
+std::vector<BatchItem> readManifest(const std::string& manifestPath) {
+    std::vector<BatchItem> items;
+    std::ifstream manifest(manifestPath);
+    std::string line;
+    while (std::getline(manifest, line)) {
+        size_t tab = line.find('\t');
+        if (tab == std::string::npos || tab == 0) {
+            continue;
+        }
+        std::string zipPath = line.substr(tab + 1);
+        std::string prebuiltPath;
+        size_t second = zipPath.find('\t');
+        if (second != std::string::npos) {
+            prebuiltPath = zipPath.substr(second + 1);
+            zipPath.erase(second);
+        }
+        items.push_back({line.substr(0, tab), zipPath, prebuiltPath});
+    }
+    return items;
+}
+
+// Give a finished submission's export directory to whoever owns the export root (the web server's
+// user), so later submissions in the batch can't change it and the server can clean it up
+void handBackExport(const std::string& exportDir, const std::string& root) {
+    struct stat owner;
+    if (stat(root.c_str(), &owner) != 0) {
+        return;
+    }
+    std::error_code ec;
+    for (const auto& entry : fs::directory_iterator(exportDir, ec)) {
+        if (lchown(entry.path().c_str(), owner.st_uid, owner.st_gid) != 0) {
+            // Can't take it back; make sure the server never stores it
+            fs::remove_all(entry.path(), ec);
+        }
+    }
+    if (chown(exportDir.c_str(), owner.st_uid, owner.st_gid) != 0) {
+        fs::remove_all(exportDir, ec);
+    }
+}
+
+// Environment variable holding a path, or "" if unset
+std::string envPath(const char* name) {
+    const char* value = getenv(name);
+    return value ? value : "";
+}
+
+// The batch's marker nonce: the first line of the file AUTOGRADER_BATCH_NONCE_FILE names
+std::string readBatchNonce() {
+    std::ifstream file(envPath("AUTOGRADER_BATCH_NONCE_FILE"));
+    std::string nonce;
+    std::getline(file, nonce);
+    return nonce;
+}
+
+// Batch mode: grade every submission in the manifest for one assignment, reusing the tests and
+// autograder loaded here. Each submission is graded by its own child process, in its own
+// extraction directory and process group, with its own time limit. When started as root with
+// AUTOGRADER_BATCH_UID_BASE set, the child also switches to a dedicated UID (base + index)
+// before touching the submission. Results are delimited by BATCH_ITEM_BEGIN/BATCH_ITEM_END lines
+// carrying the batch's nonce. Submissions can write to stdout too, but can't read the nonce (the
+// web server keeps it in a file only root can read), so they can't forge a marker.
+int runBatch(const std::string& manifestPath, const std::string& assignmentId) {
+    std::string nonce = readBatchNonce();
+    if (nonce.empty()) {
+        std::cout << "Error: No batch nonce in AUTOGRADER_BATCH_NONCE_FILE" << std::endl;
         return 1;
     }
+    std::vector<BatchItem> items = readManifest(manifestPath);
+    std::cout << "Batch: " << items.size() << " submission(s) for assignment " << assignmentId << std::endl;
     
-    std::string zipPath = argv[1];      // /input.zip
-    std::string studentId = argv[2];    // e.g., "101038853"
-    std::string assignmentId = argv[3]; // e.g., "Assignment_2"
+    if (!assignmentExists(assignmentId)) {
+        std::cout << "Error: Assignment not found: " << assignmentId << std::endl;
+        return 1;
+    }
+    std::string autograderName = getAutograderForAssignment(assignmentId);
+    if (autograderName.empty()) {
+        std::cout << "Error: No autograder found for assignment: " << assignmentId << std::endl;
+        return 1;
+    }
+    std::vector<TestCase> tests = getTestsFromDatabase(assignmentId);
+    Autograder autograder(autograderName);
+    ReferenceSettings reference = getReferenceSettings(assignmentId);
     
-    std::cout << "Processing submission: Student " << studentId << ", Assignment " << assignmentId << std::endl;
+    long uidBase = envNumber("AUTOGRADER_BATCH_UID_BASE", 0);
+    bool switchUsers = uidBase > 0 && geteuid() == 0;
+    if (uidBase > 0 && !switchUsers) {
+        std::cout << "Warning: not running as root, submissions share the grader's UID" << std::endl;
+    }
+    long itemTimeout = envNumber("AUTOGRADER_ITEM_TIMEOUT", 60);
+    // Built binaries are exported to <AUTOGRADER_ARTIFACT_OUT>/<index>/
+    std::string artifactOut = envPath("AUTOGRADER_ARTIFACT_OUT");
+    
+    for (size_t i = 0; i < items.size(); ++i) {
+        const BatchItem& item = items[i];
+        std::string extractDir = "/tmp/student_" + item.studentId + "_" + std::to_string(i);
+        std::string zipPath = item.zipPath;
+        std::string prebuiltPath = item.prebuiltPath;
+        std::string exportDir = artifactOut.empty() ? "" : artifactOut + "/" + std::to_string(i);
+        uid_t uid = static_cast<uid_t>(uidBase + i);
+        if (!exportDir.empty()) {
+            // Only the submission's own UID may write its export, while its item runs
+            std::error_code ec;
+            fs::create_directories(exportDir, ec);
+            if (switchUsers) {
+                fs::permissions(exportDir, fs::perms::owner_all, ec);
+                if (!ec && chown(exportDir.c_str(), uid, uid) != 0) {
+                    ec = std::make_error_code(std::errc::operation_not_permitted);
+                }
+            }
+            if (ec) {
+                exportDir.clear();
+            }
+        }
+        
+        std::cout << "BATCH_ITEM_BEGIN " << nonce << " {\"index\":" << i << ",\"student_id\":\"" << jsonEscape(item.studentId) << "\"}" << std::endl;
+        
+        if (switchUsers) {
+            // Give the submission's UID its own copy of the zip and directory; nothing else is readable to it
+            fs::create_directories(extractDir);
+            zipPath = extractDir + ".zip";
+            std::error_code ec;
+            fs::copy_file(item.zipPath, zipPath, fs::copy_options::overwrite_existing, ec);
+            if (ec || chown(extractDir.c_str(), uid, uid) != 0 || chown(zipPath.c_str(), uid, uid) != 0) {
+                std::cout << "Error: Failed to prepare submission directory" << std::endl;
+            }
+            if (!prebuiltPath.empty()) {
+                std::string copy = extractDir + ".bin";
+                fs::remove(copy, ec);
+                fs::copy_file(prebuiltPath, copy, fs::copy_options::overwrite_existing, ec);
+                prebuiltPath = (ec || chown(copy.c_str(), uid, uid) != 0) ? "" : copy;
+            }
+        }
+        
+        std::cout.flush();
+        pid_t pid = fork();
+        if (pid == 0) {
+            setpgid(0, 0);
+            if (switchUsers && (setgroups(0, nullptr) != 0 || setgid(uid) != 0 || setuid(uid) != 0)) {
+                std::cout << "Error: Failed to switch to UID " << uid << std::endl;
+                _exit(1);
+            }
+            // Switching UIDs may reset this; the submission's UID must not trace its own grader
+            prctl(PR_SET_DUMPABLE, 0, 0, 0, 0);
+            struct rlimit cpu = {static_cast<rlim_t>(itemTimeout), static_cast<rlim_t>(itemTimeout)};
+            setrlimit(RLIMIT_CPU, &cpu);
+            if (switchUsers) {
+                // Per-UID process limit; only meaningful once the submission has a UID to itself
+                struct rlimit processes = {64, 64};
+                setrlimit(RLIMIT_NPROC, &processes);
+            }
+            int code = gradeSubmission(zipPath, item.studentId, assignmentId, tests, autograder, reference, extractDir,
+                                       prebuiltPath, exportDir);
+            std::cout.flush();
+            _exit(code);
+        }
+        
+        int status = 0;
+        bool timedOut = false;
+        if (pid < 0) {
+            std::cout << "Error: fork failed" << std::endl;
+        } else {
+            setpgid(pid, pid);
+            timedOut = waitWithDeadline(pid, itemTimeout, &status, nullptr);
+        }
+        // Leftover processes (e.g. a test program orphaned by a kill, which has its own process
+        // group) must not outlive the item. With a dedicated UID, kill everything that UID owns.
+        if (pid > 0) {
+            killpg(pid, SIGKILL);
+        }
+        if (switchUsers) {
+            pid_t reaper = fork();
+            if (reaper == 0) {
+                if (setuid(uid) == 0) {
+                    kill(-1, SIGKILL);
+                }
+                _exit(0);
+            }
+            if (reaper > 0) {
+                waitpid(reaper, nullptr, 0);
+            }
+        }
+        
+        int exitCode = pid < 0 ? 1 : WIFEXITED(status) ? WEXITSTATUS(status) : 128 + WTERMSIG(status);
+        std::cout << "BATCH_ITEM_END " << nonce << " {\"index\":" << i << ",\"student_id\":\"" << jsonEscape(item.studentId)
+                  << "\",\"exit_code\":" << exitCode << ",\"timed_out\":" << (timedOut ? "true" : "false") << "}" << std::endl;
+        
+        std::error_code ec;
+        fs::remove_all(extractDir, ec);
+        fs::remove_all(extractDir + ".pch", ec);
+        fs::remove_all(extractDir + ".orig", ec);
+        if (switchUsers) {
+            fs::remove(zipPath, ec);
+            fs::remove(extractDir + ".bin", ec);
+            if (!exportDir.empty()) {
+                handBackExport(exportDir, artifactOut);
+            }
+        }
+    }
     
-    // Check if assignment exists in database
+    return 0;
+}
+
+// Reference mode: compile the assignment's reference solution and print its output for each test
+// as a REFERENCE_OUTPUT line, which the web server caches as the tests' expected output.
+// AUTOGRADER_REFERENCE_TESTS (test ids, one per line) limits the run to the tests that changed.
+int runReference(const std::string& zipPath, const std::string& assignmentId) {
     if (!assignmentExists(assignmentId)) {
         std::cout << "Error: Assignment not found: " << assignmentId << std::endl;
         return 1;
     }
     
-    std::cout << "Assignment found: " << assignmentId << std::endl;
+    std::vector<TestCase> tests = getTestsFromDatabase(assignmentId);
+    const char* only = getenv("AUTOGRADER_REFERENCE_TESTS");
+    if (only && *only) {
+        std::string wanted = std::string("\n") + only + "\n";
+        std::vector<TestCase> selected;
+        for (const TestCase& test : tests) {
+            if (wanted.find("\n" + test.testId + "\n") != std::string::npos) {
+                selected.push_back(test);
+            }
+        }
+        tests = selected;
+    }
+    std::cout << "Reference: " << tests.size() << " test(s) for assignment " << assignmentId << std::endl;
     
-    // Create temporary directory for extraction
-    std::string extractDir = "/tmp/student_" + studentId;
+    std::string extractDir = "/tmp/reference_" + std::to_string(getpid());
     fs::create_directories(extractDir);
-    
-    // Extract the submission
     if (!unzipFile(zipPath, extractDir)) {
-        std::cout << "Error: Failed to extract zip file" << std::endl;
+        std::cout << "Error: Failed to extract reference solution" << std::endl;
         return 1;
     }
-    
-    // Compile the code
     if (!compileCode(extractDir)) {
-        std::cout << "Error: Compilation failed" << std::endl;
+        std::cout << "Error: Reference solution failed to compile" << std::endl;
         return 1;
     }
     
-    // Get test inputs from database
-    std::string testInputsJSON = getTestInputsFromDatabase(assignmentId);
-    std::string testInputs = parseInputsFromJSON(testInputsJSON);
+    for (const TestCase& test : tests) {
+        TestRunResult run = runProgramMeasured(extractDir, assignmentId, parseInputsFromJSON(test.inputData),
+                                               test.timeoutSeconds);
+        std::cout << "REFERENCE_OUTPUT {"
+                  << "\"test_id\":\"" << jsonEscape(test.testId) << "\","
+                  << "\"status\":\"" << run.status << "\","
+                  << "\"exit_code\":" << run.exitCode << ","
+                  << "\"output\":\"" << jsonEscape(run.output) << "\""
+                  << "}" << std::endl;
+    }
     
-    // Run the compiled program with test inputs
-    std::string testOutput;
-    if (!testInputs.empty()) {
-        std::cout << "Running test with inputs from database" << std::endl;
-        testOutput = runProgram(extractDir, assignmentId, testInputs);
-    } else {
-        std::cout << "No test inputs found for assignment: " << assignmentId << std::endl;
-        testOutput = "NO_TEST_DEFINED";
+    std::error_code ec;
+    fs::remove_all(extractDir, ec);
+    return 0;
+}
+
+int main(int argc, char* argv[]) {
+#ifdef __linux__
+    // Programs the grader runs share its UID; they must not open its stdout or read its memory via /proc
+    prctl(PR_SET_DUMPABLE, 0, 0, 0, 0);
+#endif
+    if (argc == 4 && std::string(argv[1]) == "--batch") {
+        return runBatch(argv[2], argv[3]);
+    }
+    if (argc == 4 && std::string(argv[1]) == "--reference") {
+        return runReference(argv[2], argv[3]);
+    }
+    if (argc != 4) {
+        std::cout << "Usage: " << argv[0] << " <zip_file_path> <student_id> <assignment_id>" << std::endl;
+        std::cout << "       " << argv[0] << " --batch <manifest_path> <assignment_id>" << std::endl;
+        std::cout << "       " << argv[0] << " --reference <zip_file_path> <assignment_id>" << std::endl;
+        return 1;
     }
     
-    // Grade the output
+    std::string zipPath = argv[1];      // /input.zip
+    std::string studentId = argv[2];    // e.g., "101038853"
+    std::string assignmentId = argv[3]; // e.g., "Assignment_2"
+    
+    std::cout << "Processing submission: Student " << studentId << ", Assignment " << assignmentId << std::endl;
+    
+    // Check if assignment exists in database
+    if (!assignmentExists(assignmentId)) {
+        std::cout << "Error: Assignment not found: " << assignmentId << std::endl;
+        return 1;
+    }
+    
+    std::cout << "Assignment found: " << assignmentId << std::endl;
+    
     std::string autograderName = getAutograderForAssignment(assignmentId);
     if (autograderName.empty()) {
         std::cout << "Error: No autograder found for assignment: " << assignmentId << std::endl;
         return 1;
     }
     
+    std::vector<TestCase> tests = getTestsFromDatabase(assignmentId);
     Autograder autograder(autograderName);
-    Mark mark;
-    autograder.grade(testOutput, mark);
-    
-    // Output results in JSON format for web app to parse
-    std::cout << "{"
-              << "\"student_id\":\"" << studentId << "\","
-              << "\"assignment_id\":\"" << assignmentId << "\","
-              << "\"score\":" << mark.getMark() << ","
-              << "\"total\":" << mark.getOutOf() << ","
-              << "\"output\":\"" << testOutput << "\""
-              << "}" << std::endl;
+    ReferenceSettings reference = getReferenceSettings(assignmentId);
     
-    return 0;
-}
\ No newline at end of file
+    // Create temporary directory for extraction. The web server passes a stored binary for this zip
+    // in AUTOGRADER_ARTIFACT_IN, and a directory to export a newly built one to in AUTOGRADER_ARTIFACT_OUT.
+    return gradeSubmission(zipPath, studentId, assignmentId, tests, autograder, reference, "/tmp/student_" + studentId,
+                           envPath("AUTOGRADER_ARTIFACT_IN"), envPath("AUTOGRADER_ARTIFACT_OUT"));
+}
@@ -0,0 +1,178 @@
+/*
+Line-based comparison of a program's output with the expected output of the reference solution.
+Both outputs are normalized, lines are interned to integers, and the longest common subsequence of
+lines is found with Myers' diff algorithm, which is fast when the outputs are similar.
+*/
+
+#include "outputdiff.h"
+#include <algorithm>
+#include <cctype>
+#include <iostream>
+#include <sstream>
+#include <unordered_map>
+
+// Upper bound on the diagonal steps one diff may take, so a huge, completely different output
+// can't stall the grader
+static const size_t MAX_DIFF_WORK = 50000000;
+
+DiffOptions parseDiffOptions(const std::string& spec) {
+    DiffOptions options;
+    std::stringstream stream(spec);
+    std::string name;
+    while (std::getline(stream, name, ',')) {
+        name.erase(0, name.find_first_not_of(" \t"));
+        name.erase(name.find_last_not_of(" \t") + 1);
+        if (name == "trailing_whitespace") {
+            options.trailingWhitespace = true;
+        } else if (name == "whitespace") {
+            options.whitespace = true;
+        } else if (name == "case") {
+            options.ignoreCase = true;
+        } else if (name == "blank_lines") {
+            options.blankLines = true;
+        } else if (!name.empty()) {
+            std::cout << "Warning: unknown output normalization '" << name << "'" << std::endl;
+        }
+    }
+    return options;
+}
+
+static std::string normalizeLine(const std::string& line, const DiffOptions& options) {
+    std::string result;
+    if (options.whitespace) {
+        bool pendingSpace = false;
+        for (char c : line) {
+            if (std::isspace(static_cast<unsigned char>(c))) {
+                pendingSpace = !result.empty();
+            } else {
+                if (pendingSpace) {
+                    result += ' ';
+                    pendingSpace = false;
+                }
+                result += c;
+            }
+        }
+    } else {
+        result = line;
+        if (!result.empty() && result.back() == '\r') {
+            result.pop_back();
+        }
+        if (options.trailingWhitespace) {
+            size_t end = result.find_last_not_of(" \t\r\f\v");
+            result.erase(end == std::string::npos ? 0 : end + 1);
+        }
+    }
+    if (options.ignoreCase) {
+        for (char& c : result) {
+            c = static_cast<char>(std::tolower(static_cast<unsigned char>(c)));
+        }
+    }
+    return result;
+}
+
+std::vector<std::string> normalizeLines(const std::string& text, const DiffOptions& options) {
+    std::vector<std::string> lines;
+    std::stringstream stream(text);
+    std::string line;
+    while (std::getline(stream, line)) {
+        line = normalizeLine(line, options);
+        if (!(options.blankLines && line.empty())) {
+            lines.push_back(line);
+        }
+    }
+    return lines;
+}
+
+double LineDiff::ratio() const {
+    size_t longest = std::max(expectedLines, actualLines);
+    return longest == 0 ? 1.0 : static_cast<double>(matchingLines) / longest;
+}
+
+// Length of the longest common subsequence of a and b, which share no common prefix or suffix
+static size_t commonSubsequence(const std::vector<int>& a, const std::vector<int>& b) {
+    long n = a.size(), m = b.size();
+    if (n == 0 || m == 0) {
+        return 0;
+    }
+    long maxD = std::min<long>(n + m, MAX_DIFF_WORK / (n + m) + 1);
+    // v[k + offset] is the furthest x reached on diagonal k = x - y
+    long offset = maxD + 1;
+    std::vector<long> v(2 * offset + 1, 0);
+    for (long d = 0; d <= maxD; ++d) {
+        for (long k = -d; k <= d; k += 2) {
+            long x = (k == -d || (k != d && v[offset + k - 1] < v[offset + k + 1]))
+                         ? v[offset + k + 1] : v[offset + k - 1] + 1;
+            long y = x - k;
+            while (x < n && y < m && a[x] == b[y]) {
+                ++x;
+                ++y;
+            }
+            v[offset + k] = x;
+            if (x >= n && y >= m) {
+                return (n + m - d) / 2;
+            }
+        }
+    }
+
+    // Gave up: more than maxD edits are needed, which bounds the subsequence from above, and so
+    // does the number of lines the outputs have in common regardless of order
+    std::unordered_map<int, long> counts;
+    for (int line : a) {
+        ++counts[line];
+    }
+    long shared = 0;
+    for (int line : b) {
+        auto it = counts.find(line);
+        if (it != counts.end() && it->second > 0) {
+            --it->second;
+            ++shared;
+        }
+    }
+    return std::min(shared, (n + m - maxD - 1) / 2);
+}
+
+LineDiff diffLines(const std::string& expected, const std::string& actual, const DiffOptions& options) {
+    std::vector<std::string> expectedLines = normalizeLines(expected, options);
+    std::vector<std::string> actualLines = normalizeLines(actual, options);
+
+    LineDiff diff;
+    diff.expectedLines = expectedLines.size();
+    diff.actualLines = actualLines.size();
+
+    // Matching lines are compared as integers from here on
+    std::unordered_map<std::string, int> ids;
+    auto intern = [&ids](const std::vector<std::string>& lines) {
+        std::vector<int> result;
+        result.reserve(lines.size());
+        for (const std::string& line : lines) {
+            result.push_back(ids.emplace(line, static_cast<int>(ids.size())).first->second);
+        }
+        return result;
+    };
+    std::vector<int> a = intern(expectedLines);
+    std::vector<int> b = intern(actualLines);
+
+    // Outputs usually agree for long stretches at the start and end; only the middle needs diffing
+    size_t prefix = 0;
+    while (prefix < a.size() && prefix < b.size() && a[prefix] == b[prefix]) {
+        ++prefix;
+    }
+    size_t suffix = 0;
+    while (suffix < a.size() - prefix && suffix < b.size() - prefix &&
+           a[a.size() - 1 - suffix] == b[b.size() - 1 - suffix]) {
+        ++suffix;
+    }
+
+    if (prefix == a.size() && prefix == b.size()) {
+        diff.matchingLines = a.size();
+        return diff;
+    }
+    diff.firstMismatch = static_cast<long>(prefix);
+    diff.expectedLine = prefix < expectedLines.size() ? expectedLines[prefix] : "";
+    diff.actualLine = prefix < actualLines.size() ? actualLines[prefix] : "";
+
+    std::vector<int> middleA(a.begin() + prefix, a.end() - suffix);
+    std::vector<int> middleB(b.begin() + prefix, b.end() - suffix);
+    diff.matchingLines = prefix + suffix + commonSubsequence(middleA, middleB);
+    return diff;
+}
@@ -0,0 +1,44 @@
+#ifndef OUTPUTDIFF_H
+#define OUTPUTDIFF_H
+
+#include <string>
+#include <vector>
+
+// Used for tests without their own points when grading against a reference solution
+const int DEFAULT_REFERENCE_POINTS = 10;
+
+// How outputs are normalized before comparing them line by line.
+// Parsed from a comma-separated list such as "trailing_whitespace,blank_lines".
+struct DiffOptions {
+    bool trailingWhitespace = false; // ignore whitespace at the end of each line
+    bool whitespace = false;         // ignore leading whitespace and treat runs of whitespace as one space
+    bool ignoreCase = false;
+    bool blankLines = false;         // ignore empty lines
+};
+
+// Used for assignments without their own output_normalization
+const char* const DEFAULT_OUTPUT_NORMALIZATION = "trailing_whitespace,blank_lines";
+
+DiffOptions parseDiffOptions(const std::string& spec);
+
+std::vector<std::string> normalizeLines(const std::string& text, const DiffOptions& options);
+
+// Result of comparing a program's output with the expected output, line by line
+struct LineDiff {
+    size_t expectedLines = 0;
+    size_t actualLines = 0;
+    size_t matchingLines = 0;  // length of the longest common subsequence of lines
+    long firstMismatch = -1;   // index of the first differing line, -1 if the outputs match
+    std::string expectedLine;  // the lines at firstMismatch ("" past the end)
+    std::string actualLine;
+
+    bool identical() const { return firstMismatch < 0; }
+    // Matching lines over the longer output, so both missing and extra lines cost credit
+    double ratio() const;
+};
+
+// Myers' O((N+M)D) diff over interned lines. Outputs too different to diff within a bounded
+// amount of work get an upper bound on the matching lines instead of the exact count.
+LineDiff diffLines(const std::string& expected, const std::string& actual, const DiffOptions& options);
+
+#endif
@@ -0,0 +1,61 @@
+#!/bin/sh
+# Compile-time benchmark for the precompiled standard headers.
+# Builds the sample assignments from config.txt (Assignment_1: greeting, Assignment_2: sum and
+# product) with their Makefiles, RUNS times each, with and without the PCH wrappers on PATH.
+# Usage: bench.sh [pch_dir] [runs]. Without an existing pch_dir, one is built in a temp directory.
+set -e
+
+PCH_DIR=${1:-/opt/pch}
+RUNS=${2:-10}
+WORK=$(mktemp -d)
+trap 'rm -rf "$WORK"' EXIT
+
+if [ ! -x "$PCH_DIR/bin/g++" ]; then
+    PCH_DIR="$WORK/pch"
+    PCH_DIR="$PCH_DIR" sh "$(dirname "$0")/build_pch.sh" > /dev/null
+fi
+
+mkdir -p "$WORK/Assignment_1" "$WORK/Assignment_2"
+cat > "$WORK/Assignment_1/main.cpp" <<'SRC'
+#include <iostream>
+#include <string>
+int main() {
+    std::string name;
+    std::getline(std::cin, name);
+    std::cout << "Hello " << name << "!" << std::endl;
+}
+SRC
+cat > "$WORK/Assignment_2/main.cpp" <<'SRC'
+#include <iostream>
+int main() {
+    int a, b;
+    std::cout << "Enter two integers: ";
+    std::cin >> a >> b;
+    std::cout << a + b << std::endl << a * b << std::endl;
+}
+SRC
+for assignment in Assignment_1 Assignment_2; do
+    printf '%s: main.cpp\n\tg++ -std=c++17 -Wall -o %s main.cpp\n' "$assignment" "$assignment" > "$WORK/$assignment/Makefile"
+done
+
+now_ms() {
+    echo $(( $(date +%s%N) / 1000000 ))
+}
+
+# Average milliseconds per `make` of an assignment; $2 is prepended to PATH
+bench() {
+    start=$(now_ms)
+    i=0
+    while [ $i -lt "$RUNS" ]; do
+        (cd "$WORK/$1" && PATH="$2$PATH" make -B -s > /dev/null)
+        i=$((i + 1))
+    done
+    echo $(( ($(now_ms) - start) / RUNS ))
+}
+
+echo "Average compile time over $RUNS runs (PCH: $PCH_DIR)"
+for assignment in Assignment_1 Assignment_2; do
+    plain=$(bench "$assignment" "")
+    pch=$(bench "$assignment" "$PCH_DIR/bin:")
+    echo "$assignment: ${plain} ms without PCH, ${pch} ms with PCH"
+done
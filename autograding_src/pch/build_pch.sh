@@ -0,0 +1,44 @@
+#!/bin/sh
+# Builds precompiled standard headers for the grading image (see dockerfile).
+# $PCH_DIR/stdpch.h includes each header of $PCH_HEADERS that the toolchain has, and
+# $PCH_DIR/stdpch.h.gch/ holds one precompiled variant per -std in $PCH_STANDARDS and set of
+# flags in $PCH_FLAGS ("|"-separated). Whether optimization is on must match the compile's; a
+# variant built with -g also serves compiles without it. g++ uses the first variant that
+# matches, and parses stdpch.h as plain text when none does, so any flags still work.
+# Each variant takes about 60 MB.
+# $PCH_DIR/bin has g++/c++ wrappers that force-include stdpch.h; the autograder puts them
+# first on PATH when it runs a submission's Makefile (compileCode in grader.cpp).
+set -e
+
+PCH_DIR=${PCH_DIR:-/opt/pch}
+PCH_HEADERS=${PCH_HEADERS:-"iostream string vector map unordered_map set algorithm cmath iomanip sstream fstream memory"}
+PCH_STANDARDS=${PCH_STANDARDS:-"gnu++17 c++17 c++20"}
+PCH_FLAGS=${PCH_FLAGS:-"-O0 -g|-O2 -g"}
+REAL_CXX=$(command -v "${CXX:-g++}")
+
+mkdir -p "$PCH_DIR/stdpch.h.gch" "$PCH_DIR/bin"
+
+{
+    echo "// Generated by build_pch.sh: standard headers precompiled for student code"
+    for header in $PCH_HEADERS; do
+        echo "#if __has_include(<$header>)"
+        echo "#include <$header>"
+        echo "#endif"
+    done
+} > "$PCH_DIR/stdpch.h"
+
+for std in $PCH_STANDARDS; do
+    echo "$PCH_FLAGS" | tr '|' '\n' | while read -r flags; do
+        echo "Precompiling standard headers for -std=$std $flags"
+        "$REAL_CXX" -std="$std" $flags -x c++-header "$PCH_DIR/stdpch.h" \
+            -o "$PCH_DIR/stdpch.h.gch/$std$(echo "$flags" | tr -d ' ').gch"
+    done
+done
+
+for name in g++ c++; do
+    cat > "$PCH_DIR/bin/$name" <<WRAPPER
+#!/bin/sh
+exec "$REAL_CXX" -include "$PCH_DIR/stdpch.h" -pipe "\$@"
+WRAPPER
+    chmod 755 "$PCH_DIR/bin/$name"
+done
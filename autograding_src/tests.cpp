@@ -11,16 +11,109 @@ runProgram assumed the compiled binary is named the same as the assignment name.
 #include <cstdlib>
 #include <unistd.h>
 #include <sys/wait.h>
+#include <sys/resource.h>
 #include <signal.h>
+#include <fcntl.h>
+#include <cerrno>
+#include <ctime>
+#include <cstddef>
+#include <vector>
 #include <filesystem>
+#ifdef __linux__
+#include <sys/prctl.h>
+#include <linux/securebits.h>
+#include <sys/syscall.h>
+#include <linux/audit.h>
+#include <linux/filter.h>
+#include <linux/seccomp.h>
+#endif
 
 namespace fs = std::filesystem;
 
+#ifdef __linux__
+#if defined(__x86_64__)
+#define SANDBOX_AUDIT_ARCH AUDIT_ARCH_X86_64
+#elif defined(__aarch64__)
+#define SANDBOX_AUDIT_ARCH AUDIT_ARCH_AARCH64
+#endif
+
+// Syscalls a student program has no business making. They fail with EPERM rather than
+// killing the program, so the student still gets their output and an exit code.
+static const long blockedSyscalls[] = {
+    __NR_ptrace, __NR_process_vm_readv, __NR_process_vm_writev,
+    __NR_mount, __NR_umount2, __NR_pivot_root, __NR_chroot, __NR_unshare, __NR_setns,
+    __NR_socket, __NR_bpf, __NR_perf_event_open, __NR_userfaultfd,
+    __NR_keyctl, __NR_add_key, __NR_request_key,
+    __NR_kexec_load, __NR_init_module, __NR_finit_module, __NR_delete_module,
+    __NR_reboot, __NR_swapon, __NR_swapoff, __NR_acct,
+};
+
+// Builds the seccomp BPF program in the parent; the forked child only has to install it.
+static std::vector<sock_filter> buildSeccompFilter() {
+    std::vector<sock_filter> filter;
+#ifdef SANDBOX_AUDIT_ARCH
+    filter.push_back(BPF_STMT(BPF_LD | BPF_W | BPF_ABS, offsetof(struct seccomp_data, arch)));
+    filter.push_back(BPF_JUMP(BPF_JMP | BPF_JEQ | BPF_K, SANDBOX_AUDIT_ARCH, 1, 0));
+    filter.push_back(BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_KILL_PROCESS));
+    filter.push_back(BPF_STMT(BPF_LD | BPF_W | BPF_ABS, offsetof(struct seccomp_data, nr)));
+#if defined(__x86_64__)
+    // x32 ABI syscalls have bit 30 set
+    filter.push_back(BPF_JUMP(BPF_JMP | BPF_JGE | BPF_K, 0x40000000, 0, 1));
+    filter.push_back(BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_ERRNO | EPERM));
+#endif
+    for (long nr : blockedSyscalls) {
+        filter.push_back(BPF_JUMP(BPF_JMP | BPF_JEQ | BPF_K, static_cast<unsigned int>(nr), 0, 1));
+        filter.push_back(BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_ERRNO | EPERM));
+    }
+    filter.push_back(BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_ALLOW));
+#endif
+    return filter;
+}
+#endif
+
+// Memory limit for the student program in bytes, from AUTOGRADER_MEMORY_LIMIT_KB (0 = no limit).
+// Docker already enforces one through its cgroup; sandboxes without one set this variable.
+static rlim_t memoryLimitBytes() {
+    const char* value = getenv("AUTOGRADER_MEMORY_LIMIT_KB");
+    return value ? static_cast<rlim_t>(strtoul(value, nullptr, 10)) * 1024 : 0;
+}
+
+// Output limit for the student program in bytes, from AUTOGRADER_OUTPUT_LIMIT_KB (0 = no limit).
+// Set from the assignment's resource profile by both sandboxes.
+static rlim_t outputLimitBytes() {
+    const char* value = getenv("AUTOGRADER_OUTPUT_LIMIT_KB");
+    return value ? static_cast<rlim_t>(strtoul(value, nullptr, 10)) * 1024 : 0;
+}
+
 // Utility function to check if a file exists
 bool fileExists(const std::string& path) {
     return fs::exists(path);
 }
 
+// Escape a string for embedding in a JSON string literal. Anything the submission controls (its
+// output, file names) is printed this way, so it can't put lines of its own into the grader's output.
+std::string jsonEscape(const std::string& value) {
+    std::string escaped;
+    for (char c : value) {
+        switch (c) {
+            case '"': escaped += "\\\""; break;
+            case '\\': escaped += "\\\\"; break;
+            case '\n': escaped += "\\n"; break;
+            case '\r': escaped += "\\r"; break;
+            case '\t': escaped += "\\t"; break;
+            default:
+                if (static_cast<unsigned char>(c) < 0x20) {
+                    char buffer[8];
+                    snprintf(buffer, sizeof(buffer), "\\u%04x", c);
+                    escaped += buffer;
+                } else {
+                    escaped += c;
+                }
+        }
+    }
+    return escaped;
+}
+
 // Global variable to store test configurations
 static std::map<std::string, TestConfig> testConfigs;
 
@@ -66,30 +159,133 @@ std::string testAssignment2(const std::string& directory) {
 
 // Utility function to run a program in a given directory with optional input and capture its output.
 std::string runProgram(const std::string& directory, const std::string& assignmentName, const std::string& input) {
+    return runProgramMeasured(directory, assignmentName, input).output;
+}
+
+bool waitWithDeadline(pid_t pid, double timeoutSeconds, int* status, struct rusage* usage) {
+    struct timespec start, now;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    while (true) {
+        pid_t done = wait4(pid, status, WNOHANG, usage);
+        if (done == pid || (done < 0 && errno != EINTR)) {
+            return false;
+        }
+        clock_gettime(CLOCK_MONOTONIC, &now);
+        double elapsed = (now.tv_sec - start.tv_sec) + (now.tv_nsec - start.tv_nsec) / 1e9;
+        if (elapsed >= timeoutSeconds) {
+            // Kill the whole group so anything the program forked goes too
+            killpg(pid, SIGKILL);
+            while (wait4(pid, status, 0, usage) < 0 && errno == EINTR) {}
+            return true;
+        }
+        usleep(5000);
+    }
+}
+
+// Applies the limits and seccomp filter of a student program to the current (forked) process.
+// memoryLimit and fileLimit of 0 leave those unlimited. Returns false if the filter could not be installed.
+static bool confineChild(double timeoutSeconds, rlim_t memoryLimit, rlim_t fileLimit
+#ifdef __linux__
+                         , const struct sock_fprog* seccompProgram
+#endif
+                         ) {
+    struct rlimit noCore = {0, 0};
+    setrlimit(RLIMIT_CORE, &noCore);
+    // CPU time limit backs up the wall clock deadline the parent enforces
+    rlim_t cpuSeconds = static_cast<rlim_t>(timeoutSeconds) + 1;
+    struct rlimit cpu = {cpuSeconds, cpuSeconds + 1};
+    setrlimit(RLIMIT_CPU, &cpu);
+    if (memoryLimit > 0) {
+        struct rlimit memory = {memoryLimit, memoryLimit};
+        setrlimit(RLIMIT_AS, &memory);
+    }
+    if (fileLimit > 0) {
+        struct rlimit file = {fileLimit, fileLimit};
+        setrlimit(RLIMIT_FSIZE, &file);
+    }
+#ifdef __linux__
+    // Where we are root (the namespace sandbox), the program must not be: without capabilities it
+    // can't reach into the grader through /proc. Elsewhere this fails harmlessly; there are none to drop.
+    prctl(PR_CAP_AMBIENT, PR_CAP_AMBIENT_CLEAR_ALL, 0, 0, 0);
+    prctl(PR_SET_SECUREBITS, SECBIT_NOROOT | SECBIT_NOROOT_LOCKED, 0, 0, 0);
+    if (seccompProgram->len > 0 &&
+        (prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0) != 0 ||
+         prctl(PR_SET_SECCOMP, SECCOMP_MODE_FILTER, seccompProgram) != 0)) {
+        return false;
+    }
+#endif
+    return true;
+}
+
+bool runConfined(const std::string& command, const std::string& directory, const std::string& logPath,
+                 double timeoutSeconds) {
+    rlim_t memoryLimit = memoryLimitBytes();
+#ifdef __linux__
+    std::vector<sock_filter> seccompFilter = buildSeccompFilter();
+    struct sock_fprog seccompProgram = {static_cast<unsigned short>(seccompFilter.size()), seccompFilter.data()};
+#endif
+    std::cout.flush();
+    pid_t pid = fork();
+    if (pid == 0) {
+        setpgid(0, 0);
+        int inFd = open("/dev/null", O_RDONLY);
+        int outFd = open(logPath.c_str(), O_WRONLY | O_CREAT | O_TRUNC, 0600);
+        if (chdir(directory.c_str()) != 0 || inFd < 0 || outFd < 0) {
+            _exit(127);
+        }
+        dup2(inFd, STDIN_FILENO);
+        dup2(outFd, STDOUT_FILENO);
+        dup2(outFd, STDERR_FILENO);
+        close(inFd);
+        close(outFd);
+#ifdef __linux__
+        if (!confineChild(timeoutSeconds, memoryLimit, BUILD_MAX_FILE_BYTES, &seccompProgram)) {
+            _exit(126);
+        }
+#else
+        confineChild(timeoutSeconds, memoryLimit, BUILD_MAX_FILE_BYTES);
+#endif
+        execl("/bin/sh", "sh", "-c", command.c_str(), (char*)nullptr);
+        _exit(127);
+    }
+    if (pid < 0) {
+        std::cout << "Error: fork failed" << std::endl;
+        return false;
+    }
+    setpgid(pid, pid);
+    int status = 0;
+    bool timedOut = waitWithDeadline(pid, timeoutSeconds, &status, nullptr);
+    // Nothing the build started may keep running
+    killpg(pid, SIGKILL);
+    if (timedOut || (WIFSIGNALED(status) && WTERMSIG(status) == SIGXCPU)) {
+        std::cout << "Build timed out after " << timeoutSeconds << "s" << std::endl;
+        return false;
+    }
+    if (WIFSIGNALED(status) && WTERMSIG(status) == SIGXFSZ) {
+        std::cout << "Build wrote a file larger than " << BUILD_MAX_FILE_BYTES / (1024 * 1024) << "MB" << std::endl;
+        return false;
+    }
+    return WIFEXITED(status) && WEXITSTATUS(status) == 0;
+}
+
+// Runs the binary directly (fork/exec, no shell) so wait4 can report the resources the student program used.
+TestRunResult runProgramMeasured(const std::string& directory, const std::string& assignmentName, const std::string& input,
+                                 double timeoutSeconds) {
+    TestRunResult result;
     std::string binaryPath = directory + "/" + assignmentName;
     
-    // Simplified debug - remove commands that don't exist in container
     std::cout << "Checking binary: " << binaryPath << std::endl;
     if (fileExists(binaryPath)) {
         std::cout << "Binary exists" << std::endl;
         
-        // Check permissions with ls (which exists in container)
-        std::string lsCommand = "ls -la \"" + binaryPath + "\" | cut -d' ' -f1";
-        system(lsCommand.c_str());
-        std::cout << "Permissions before chmod: ";
-        
         // Make executable
-        std::string chmodCommand = "chmod +x \"" + binaryPath + "\"";
-        std::cout << "Running: " << chmodCommand << std::endl;
-        int chmodResult = system(chmodCommand.c_str());
-        std::cout << "chmod exit code: " << chmodResult << std::endl;
-        
-        // Check permissions after
-        system(lsCommand.c_str());
-        std::cout << "Permissions after chmod: ";
+        fs::permissions(binaryPath, fs::perms::owner_exec | fs::perms::group_exec | fs::perms::others_exec,
+                        fs::perm_options::add);
     } else {
         std::cout << "Binary does not exist!" << std::endl;
-        return "[BINARY_NOT_FOUND]";
+        result.output = "[BINARY_NOT_FOUND]";
+        result.status = "NOT_RUN";
+        return result;
     }
     
     std::string tempOutputFile = "/tmp/output_" + std::to_string(getpid()) + ".txt";
@@ -103,28 +299,98 @@ std::string runProgram(const std::string& directory, const std::string& assignme
         std::cout << "Input written to temp file: '" << input << "'" << std::endl;
     }
     
-    // Build command - executable name matches assignment name
+    // Executable name matches assignment name
     std::string executable = "./" + assignmentName;
-    std::string command = "cd \"" + directory + "\" && ";
-    if (!input.empty()) {
-        command += executable + " < " + tempInputFile + " > " + tempOutputFile + " 2>&1";
+    std::string inputPath = input.empty() ? "/dev/null" : tempInputFile;
+    std::cout << "Running: cd \"" << directory << "\" && " << executable << " < " << inputPath << std::endl;
+    
+    rlim_t memoryLimit = memoryLimitBytes();
+    rlim_t outputLimit = outputLimitBytes();
+#ifdef __linux__
+    std::vector<sock_filter> seccompFilter = buildSeccompFilter();
+    struct sock_fprog seccompProgram = {static_cast<unsigned short>(seccompFilter.size()), seccompFilter.data()};
+#endif
+    
+    struct timespec start, end;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    
+    pid_t pid = fork();
+    if (pid == 0) {
+        setpgid(0, 0);
+        int inFd = open(inputPath.c_str(), O_RDONLY);
+        int outFd = open(tempOutputFile.c_str(), O_WRONLY | O_CREAT | O_TRUNC, 0600);
+        if (chdir(directory.c_str()) != 0 || inFd < 0 || outFd < 0) {
+            _exit(127);
+        }
+        dup2(inFd, STDIN_FILENO);
+        dup2(outFd, STDOUT_FILENO);
+        dup2(outFd, STDERR_FILENO);
+        close(inFd);
+        close(outFd);
+        
+        // stdout and stderr go to one file, so the file size limit caps everything the program prints
+#ifdef __linux__
+        if (!confineChild(timeoutSeconds, memoryLimit, outputLimit, &seccompProgram)) {
+            _exit(126);
+        }
+#else
+        confineChild(timeoutSeconds, memoryLimit, outputLimit);
+#endif
+        execl(executable.c_str(), executable.c_str(), (char*)nullptr);
+        _exit(127);
+    }
+    
+    int status = 0;
+    bool timedOut = false;
+    struct rusage usage {};
+    if (pid < 0) {
+        std::cout << "Error: fork failed" << std::endl;
+        result.status = "NOT_RUN";
     } else {
-        command += executable + " > " + tempOutputFile + " 2>&1";
+        setpgid(pid, pid); // also set in the child; whichever runs first wins the race
+        timedOut = waitWithDeadline(pid, timeoutSeconds, &status, &usage);
     }
+    clock_gettime(CLOCK_MONOTONIC, &end);
+    
+    result.wallMs = (end.tv_sec - start.tv_sec) * 1000 + (end.tv_nsec - start.tv_nsec) / 1000000;
+    result.userCpuMs = usage.ru_utime.tv_sec * 1000 + usage.ru_utime.tv_usec / 1000;
+    result.sysCpuMs = usage.ru_stime.tv_sec * 1000 + usage.ru_stime.tv_usec / 1000;
+#ifdef __APPLE__
+    result.maxRssKb = usage.ru_maxrss / 1024; // bytes on macOS
+#else
+    result.maxRssKb = usage.ru_maxrss;        // kilobytes on Linux
+#endif
     
-    std::cout << "Running command: " << command << std::endl;
-    int result = system(command.c_str());
-    std::cout << "Program exit code: " << result << std::endl;
+    if (pid > 0 && WIFEXITED(status)) {
+        result.exitCode = WEXITSTATUS(status);
+        result.status = result.exitCode == 0 ? "OK" : "ERROR";
+    } else if (pid > 0 && WIFSIGNALED(status)) {
+        result.exitCode = 128 + WTERMSIG(status);
+        if (timedOut || WTERMSIG(status) == SIGXCPU) {
+            result.status = "TIMEOUT";
+        } else if (WTERMSIG(status) == SIGXFSZ) {
+            result.status = "OUTPUT_LIMIT";
+        } else {
+            result.status = "CRASHED";
+        }
+    }
+    // Processes the program left running in its group must not outlive the test
+    if (pid > 0) {
+        killpg(pid, SIGKILL);
+    }
+    std::cout << "Program exit code: " << result.exitCode << " (" << result.status << "), wall " << result.wallMs
+              << "ms, user " << result.userCpuMs << "ms, sys " << result.sysCpuMs << "ms, max RSS "
+              << result.maxRssKb << "KB" << std::endl;
     
     // Read output
     std::ifstream file(tempOutputFile);
-    std::string output, line;
+    std::string line;
     while (std::getline(file, line)) {
-        output += line + "\n";
+        result.output += line + "\n";
     }
     file.close();
     
-    std::cout << "Program output: '" << output << "'" << std::endl;
+    std::cout << "Program output: \"" << jsonEscape(result.output) << "\"" << std::endl;
     
     // Clean up temp files
     remove(tempOutputFile.c_str());
@@ -133,9 +399,15 @@ std::string runProgram(const std::string& directory, const std::string& assignme
     }
     
     // If program failed to run, include error info
-    if (result != 0) {
-        output += "\n[PROGRAM_EXECUTION_ERROR: Exit code " + std::to_string(result) + "]";
+    if (result.status == "TIMEOUT") {
+        char limit[32];
+        snprintf(limit, sizeof(limit), "%g", timeoutSeconds);
+        result.output += "\n[PROGRAM_TIMEOUT: exceeded " + std::string(limit) + "s]";
+    } else if (result.status == "OUTPUT_LIMIT") {
+        result.output += "\n[PROGRAM_OUTPUT_LIMIT: exceeded " + std::to_string(outputLimit / 1024) + "KB]";
+    } else if (result.exitCode != 0) {
+        result.output += "\n[PROGRAM_EXECUTION_ERROR: Exit code " + std::to_string(result.exitCode) + "]";
     }
     
-    return output;
-}
\ No newline at end of file
+    return result;
+}
@@ -3,10 +3,30 @@
 
 #include <string>
 #include <map>
+#include <sys/types.h>
+#include <sys/resource.h>
+
+// Used for tests without their own timeout_seconds
+const double DEFAULT_TEST_TIMEOUT_SECONDS = 10.0;
+// Limits of a submission's build (make and the compiler it runs)
+const double BUILD_TIMEOUT_SECONDS = 120.0;
+const rlim_t BUILD_MAX_FILE_BYTES = 64L * 1024 * 1024;
 
 // Forward declaration
 struct TestConfig;
 
+// Resource usage and outcome of a single execution of the student's binary
+struct TestRunResult {
+    std::string output;
+    std::string status;      // "OK", "ERROR" (non-zero exit), "CRASHED" (killed by a signal), "TIMEOUT",
+                             // "OUTPUT_LIMIT" (wrote more than AUTOGRADER_OUTPUT_LIMIT_KB) or "NOT_RUN"
+    int exitCode = -1;
+    long wallMs = 0;
+    long userCpuMs = 0;
+    long sysCpuMs = 0;
+    long maxRssKb = 0;
+};
+
 // Function to load test configurations
 void loadTestConfigs(const std::map<std::string, TestConfig>& configs);
 
@@ -20,8 +40,29 @@ std::string runTestFromConfig(const TestConfig& config, const std::string& direc
 std::string testAssignment1(const std::string& directory);
 std::string testAssignment2(const std::string& directory);
 
+// Escape a string for embedding in a JSON string literal
+std::string jsonEscape(const std::string& value);
+
 // Utility functions for running programs
 std::string runProgram(const std::string& directory, const std::string& assignmentName, const std::string& input = "");
 std::string runProgramWithTimeout(const std::string& directory, const std::string& input = "", int timeoutSeconds = 5);
 
+// Runs the program like runProgram and also records wall time, CPU time and peak memory (via wait4).
+// The program runs in its own process group, which is killed once it exceeds timeoutSeconds of wall
+// time or CPU time; the result then has status "TIMEOUT". Output beyond AUTOGRADER_OUTPUT_LIMIT_KB
+// kills the program (SIGXFSZ) with status "OUTPUT_LIMIT", keeping the output written until then.
+TestRunResult runProgramMeasured(const std::string& directory, const std::string& assignmentName, const std::string& input = "",
+                                 double timeoutSeconds = DEFAULT_TEST_TIMEOUT_SECONDS);
+
+// Wait for pid until timeoutSeconds of wall time have passed, then SIGKILL its process group.
+// Returns true if the process had to be killed. usage may be null.
+bool waitWithDeadline(pid_t pid, double timeoutSeconds, int* status, struct rusage* usage);
+
+// Run a shell command in directory under the same CPU, memory, core and seccomp limits as a student
+// program, with files capped at BUILD_MAX_FILE_BYTES. Used for the steps that handle the submission
+// (unzip, and make running the student's Makefile). Its output goes to logPath, never to the
+// grader's stdout. Returns true if it exited with 0.
+bool runConfined(const std::string& command, const std::string& directory, const std::string& logPath,
+                 double timeoutSeconds = BUILD_TIMEOUT_SECONDS);
+
 #endif
\ No newline at end of file
@@ -1,4 +1,6 @@
 import uvicorn
+from web.cli import setup
 
 if __name__ == "__main__":
+    setup()
     uvicorn.run("web.app:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,5 @@
+# Tests import the web package from the project root
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
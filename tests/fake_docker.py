@@ -0,0 +1,197 @@
+# A small fake of the Docker Engine API on a Unix socket, for testing docker_api.DockerClient.
+# It keeps containers in memory: a started container "runs" for its configured duration,
+# printing its frames to the log stream, and then exits unless it is killed first.
+
+import json
+import os
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = "/v1.41"
+
+class FakeContainer:
+    def __init__(self, container_id: str, name: str, body: dict):
+        self.id = container_id
+        self.name = name
+        self.body = body
+        self.running = False
+        self.exit_code = None
+        self.log = []
+        self.finished = threading.Event()
+
+class FakeDocker:
+    """Serves the Engine API calls DockerClient makes. Use as a context manager.
+
+    frames: (stream, payload) pairs each started container writes, one per frame_interval seconds.
+    """
+
+    def __init__(self, frames=((1, b"hello\n"),), frame_interval: float = 0.0, exit_code: int = 0):
+        self.frames = list(frames)
+        self.frame_interval = frame_interval
+        self.exit_code = exit_code
+        self.images = {"autograder:latest": {"Id": "sha256:fake"}}
+        self.containers = {}
+        self.connections = 0
+        self.requests = []
+        # Set to make the server drop a connection after answering, without saying so
+        self.drop_after_response = False
+        # Set to answer the next request with something that isn't HTTP
+        self.garble_next = False
+        self._lock = threading.Lock()
+        self._dir = tempfile.mkdtemp(prefix="fake_docker_")
+        self.socket_path = os.path.join(self._dir, "docker.sock")
+        self._server = None
+
+    def __enter__(self):
+        fake = self
+
+        class Handler(FakeHandler):
+            docker = fake
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        self._server = Server(self.socket_path, Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        os.unlink(self.socket_path)
+        os.rmdir(self._dir)
+
+    def run(self, container: FakeContainer):
+        for stream, payload in self.frames:
+            if container.finished.wait(self.frame_interval):
+                return
+            container.log.append((stream, payload))
+        with self._lock:
+            if not container.finished.is_set():
+                container.running = False
+                container.exit_code = self.exit_code
+                container.finished.set()
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    docker: FakeDocker = None
+
+    def setup(self):
+        super().setup()
+        with self.docker._lock:
+            self.docker.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if self.docker.drop_after_response:
+            self.docker.drop_after_response = False
+            self.close_connection = True
+
+    def _error(self, status: int, message: str):
+        self._reply(status, {"message": message})
+
+    def _container(self, container_id: str):
+        container = self.docker.containers.get(container_id)
+        if container is None:
+            self._error(404, f"No such container: {container_id}")
+        return container
+
+    def _route(self, method: str):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path[len(API_PREFIX):] if url.path.startswith(API_PREFIX) else url.path
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        self.docker.requests.append((method, path))
+
+        if self.docker.garble_next:
+            self.docker.garble_next = False
+            self.wfile.write(b"garbage\r\n\r\n")
+            self.close_connection = True
+            return
+
+        parts = path.strip("/").split("/")
+        if method == "GET" and path == "/_ping":
+            return self._reply(200)
+        if method == "GET" and parts[0] == "images":
+            image = self.docker.images.get("/".join(parts[1:-1]))
+            return self._reply(200, image) if image else self._error(404, "No such image")
+        if method == "POST" and path == "/containers/create":
+            container_id = f"c{len(self.docker.containers) + 1}"
+            container = FakeContainer(container_id, params.get("name"), body)
+            self.docker.containers[container_id] = container
+            return self._reply(201, {"Id": container_id})
+        if parts[0] != "containers" or len(parts) < 2:
+            return self._error(404, "page not found")
+
+        container = self._container(parts[1])
+        if container is None:
+            return
+        action = parts[2] if len(parts) > 2 else None
+        if method == "POST" and action == "start":
+            container.running = True
+            threading.Thread(target=self.docker.run, args=(container,), daemon=True).start()
+            return self._reply(204)
+        if method == "POST" and action == "wait":
+            container.finished.wait()
+            return self._reply(200, {"StatusCode": container.exit_code})
+        if method == "POST" and action == "kill":
+            with self.docker._lock:
+                if not container.running:
+                    return self._error(409, "Container is not running")
+                container.running = False
+                container.exit_code = 137
+                container.finished.set()
+            return self._reply(204)
+        if method == "DELETE" and action is None:
+            del self.docker.containers[container.id]
+            return self._reply(204)
+        if method == "GET" and action == "logs":
+            return self._logs(container, params.get("follow") == "1")
+        return self._error(404, "page not found")
+
+    def _logs(self, container: FakeContainer, follow: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sent = 0
+        try:
+            while True:
+                finished = container.finished.is_set()
+                while sent < len(container.log):
+                    stream, payload = container.log[sent]
+                    frame = bytes([stream, 0, 0, 0]) + struct.pack(">I", len(payload)) + payload
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+                    self.wfile.flush()
+                    sent += 1
+                if finished or not follow:
+                    break
+                time.sleep(0.01)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the stream (e.g. its deadline passed)
+            self.close_connection = True
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
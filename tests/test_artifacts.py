@@ -0,0 +1,41 @@
+# Toolchain identification and eviction in the artifact store
+
+from web.grading import artifacts
+from web.grading.artifacts import ArtifactStore
+
+def test_toolchain_is_identified_again_after_the_ttl(monkeypatch):
+    images = iter(["sha256:old", "sha256:new"])
+    monkeypatch.setattr(artifacts.docker_client, "inspect_image", lambda name: {"Id": next(images)})
+    monkeypatch.setattr(artifacts, "PRECOMPILED_HEADERS", False)
+    now = [1000.0]
+    monkeypatch.setattr(artifacts.time, "monotonic", lambda: now[0])
+    store = ArtifactStore()
+    assert store.toolchain("docker") == "docker:sha256:old"
+    now[0] += artifacts.ARTIFACT_TOOLCHAIN_TTL - 1
+    assert store.toolchain("docker") == "docker:sha256:old"
+    now[0] += 2
+    assert store.toolchain("docker") == "docker:sha256:new"
+
+def test_store_is_listed_only_when_it_may_not_fit(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, "STORE_DIR", tmp_path)
+    monkeypatch.setattr(artifacts, "ARTIFACT_MAX_BYTES", 10)
+    for index, name in enumerate(["a", "b"]):
+        (tmp_path / name).write_bytes(b"x" * 4)
+        artifacts.os.utime(tmp_path / name, (index, index))
+    store = ArtifactStore()
+    store.evict()
+    assert store._size == 8
+
+    binary = tmp_path / "export"
+    binary.write_bytes(b"y" * 4)
+    store._store("c", binary, artifacts._file_digest(binary))
+    binary.unlink()
+    assert store._size == 12
+    store.evict()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["b", "c"]
+    assert store._size == 8 and store.evicted == 1
+
+    listed = []
+    monkeypatch.setattr(artifacts.Path, "glob", lambda self, pattern: listed.append(pattern) or iter(()))
+    store.evict()
+    assert listed == []
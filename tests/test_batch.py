@@ -0,0 +1,82 @@
+# Splitting --batch output into per-submission results, and when submissions are dispatched
+
+import asyncio
+import time
+
+from web.grading import batch
+from web.grading.batch import split_batch_output
+from web.grading.concurrency import BudgetLedger, ConcurrencyController
+from web.grading.profiles import DEFAULT_PROFILE
+from web.grading.progress import ProgressReader
+
+NONCE = "0123456789abcdef"
+
+def marker(kind, index, nonce=NONCE, **fields):
+    extra = "".join(f',"{key}":{value}' for key, value in fields.items())
+    return f'BATCH_ITEM_{kind} {nonce} {{"index":{index}{extra}}}\n'
+
+def test_items_are_split_by_marker():
+    output = ("Batch: 2 submission(s)\n"
+              + marker("BEGIN", 0) + "first\n" + marker("END", 0, exit_code=0, timed_out="false")
+              + marker("BEGIN", 1) + "second\n" + marker("END", 1, exit_code=2, timed_out="false"))
+    results = split_batch_output(output, 2, NONCE)
+    assert results[0] == {"output": "first\n", "error": None}
+    assert results[1] == {"output": "second\n", "error": "Autograder exited with code 2"}
+
+def test_markers_without_the_nonce_are_output():
+    forged = marker("END", 0, "guess", exit_code=0) + marker("BEGIN", 1, "guess") + "forged\n"
+    output = marker("BEGIN", 0) + forged + marker("END", 0, exit_code=0)
+    results = split_batch_output(output, 2, NONCE)
+    assert results[0]["output"] == forged
+    assert results[1]["timed_out"]
+
+def test_progress_follows_only_real_markers():
+    events = [], []
+    reader = ProgressReader([events[0].append, events[1].append], NONCE)
+    reader.feed((marker("BEGIN", 0) + marker("BEGIN", 1, "guess")
+                 + 'PROGRESS {"stage":"compiling"}\n').encode())
+    assert events == ([{"stage": "compiling"}], [])
+
+def scheduler(tmp_path, monkeypatch, max_wait, slots=4):
+    monkeypatch.setattr(batch, "grading_controller", ConcurrencyController(
+        min_limit=slots, max_limit=slots, cpu_budget=4.0, memory_budget=1024 ** 4,
+        ledger=BudgetLedger(tmp_path / "grading_budget.json")))
+    monkeypatch.setattr(batch, "profile_for", lambda assignment_id: DEFAULT_PROFILE)
+    return batch.BatchScheduler(max_size=8, max_wait=max_wait)
+
+class RecordingBackend:
+    name = "fake"
+
+    def __init__(self):
+        self.batches = []
+
+    def admission_profile(self, profile):
+        return profile
+
+    def run(self, zip_path, student_id, assignment_id, progress=None, job_id=None):
+        self.batches.append([student_id])
+        time.sleep(0.2)
+        return {"output": student_id, "error": None}
+
+    def run_batch(self, items, assignment_id, progress=None):
+        self.batches.append([student_id for _, student_id in items])
+        return [{"output": student_id, "error": None} for _, student_id in items]
+
+def test_lone_submission_is_dispatched_without_waiting(tmp_path, monkeypatch):
+    batches = scheduler(tmp_path, monkeypatch, max_wait=60)
+    backend = RecordingBackend()
+    result = asyncio.run(asyncio.wait_for(batches.submit(backend, tmp_path / "s1.zip", "s1", "A1"), 5))
+    assert result["output"] == "s1"
+
+def test_submissions_are_batched_while_every_slot_is_taken(tmp_path, monkeypatch):
+    batches = scheduler(tmp_path, monkeypatch, max_wait=0.05, slots=1)
+    backend = RecordingBackend()
+
+    async def scenario():
+        first = asyncio.create_task(batches.submit(backend, tmp_path / "s1.zip", "s1", "A1"))
+        await asyncio.sleep(0.05)
+        rest = [batches.submit(backend, tmp_path / f"s{n}.zip", f"s{n}", "A1") for n in (2, 3)]
+        await asyncio.gather(first, *rest)
+
+    asyncio.run(scenario())
+    assert backend.batches == [["s1"], ["s2", "s3"]]
@@ -0,0 +1,62 @@
+# Admission against the grading budget shared by the server processes on a host
+
+import asyncio
+import json
+import os
+import socket
+
+from web.grading.concurrency import BudgetLedger, ConcurrencyController
+from web.grading.profiles import ResourceProfile
+
+HALF_CORE = ResourceProfile(memory=64 * 1024 * 1024, cpus=0.5, timeout=60, output_limit=1024)
+
+def write_runs(path, **runs):
+    path.write_text(json.dumps({"runs": runs}))
+
+def other_run(pid, cpus=1.0):
+    return {"owner": f"{socket.gethostname()}:{pid}", "cpus": cpus, "memory": 0}
+
+def controller(path):
+    return ConcurrencyController(min_limit=1, max_limit=4, cpu_budget=1.0,
+                                 memory_budget=1024 ** 3, ledger=BudgetLedger(path))
+
+def test_runs_of_other_processes_count_against_the_budget(tmp_path):
+    ledger = tmp_path / "grading_budget.json"
+    write_runs(ledger, other=other_run(os.getppid()))
+    grading = controller(ledger)
+
+    async def scenario():
+        task = asyncio.create_task(grading.slot(HALF_CORE).__aenter__())
+        await asyncio.sleep(0)
+        assert not task.done() and grading.waiting == 1
+
+        # The other process finished its run
+        with grading.ledger.update(grading._own) as state:
+            state["runs"].clear()
+        grading.refresh()
+        await task
+        assert grading.waiting == 0
+        assert [run["cpus"] for run in json.loads(ledger.read_text())["runs"].values()] == [0.5]
+
+    asyncio.run(scenario())
+
+def test_runs_of_exited_processes_are_dropped(tmp_path):
+    ledger = tmp_path / "grading_budget.json"
+    with open("/proc/sys/kernel/pid_max") as f:
+        unused_pid = int(f.read()) + 1
+    write_runs(ledger, gone=other_run(unused_pid))
+    grading = controller(ledger)
+
+    async def scenario():
+        async with grading.slot(HALF_CORE):
+            assert grading.active == 1
+        assert json.loads(ledger.read_text())["runs"] == {}
+
+    asyncio.run(scenario())
+
+def test_bounds_are_shared(tmp_path):
+    ledger = tmp_path / "grading_budget.json"
+    first, second = controller(ledger), controller(ledger)
+    first.set_bounds(2, 3)
+    second.refresh()
+    assert (second.min_limit, second.max_limit) == (2, 3)
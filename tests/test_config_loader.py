@@ -0,0 +1,50 @@
+# Applying config.txt changes to the database
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from web.config_loader import parse_config, diff_config, apply_config_diff, config_names
+from web.database import Base, Assignments, Autograders, Tests as TestRows
+
+CONFIG = """### Assignments
+A1 = {"First", "2025-10-31", "ag1"}
+A2 = {"Second", "2025-12-25", "ag1"}
+
+### Autograders
+ag1 = {["out"], [100]}
+
+### Tests
+T1 = {"A1", ["1"]}
+T2 = {"A2", ["2"]}
+"""
+
+def apply(db, text, previous):
+    config = parse_config(text)
+    diff = diff_config(db, config, previous)
+    apply_config_diff(db, diff)
+    db.commit()
+    return diff, config_names(config)
+
+def test_reload_deletes_only_entries_that_came_from_config():
+    db = sessionmaker(bind=create_engine("sqlite://"))()
+    Base.metadata.create_all(db.get_bind())
+    _, names = apply(db, CONFIG, None)
+    # Created on the admin pages
+    db.add(Assignments(assignment_id="UI", description="Made in the UI", autograder="ag1"))
+    db.add(TestRows(test_id="UI_T", assignment_id="UI", input_data="[]"))
+    db.commit()
+
+    trimmed = CONFIG.replace('A2 = {"Second", "2025-12-25", "ag1"}\n', "").replace('T2 = {"A2", ["2"]}\n', "")
+    diff, _ = apply(db, trimmed, names)
+    assert diff["assignments"]["delete"] == ["A2"]
+    assert diff["tests"]["delete"] == ["T2"]
+    assert sorted(a.assignment_id for a in db.query(Assignments)) == ["A1", "UI"]
+    assert sorted(t.test_id for t in db.query(TestRows)) == ["T1", "UI_T"]
+    assert [ag.name for ag in db.query(Autograders)] == ["ag1"]
+
+def test_without_a_snapshot_nothing_is_deleted():
+    db = sessionmaker(bind=create_engine("sqlite://"))()
+    Base.metadata.create_all(db.get_bind())
+    apply(db, CONFIG, None)
+    diff, _ = apply(db, "### Assignments\n", None)
+    assert not any(changes["delete"] for changes in diff.values())
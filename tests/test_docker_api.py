@@ -0,0 +1,92 @@
+# DockerClient against the fake Engine API in fake_docker.py
+
+import time
+import pytest
+from fake_docker import FakeDocker
+from web.grading.docker_api import DockerClient, DockerAPIError, DockerTimeout
+
+@pytest.fixture
+def fake():
+    with FakeDocker(frames=[(1, b"out 1\n"), (2, b"err\n"), (1, b"out 2\n")]) as fake:
+        yield fake
+
+def client(fake, timeout=5):
+    return DockerClient(socket_path=fake.socket_path, pool_size=2, timeout=timeout)
+
+def test_ping_and_inspect_image(fake):
+    docker = client(fake)
+    assert docker.ping()
+    assert docker.inspect_image("autograder:latest")["Id"] == "sha256:fake"
+    assert docker.inspect_image("missing:latest") is None
+
+def test_create_start_wait_remove(fake):
+    docker = client(fake)
+    container_id = docker.create_container("grader_1", "autograder:latest", ["true"], {"Memory": 1},
+                                           labels={"autograder.job": "1"}, env=["A=1"], user="0")
+    body = fake.containers[container_id].body
+    assert body["HostConfig"] == {"Memory": 1} and body["User"] == "0" and body["Env"] == ["A=1"]
+    docker.start(container_id)
+    assert docker.wait(container_id, timeout=5) == 0
+    docker.remove(container_id)
+    assert container_id not in fake.containers
+    # Removing it again is not an error
+    docker.remove(container_id)
+
+def test_logs_follow_streams_frames(fake):
+    fake.frame_interval = 0.05
+    docker = client(fake)
+    container_id = docker.create_container("grader_2", "autograder:latest", ["true"], {})
+    docker.start(container_id)
+    frames = list(docker.logs(container_id, follow=True, deadline=time.monotonic() + 5))
+    assert frames == [(1, b"out 1\n"), (2, b"err\n"), (1, b"out 2\n")]
+
+def test_kill_running_and_stopped(fake):
+    fake.frame_interval = 10
+    docker = client(fake)
+    container_id = docker.create_container("grader_3", "autograder:latest", ["sleep"], {})
+    docker.start(container_id)
+    docker.kill(container_id)
+    assert docker.wait(container_id, timeout=5) == 137
+    # 409 (not running) and 404 (gone) are ignored
+    docker.kill(container_id)
+    docker.kill("nope")
+
+def test_wait_and_logs_time_out(fake):
+    fake.frame_interval = 10
+    docker = client(fake)
+    container_id = docker.create_container("grader_4", "autograder:latest", ["sleep"], {})
+    docker.start(container_id)
+    with pytest.raises(DockerTimeout):
+        docker.wait(container_id, timeout=0.2)
+    with pytest.raises(DockerTimeout):
+        list(docker.logs(container_id, follow=True, deadline=time.monotonic() + 0.2))
+    docker.kill(container_id)
+
+def test_errors_carry_the_daemon_message(fake):
+    docker = client(fake)
+    with pytest.raises(DockerAPIError) as error:
+        docker.start("nope")
+    assert error.value.status == 404 and "No such container" in error.value.message
+
+def test_connections_are_reused(fake):
+    docker = client(fake)
+    for _ in range(5):
+        assert docker.inspect_image("autograder:latest")
+    assert fake.connections == 1
+
+def test_stale_pooled_connection_is_retried(fake):
+    docker = client(fake)
+    fake.drop_after_response = True
+    assert docker.inspect_image("autograder:latest")
+    # The pooled connection was closed by the server; the next call reconnects transparently
+    assert docker.inspect_image("autograder:latest")
+    assert fake.connections == 2
+
+def test_garbled_response_is_an_api_error(fake):
+    docker = client(fake)
+    fake.garble_next = True
+    with pytest.raises(DockerAPIError) as error:
+        docker.inspect_image("autograder:latest")
+    assert error.value.status == 0
+    # The broken connection is not pooled
+    assert docker.inspect_image("autograder:latest")
@@ -0,0 +1,14 @@
+# Validating resource profiles entered by an admin
+
+import pytest
+from web.grading.profiles import parse_profile
+
+def test_blank_fields_use_the_defaults():
+    assert parse_profile("256m", "", None, " ") == \
+        {"memory_limit": "256m", "cpu_limit": None, "grading_timeout": None, "output_limit": None}
+
+def test_cpu_limit_must_be_a_finite_positive_number():
+    assert parse_profile("", "0.5", "", "")["cpu_limit"] == 0.5
+    for cpu_limit in ("nan", "inf", "-inf", "0", "-1", "lots"):
+        with pytest.raises(ValueError):
+            parse_profile("", cpu_limit, "", "")
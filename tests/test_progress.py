@@ -0,0 +1,20 @@
+# Events published for the autograder's PROGRESS lines
+
+from web.grading.progress import ProgressReader, progress_event
+
+def test_only_known_fields_are_kept():
+    assert progress_event({"stage": "compiling", "job_id": "other"}) == {"stage": "compiling"}
+    assert progress_event({"stage": "running", "test": 2, "total": 3, "test_id": "<b>"}) == \
+        {"stage": "running", "test": 2, "total": 3}
+
+def test_invalid_updates_are_dropped():
+    for fields in ({"stage": "done", "results": {}}, {"stage": "running", "test": "<img>", "total": 3},
+                   {"stage": "running", "test": 4, "total": 3}, {"stage": "running", "test": True, "total": 1},
+                   ["stage"]):
+        assert progress_event(fields) is None
+
+def test_reader_publishes_built_events():
+    events = []
+    reader = ProgressReader([events.append])
+    reader.feed(b'PROGRESS {"stage":"running","test":1,"total":2,"job_id":"x"}\nPROGRESS {"stage":"done"}\n')
+    assert events == [{"stage": "running", "test": 1, "total": 2}]
@@ -0,0 +1,17 @@
+# Tokenizing sources for the similarity index
+
+import time
+from web.similarity import tokenize
+
+def test_comments_are_skipped():
+    assert tokenize("int a; /* x * / y */ a = 1; // c\n") == ["int", "ID", ";", "ID", "=", "NUM", ";"]
+
+def test_unterminated_comment_runs_to_the_end():
+    assert tokenize("int a; /* never closed\nint b;") == ["int", "ID", ";"]
+
+def test_unterminated_comment_takes_linear_time():
+    # Each "/*" used to rescan the rest of the input for a "*/"
+    source = "a /*" * 20000
+    started = time.perf_counter()
+    assert tokenize(source) == ["ID"]
+    assert time.perf_counter() - started < 1
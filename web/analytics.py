@@ -0,0 +1,172 @@
+# Per-assignment grade analytics for the admin dashboard and /admin/analytics:
+# distribution (mean, median, percentiles, histogram), grades over time and on-time vs late.
+# Submissions are read from the database in one bulk query into per-assignment NumPy columns.
+# save_submission_to_db applies each new grade with record_grade(), which bumps the submissions
+# version, so a view only recomputes the assignments that changed and never rescans the table.
+# The TTL reload picks up grades written by other workers. Grades recorded while a reload is
+# reading the table are replayed onto its result, so a reload never drops a grade it raced with.
+
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Dict, List, Optional
+import numpy as np
+from .config import ANALYTICS_CACHE_TTL, ANALYTICS_HISTOGRAM_BINS
+from .database import SessionLocal, Submissions
+from .catalog import get_catalog
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+@dataclass
+class _AssignmentGrades:
+    """Best grade and its submission time per student, as growable NumPy columns."""
+    rows: Dict[str, int] = field(default_factory=dict)
+    grades: np.ndarray = field(default_factory=lambda: np.zeros(16))
+    times: np.ndarray = field(default_factory=lambda: np.full(16, np.datetime64("NaT"), dtype="datetime64[s]"))
+    version: int = 0
+
+    def set(self, user_id: str, grade: float, submission_time: Optional[datetime]):
+        row = self.rows.get(user_id)
+        if row is None:
+            row = self.rows[user_id] = len(self.rows)
+            if row == len(self.grades):
+                self.grades = np.resize(self.grades, 2 * row)
+                self.times = np.concatenate([self.times, np.full(row, np.datetime64("NaT"), dtype="datetime64[s]")])
+        self.grades[row] = grade
+        self.times[row] = np.datetime64(submission_time, "s") if submission_time else np.datetime64("NaT")
+        self.version += 1
+
+    def columns(self):
+        count = len(self.rows)
+        return self.grades[:count], self.times[:count]
+
+def compute_stats(grades: np.ndarray, times: np.ndarray, due_date: Optional[date]) -> Dict:
+    """Summary statistics for one assignment's grades (percentages) and submission times."""
+    stats = {"count": int(grades.size)}
+    if grades.size == 0:
+        return stats
+
+    percentiles = np.percentile(grades, PERCENTILES)
+    counts, edges = np.histogram(grades, bins=ANALYTICS_HISTOGRAM_BINS, range=(0, 100))
+    stats.update({
+        "mean": float(grades.mean()),
+        "std": float(grades.std()),
+        "min": float(grades.min()),
+        "max": float(grades.max()),
+        "median": float(percentiles[PERCENTILES.index(50)]),
+        "percentiles": {f"p{p}": float(v) for p, v in zip(PERCENTILES, percentiles)},
+        "histogram": [
+            {"low": float(low), "high": float(high), "count": int(count)}
+            for low, high, count in zip(edges[:-1], edges[1:], counts)
+        ],
+    })
+
+    # Submissions without a recorded time are left out of the time-based breakdowns
+    known = ~np.isnat(times)
+    days, day_index, day_counts = np.unique(times[known].astype("datetime64[D]"), return_inverse=True, return_counts=True)
+    day_sums = np.bincount(day_index, weights=grades[known], minlength=days.size)
+    stats["over_time"] = [
+        {"date": str(day), "submissions": int(count), "mean": float(total / count), "cumulative": int(cumulative)}
+        for day, count, total, cumulative in zip(days, day_counts, day_sums, np.cumsum(day_counts))
+    ]
+
+    if due_date is not None:
+        # Due at the end of the due date
+        late = times[known] >= np.datetime64(due_date, "D") + np.timedelta64(1, "D")
+        breakdown = {}
+        for label, mask in (("on_time", ~late), ("late", late)):
+            selected = grades[known][mask]
+            breakdown[label] = {"count": int(selected.size),
+                                "mean": float(selected.mean()) if selected.size else None}
+        stats["late"] = breakdown
+    return stats
+
+_lock = threading.Lock()
+_grades: Optional[Dict[str, _AssignmentGrades]] = None
+_loaded_at = 0.0
+_version = 0
+_generation = 0  # bumped by invalidate_analytics, so a load that started before is discarded
+_loading = 0  # loads in progress
+_pending: List[tuple] = []  # record_grade arguments seen while a load was in progress
+# assignment_id -> ((grades version, due date), stats)
+_stats: Dict[str, tuple] = {}
+
+def _load() -> Dict[str, _AssignmentGrades]:
+    db = SessionLocal()
+    rows = db.query(Submissions.assignment_id, Submissions.user_id, Submissions.grade, Submissions.submission_time).all()
+    db.close()
+
+    grades: Dict[str, _AssignmentGrades] = {}
+    for assignment_id, user_id, grade, submission_time in rows:
+        grades.setdefault(assignment_id, _AssignmentGrades()).set(user_id, grade or 0, submission_time)
+    return grades
+
+def _current_grades() -> Dict[str, _AssignmentGrades]:
+    global _grades, _loaded_at, _version, _loading
+    while True:
+        with _lock:
+            if _grades is not None and time.monotonic() - _loaded_at < ANALYTICS_CACHE_TTL:
+                return _grades
+            generation, seen = _generation, len(_pending)
+            _loading += 1
+
+        try:
+            grades = _load()
+        except Exception:
+            with _lock:
+                _loading -= 1
+                if not _loading:
+                    _pending.clear()
+            raise
+        with _lock:
+            _loading -= 1
+            recorded = _pending[seen:]
+            if not _loading:
+                _pending.clear()
+            if _generation != generation:
+                continue  # invalidated while loading; the rows read may be gone
+            # The query may have run before these grades were committed
+            for user_id, assignment_id, grade, submission_time in recorded:
+                grades.setdefault(assignment_id, _AssignmentGrades()).set(user_id, grade, submission_time)
+            _grades, _loaded_at = grades, time.monotonic()
+            _version += 1
+            _stats.clear()
+            return _grades
+
+def record_grade(user_id: str, assignment_id: str, grade: float, submission_time: Optional[datetime]):
+    """Apply a grade that was just written to Submissions. Cheap; nothing happens before the first view."""
+    global _version
+    with _lock:
+        if _loading:
+            _pending.append((user_id, assignment_id, grade, submission_time))
+        if _grades is None:
+            return
+        _grades.setdefault(assignment_id, _AssignmentGrades()).set(user_id, grade, submission_time)
+        _version += 1
+
+def invalidate_analytics():
+    """Call after submissions are deleted or changed outside save_submission_to_db."""
+    global _grades, _generation
+    with _lock:
+        _grades = None
+        _generation += 1
+        _stats.clear()
+
+def get_analytics(assignment_id: Optional[str] = None) -> Dict:
+    """Statistics per assignment, recomputing only assignments whose grades or due date changed."""
+    catalog = get_catalog()
+    grades = _current_grades()
+    assignments = [a for a in catalog.assignments if assignment_id is None or a.assignment_id == assignment_id]
+
+    results: Dict[str, Dict] = {}
+    with _lock:
+        version = _version
+        for assignment in assignments:
+            columns = grades.get(assignment.assignment_id) or _AssignmentGrades()
+            key = (columns.version, assignment.due_date)
+            cached = _stats.get(assignment.assignment_id)
+            if cached is None or cached[0] != key:
+                cached = _stats[assignment.assignment_id] = (key, compute_stats(*columns.columns(), assignment.due_date))
+            results[assignment.assignment_id] = cached[1]
+    return {"version": version, "assignments": results}
@@ -1,31 +1,65 @@
-# FastAPI setup -- Creates admin account on startup if one does not already exist
+# FastAPI setup -- create_app() builds the application without touching the filesystem or database.
+# One-time setup (directories, migrations, admin account) lives in cli.py: python -m web.cli setup
 
+import asyncio
+import time
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from .config import WEB_DIR, SUBMISSIONS_DIR, DATA_DIR
-from .database import init_db
-from .config_loader import load_config_to_database, create_admin_if_not_exists
-from .routes import auth_routes, student_routes, admin_routes
+from .config import WEB_DIR, STARTUP_TIME_BUDGET
+from .database import db_initialized
+from .config_loader import load_config_to_database, watch_config
+from .events import event_bus
+from .grading.concurrency import run_adjuster
+from .grading.jobs import watch_superseded_jobs
+from .grading.lifecycle import run_reaper
+from .similarity import similarity_indexer
+from .routes import auth_routes, student_routes, admin_routes, export_routes
 
-SUBMISSIONS_DIR.mkdir(exist_ok=True)
-DATA_DIR.mkdir(exist_ok=True)
-init_db()
-load_config_to_database()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
 
-app = FastAPI(title="C++ Autograder")
+    if not db_initialized():
+        print("WARNING: Database is not initialized. Run 'python -m web.cli setup' first.")
+    else:
+        # Uses the shared config snapshot, so this is a stat() when config.txt is unchanged
+        await asyncio.to_thread(load_config_to_database)
+    config_watcher = asyncio.create_task(watch_config())
+    reaper = asyncio.create_task(run_reaper())
+    adjuster = asyncio.create_task(run_adjuster())
+    # Other worker processes see this one's job events and supersedes through the database
+    relay = asyncio.create_task(event_bus.run_relay())
+    supersede_watcher = asyncio.create_task(watch_superseded_jobs())
 
-templates = Jinja2Templates(directory=str(WEB_DIR / "templates"))
-app.mount("/static", StaticFiles(directory=str(WEB_DIR / "static")), name="static")
+    app.state.startup_seconds = time.perf_counter() - started
+    if app.state.startup_seconds > STARTUP_TIME_BUDGET:
+        print(f"WARNING: Startup took {app.state.startup_seconds:.3f}s (budget {STARTUP_TIME_BUDGET:.3f}s)")
+    else:
+        print(f"Startup completed in {app.state.startup_seconds:.3f}s")
 
-app.include_router(auth_routes.router)
-app.include_router(student_routes.router)
-app.include_router(admin_routes.router)
+    yield
 
-@app.on_event("startup")
-async def startup_event():
-    create_admin_if_not_exists()
+    for task in (config_watcher, reaper, adjuster, relay, supersede_watcher):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    similarity_indexer.shutdown()
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="C++ Autograder", lifespan=lifespan)
+
+    app.mount("/static", StaticFiles(directory=str(WEB_DIR / "static")), name="static")
+
+    app.include_router(auth_routes.router)
+    app.include_router(student_routes.router)
+    app.include_router(admin_routes.router)
+    app.include_router(export_routes.router)
+
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,158 @@
+# In-process cache of the assignment catalog and of each student's submissions,
+# plus ETag/Last-Modified helpers so repeat page loads can be answered with 304.
+# Entries are invalidated by the routes that change them and expire after a TTL,
+# which bounds staleness when another worker made the change.
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from fastapi import Request, Response
+from .config import CATALOG_CACHE_TTL, STUDENT_CACHE_TTL
+from .database import SessionLocal, Users, Assignments, Submissions
+
+@dataclass(frozen=True)
+class AssignmentSnapshot:
+    assignment_id: str
+    description: str
+    due_date: object
+    autograder: str
+    sandbox_backend: Optional[str]
+    memory_limit: Optional[str]
+    cpu_limit: Optional[float]
+    grading_timeout: Optional[int]
+    output_limit: Optional[str]
+
+@dataclass(frozen=True)
+class SubmissionSnapshot:
+    assignment_id: str
+    grade: float
+    submission_time: Optional[datetime]
+
+@dataclass
+class Catalog:
+    assignments: Tuple[AssignmentSnapshot, ...]
+    by_id: Dict[str, AssignmentSnapshot]
+    etag: str
+    last_modified: datetime
+    loaded_at: float
+
+@dataclass
+class StudentView:
+    user_id: str
+    name: str
+    role: str
+    submissions: Dict[str, SubmissionSnapshot]
+    etag: str
+    last_modified: datetime
+    loaded_at: float = field(default_factory=time.monotonic)
+
+_lock = threading.Lock()
+_catalog: Optional[Catalog] = None
+_students: Dict[str, StudentView] = {}
+
+def _digest(*parts) -> str:
+    return hashlib.sha1("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:16]
+
+def get_catalog() -> Catalog:
+    global _catalog
+    catalog = _catalog
+    if catalog is not None and time.monotonic() - catalog.loaded_at < CATALOG_CACHE_TTL:
+        return catalog
+
+    db = SessionLocal()
+    rows = db.query(Assignments).order_by(Assignments.assignment_id).all()
+    assignments = tuple(
+        AssignmentSnapshot(a.assignment_id, a.description, a.due_date, a.autograder, a.sandbox_backend,
+                           a.memory_limit, a.cpu_limit, a.grading_timeout, a.output_limit) for a in rows
+    )
+    db.close()
+
+    etag = _digest(*assignments)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    with _lock:
+        # Keep the previous Last-Modified when a TTL reload finds identical content
+        last_modified = catalog.last_modified if catalog is not None and catalog.etag == etag else now
+        _catalog = Catalog(
+            assignments=assignments,
+            by_id={a.assignment_id: a for a in assignments},
+            etag=etag,
+            last_modified=last_modified,
+            loaded_at=time.monotonic()
+        )
+        return _catalog
+
+def invalidate_catalog():
+    """Call after assignments are created, updated or deleted."""
+    global _catalog
+    with _lock:
+        _catalog = None
+
+def get_student_view(user_id: str) -> Optional[StudentView]:
+    view = _students.get(user_id)
+    if view is not None and time.monotonic() - view.loaded_at < STUDENT_CACHE_TTL:
+        return view
+
+    db = SessionLocal()
+    user = db.query(Users).filter(Users.user_id == user_id).first()
+    if not user:
+        db.close()
+        return None
+    rows = db.query(Submissions).filter(Submissions.user_id == user_id).all()
+    db.close()
+
+    submissions = {
+        s.assignment_id: SubmissionSnapshot(s.assignment_id, s.grade or 0, s.submission_time) for s in rows
+    }
+    # Submission times are stored as naive local times, account creation as naive UTC; HTTP dates are UTC
+    times = ([s.submission_time.astimezone(timezone.utc) for s in rows if s.submission_time]
+             or [(user.created_at or datetime.utcnow()).replace(tzinfo=timezone.utc)])
+    view = StudentView(
+        user_id=user.user_id,
+        name=user.name,
+        role=user.role,
+        submissions=submissions,
+        etag=_digest(user.user_id, user.name, user.role, *sorted(submissions.values(), key=lambda s: s.assignment_id)),
+        last_modified=max(times).replace(microsecond=0)
+    )
+    with _lock:
+        _students[user_id] = view
+    return view
+
+def invalidate_student(user_id: Optional[str] = None):
+    """Call after a student's submissions change. With no user_id, drops every student."""
+    with _lock:
+        if user_id is None:
+            _students.clear()
+        else:
+            _students.pop(user_id, None)
+
+def validators(*parts) -> str:
+    """Build a quoted ETag from catalog/student ETags and any other inputs the page depends on."""
+    return f'"{_digest(*parts)}"'
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def set_validators(response: Response, etag: str, last_modified: datetime) -> Response:
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    # Browsers must revalidate, but may reuse the page when we answer 304
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def not_modified(etag: str, last_modified: datetime) -> Response:
+    return set_validators(Response(status_code=304), etag, last_modified)
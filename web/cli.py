@@ -0,0 +1,96 @@
+# Command line entry point for one-time setup tasks that must not run inside web workers.
+# Usage: python -m web.cli setup | migrate | load-config | create-admin | check-startup | import-students
+
+import argparse
+import sys
+import time
+from .config import SUBMISSIONS_DIR, DATA_DIR, STARTUP_TIME_BUDGET
+
+def migrate():
+    from .database import init_db
+    SUBMISSIONS_DIR.mkdir(exist_ok=True)
+    DATA_DIR.mkdir(exist_ok=True)
+    init_db()
+    print("Database schema is up to date.")
+
+def load_config(force: bool = False) -> bool:
+    from .config_loader import load_config_to_database
+    return load_config_to_database(force=force)
+
+def create_admin():
+    from .config_loader import create_admin_if_not_exists
+    create_admin_if_not_exists()
+
+def setup():
+    migrate()
+    load_config(force=True)
+    create_admin()
+
+def import_students(csv_path: str, update: bool = False) -> bool:
+    """Bulk-create student accounts from a CSV with student_id, name and password columns."""
+    from .student_import import parse_csv, import_students as run_import, ImportReport
+
+    with open(csv_path, encoding="utf-8-sig", newline="") as f:
+        rows, errors = parse_csv(f.read())
+    print(f"{len(rows)} valid rows, {len(errors)} invalid")
+
+    def progress(done: int, total: int):
+        print(f"\rImported {done}/{total}", end="", flush=True)
+
+    report = run_import(rows, "update" if update else "skip", progress, ImportReport(errors=errors))
+    if rows:
+        print()
+    for line, message in sorted(report.errors):
+        print(f"  line {line}: {message}")
+    print(f"Created {report.created}, updated {report.updated}, skipped {report.skipped}, errors {len(report.errors)}")
+    return not report.errors
+
+def check_startup() -> bool:
+    """Measure import + startup of a fresh app against STARTUP_TIME_BUDGET."""
+    import asyncio
+
+    async def start_and_stop(app):
+        async with app.router.lifespan_context(app):
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    from .app import create_app
+    app = create_app()
+    imported = time.perf_counter() - started
+    elapsed = asyncio.run(start_and_stop(app))
+    within_budget = elapsed <= STARTUP_TIME_BUDGET
+    print(f"Startup took {elapsed:.3f}s (imports {imported:.3f}s, lifespan {app.state.startup_seconds:.3f}s), "
+          f"budget {STARTUP_TIME_BUDGET:.3f}s: {'OK' if within_budget else 'OVER BUDGET'}")
+    return within_budget
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m web.cli", description="C++ Autograder administration")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("setup", help="create directories, migrate the database, load config.txt and create the admin account")
+    commands.add_parser("migrate", help="create missing tables and columns")
+    load_parser = commands.add_parser("load-config", help="apply config.txt to the database")
+    load_parser.add_argument("--force", action="store_true", help="re-apply even if config.txt is unchanged")
+    commands.add_parser("create-admin", help="interactively create the admin account if it does not exist")
+    commands.add_parser("check-startup", help="measure web worker startup time against the budget")
+    import_parser = commands.add_parser("import-students", help="create student accounts from a CSV file")
+    import_parser.add_argument("csv_path", help="CSV with student_id, name and password columns")
+    import_parser.add_argument("--update", action="store_true",
+                               help="update the name and password of existing students instead of skipping them")
+    args = parser.parse_args(argv)
+
+    if args.command == "setup":
+        setup()
+    elif args.command == "migrate":
+        migrate()
+    elif args.command == "load-config":
+        return 0 if load_config(force=args.force) else 1
+    elif args.command == "create-admin":
+        create_admin()
+    elif args.command == "check-startup":
+        return 0 if check_startup() else 1
+    elif args.command == "import-students":
+        return 0 if import_students(args.csv_path, update=args.update) else 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
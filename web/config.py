@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).parent.parent
@@ -5,6 +6,52 @@ SUBMISSIONS_DIR = BASE_DIR / "submissions"
 AUTOGRADER_DIR = BASE_DIR / "autograding_src"
 DATA_DIR = BASE_DIR / "data"
 WEB_DIR = Path(__file__).parent
+CONFIG_FILE = BASE_DIR / "config.txt"
+CONFIG_POLL_INTERVAL = 5  # seconds between config.txt change checks
+CONFIG_SNAPSHOT_FILE = DATA_DIR / "config_snapshot.json"
+CONFIG_LOCK_FILE = DATA_DIR / "config.lock"
+
+# Page caches (see catalog.py). The TTL bounds how long a page may miss a change made elsewhere.
+CATALOG_CACHE_TTL = 60   # seconds
+STUDENT_CACHE_TTL = 30   # seconds
+
+# Grade analytics (see analytics.py)
+ANALYTICS_CACHE_TTL = 300     # seconds between full reloads of the grades
+ANALYTICS_HISTOGRAM_BINS = 10  # equal-width bins over 0-100%
+
+# Grading progress pushed over server-sent events (see events.py)
+EVENTS_QUEUE_SIZE = 32      # undelivered events kept per open stream; older ones are dropped
+EVENTS_KEEPALIVE = 15       # seconds between keep-alive comments on an idle stream
+EVENTS_JOB_HISTORY = 10000  # recent jobs whose latest event is kept for /jobs/{job_id}
+EVENTS_RELAY_INTERVAL = 0.25  # seconds between exchanges of events with the other server processes
+EVENTS_RELAY_RETENTION = 300  # seconds relayed events stay in the database
+
+# Code-similarity index (see similarity.py)
+SIMILARITY_WORKERS = 2                   # processes fingerprinting submissions in the background
+SIMILARITY_KGRAM = 5                     # tokens per hashed k-gram
+SIMILARITY_WINDOW = 4                    # winnowing window, in k-grams
+SIMILARITY_NUM_PERM = 64                 # MinHash signature length
+SIMILARITY_LSH_BANDS = 16                # bands of NUM_PERM / BANDS rows; more bands find weaker matches
+SIMILARITY_MIN_SCORE = 0.3               # pairs below this Jaccard and containment are not stored
+SIMILARITY_MAX_SOURCE_BYTES = 1_000_000  # source read per submission; the rest is ignored
+
+# Bulk student import (see student_import.py)
+IMPORT_BATCH_SIZE = 200                     # students hashed and saved per transaction
+IMPORT_HASH_WORKERS = os.cpu_count() or 1   # processes computing bcrypt hashes
+IMPORT_MAX_ROWS = 10000
+
+# Reference-solution grading (see grading/reference.py)
+REFERENCE_DIR = BASE_DIR / "reference_solutions"  # uploaded solutions, named by sha256; outside the data/ mount Docker sandboxes see
+REFERENCE_MAX_ZIP_BYTES = 10 * 1024 * 1024
+REFERENCE_NORMALIZATIONS = ("trailing_whitespace", "whitespace", "case", "blank_lines")
+REFERENCE_DEFAULT_NORMALIZATION = "trailing_whitespace,blank_lines"  # mirrors DEFAULT_OUTPUT_NORMALIZATION in autograding_src/outputdiff.h
+REFERENCE_DEFAULT_POINTS = 10  # per test; mirrors DEFAULT_REFERENCE_POINTS in autograding_src/outputdiff.h
+
+# Gradebook export
+EXPORT_BATCH_SIZE = 1000  # rows fetched per short read transaction
+
+# Startup
+STARTUP_TIME_BUDGET = 1.0  # seconds; a slower worker startup is reported as a warning
 
 # Database
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DATA_DIR}/database.db"
@@ -18,4 +65,60 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 480
 DOCKER_IMAGE = "autograder:latest"
 DOCKER_MEMORY_LIMIT = "128m"
 DOCKER_CPU_LIMIT = "0.5"
-DOCKER_TIMEOUT = 60
\ No newline at end of file
+DOCKER_TIMEOUT = 60
+DEFAULT_TEST_TIMEOUT = 10  # seconds; mirrors DEFAULT_TEST_TIMEOUT_SECONDS in autograding_src/tests.h
+DOCKER_SOCKET = os.environ.get("DOCKER_SOCKET", "/var/run/docker.sock")
+DOCKER_API_VERSION = "v1.41"
+DOCKER_API_POOL_SIZE = 16  # idle keep-alive connections kept to the Docker daemon
+DOCKER_API_TIMEOUT = 30    # seconds for API calls other than waiting on a container
+
+# Precompiled standard headers for student builds (see autograding_src/pch). Opt in with
+# PRECOMPILED_HEADERS=1: they are force-included, so a submission missing an #include still compiles.
+PRECOMPILED_HEADERS = os.environ.get("PRECOMPILED_HEADERS", "0") == "1"
+PCH_BIN_DIR = "/opt/pch/bin"
+
+# Sandbox backends (see grading/sandbox.py). Assignments without their own backend use SANDBOX_BACKEND.
+SANDBOX_BACKENDS = ("docker", "namespace")
+SANDBOX_BACKEND = os.environ.get("SANDBOX_BACKEND", "docker")
+AUTOGRADER_BINARY = AUTOGRADER_DIR / "autograder"  # host build used by the namespace backend
+NAMESPACE_TMPFS_SIZE = "100m"
+NAMESPACE_MAX_OPEN_FILES = 64
+NAMESPACE_MAX_FILE_SIZE = 16 * 1024 * 1024  # bytes any single written file may reach
+# Grading concurrency (adaptive, see grading/concurrency.py)
+GRADING_MIN_CONCURRENCY = 1
+# Upper bound on simultaneous runs; the CPU/memory budget below usually binds first
+GRADING_MAX_CONCURRENCY = max(1, (os.cpu_count() or 1) * 16)
+GRADING_ADJUST_INTERVAL = 5         # seconds between limit adjustments
+GRADING_SAMPLE_WINDOW = 50          # recent container runs considered
+GRADING_CPU_HIGH = 0.90             # 1-minute load average per core
+GRADING_CPU_LOW = 0.60
+GRADING_MEMORY_HIGH = 0.90          # fraction of host memory in use
+GRADING_MEMORY_LOW = 0.75
+GRADING_TIMEOUT_RATE_HIGH = 0.10    # fraction of recent runs that hit DOCKER_TIMEOUT
+GRADING_SLOW_RUN_FRACTION = 0.50    # a run slower than this fraction of its timeout counts as slow
+# Resource profiles (see grading/profiles.py). Assignments without their own memory, CPU, timeout
+# or output limit use DOCKER_MEMORY_LIMIT, DOCKER_CPU_LIMIT, DOCKER_TIMEOUT and GRADING_OUTPUT_LIMIT.
+GRADING_OUTPUT_LIMIT = "10m"        # output a student program may write in one test run
+# Host budget the concurrency controller packs runs into, according to their profiles
+GRADING_CPU_BUDGET = float(os.cpu_count() or 1)
+GRADING_MEMORY_BUDGET = None        # e.g. "8g"; None means GRADING_MEMORY_BUDGET_FRACTION of host memory
+GRADING_MEMORY_BUDGET_FRACTION = 0.75
+GRADING_MAX_BYPASS = 8              # smaller runs that may start ahead of a waiting one before it gets priority
+GRADING_BUDGET_FILE = DATA_DIR / "grading_budget.json"  # runs admitted by every server process on this host
+GRADING_ADMIT_POLL = 0.25           # seconds between checks for budget freed by other server processes
+GRADING_SUPERSEDE_POLL = 1.0        # seconds between checks for this process's jobs superseded by another
+# Batching queued submissions for the same assignment into one container (see grading/batch.py)
+GRADING_BATCH_MAX_SIZE = 16
+GRADING_BATCH_MAX_WAIT = 0.25       # seconds the first queued submission waits for others to join
+GRADING_BATCH_UID_BASE = 20000      # submission i of a batch runs as UID base + i inside the container
+# Compiled-binary artifact store (see grading/artifacts.py)
+ARTIFACT_DIR = BASE_DIR / "artifacts"
+ARTIFACT_MAX_BYTES = 2 * 1024 ** 3          # least recently used binaries are evicted beyond this
+ARTIFACT_MAX_FILE_BYTES = 64 * 1024 ** 2    # larger binaries are not stored
+ARTIFACT_TOOLCHAIN_TTL = 30                 # seconds before the Docker image / host g++ is identified again
+ARTIFACT_RESCAN_INTERVAL = 300              # seconds before the store's size is recounted from disk
+# Reaping leaked containers and files (see grading/lifecycle.py)
+LIFECYCLE_REAP_INTERVAL = 60        # seconds between reaper passes
+LIFECYCLE_DEADLINE_GRACE = 30       # seconds past a container's timeout before it counts as expired
+LIFECYCLE_STALE_AFTER = 900         # seconds before an unclaimed temp directory or upload zip is removed
+LIFECYCLE_JOB_RETENTION = 86400     # seconds a finished grading job's latest event is kept for /jobs/{job_id}
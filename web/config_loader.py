@@ -1,97 +1,357 @@
-# Handles loading configuration from config.json into the database
+# Handles loading configuration from config.txt into the database
 # and creating a default admin user if none exists
 
+import asyncio
+import fcntl
+import hashlib
 import json
-import subprocess
-from pathlib import Path
+import os
+from contextlib import contextmanager
 from datetime import date
+from typing import Dict, List, Optional
 from .database import SessionLocal, Users, Assignments, Autograders, Tests
 from .auth import hash_password
-from .config import AUTOGRADER_DIR
+from .catalog import invalidate_catalog, invalidate_student
+from .analytics import invalidate_analytics
+from .config import CONFIG_FILE, CONFIG_POLL_INTERVAL, CONFIG_SNAPSHOT_FILE, CONFIG_LOCK_FILE
+from .grading.profiles import parse_profile
 
-def load_config_to_database():
-    """Load configuration from config.txt using the C++ config_parser."""
+class ConfigError(ValueError):
+    pass
+
+# File state of the last config.txt that was applied, used to skip unchanged reloads, and the
+# names it defined per table ("names"), so a reload only deletes rows that came from config.txt,
+# never ones created on the admin pages.
+# Persisted to CONFIG_SNAPSHOT_FILE so new workers can skip reading config.txt entirely.
+_loaded_state = {"mtime_ns": None, "size": None, "sha256": None, "names": None}
+
+def _read_snapshot():
     try:
-        config_parser_path = AUTOGRADER_DIR / "config_parser"
-        
-        if not config_parser_path.exists():
-            print("Config parser executable not found. Attempting to compile...")
-            compile_result = subprocess.run(
-                ["clang++", "-std=c++20", "-DCONFIG_PARSER_MAIN", "-o", "config_parser", "config.cpp", "date.cpp"],
-                cwd=AUTOGRADER_DIR,
-                capture_output=True,
-                text=True
-            )
-            if compile_result.returncode != 0:
-                print(f"Failed to compile config parser: {compile_result.stderr}")
-                return False
-        
-        result = subprocess.run(
-            [str(config_parser_path)],
-            cwd=AUTOGRADER_DIR,
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode != 0:
-            print(f"Config parser failed: {result.stderr}")
-            return False
-        
+        with open(CONFIG_SNAPSHOT_FILE) as f:
+            snapshot = json.load(f)
+        _loaded_state.update({key: snapshot.get(key) for key in _loaded_state})
+    except (OSError, json.JSONDecodeError):
+        pass
+
+def _write_snapshot():
+    tmp_path = CONFIG_SNAPSHOT_FILE.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(_loaded_state, f)
+    os.replace(tmp_path, CONFIG_SNAPSHOT_FILE)
+
+@contextmanager
+def _config_lock():
+    """Serialize config loads across worker processes."""
+    with open(CONFIG_LOCK_FILE, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
         try:
-            config_data = json.loads(result.stdout)
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse config JSON: {e}")
-            print(f"Parser output: {result.stdout}")
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _is_unchanged(stat) -> bool:
+    return _loaded_state["mtime_ns"] == stat.st_mtime_ns and _loaded_state["size"] == stat.st_size
+
+def _parse_value(text: str, line_number: int):
+    """Parse a {...} value into nested Python lists of strings.
+
+    Supports quoted strings (which may contain commas and \\" escapes), bare
+    tokens such as numbers, and nested [...] lists.
+    """
+    pos = 0
+
+    def error(message):
+        return ConfigError(f"Line {line_number}: {message}")
+
+    def skip_whitespace():
+        nonlocal pos
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+
+    def parse_item():
+        nonlocal pos
+        skip_whitespace()
+        if pos >= len(text):
+            raise error("unexpected end of value")
+        char = text[pos]
+        if char in "[{":
+            return parse_sequence("]" if char == "[" else "}")
+        if char == '"':
+            pos += 1
+            chars = []
+            while pos < len(text) and text[pos] != '"':
+                if text[pos] == "\\" and pos + 1 < len(text):
+                    pos += 1
+                chars.append(text[pos])
+                pos += 1
+            if pos >= len(text):
+                raise error("unterminated string")
+            pos += 1
+            return "".join(chars)
+        start = pos
+        while pos < len(text) and text[pos] not in ",]}" and not text[pos].isspace():
+            pos += 1
+        if start == pos:
+            raise error(f"unexpected '{char}'")
+        return text[start:pos]
+
+    def parse_sequence(closing):
+        nonlocal pos
+        pos += 1
+        items = []
+        skip_whitespace()
+        if pos < len(text) and text[pos] == closing:
+            pos += 1
+            return items
+        while True:
+            items.append(parse_item())
+            skip_whitespace()
+            if pos < len(text) and text[pos] == ",":
+                pos += 1
+            elif pos < len(text) and text[pos] == closing:
+                pos += 1
+                return items
+            else:
+                raise error(f"expected ',' or '{closing}'")
+
+    skip_whitespace()
+    if not text.startswith("{", pos):
+        raise error("value must start with '{'")
+    value = parse_item()
+    skip_whitespace()
+    if pos != len(text):
+        raise error("unexpected text after closing '}'")
+    return value
+
+def parse_config(text: str) -> Dict:
+    """Parse config.txt contents into {"assignments": ..., "autograders": ..., "tests": ..., "profiles": ...}."""
+    config = {"assignments": {}, "autograders": {}, "tests": {}, "profiles": {}}
+    section = None
+
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith("###"):
+            header = line.lstrip("#").strip().lower()
+            section = header if header in config else None
+            continue
+
+        if "=" not in line or section is None:
+            continue
+
+        name, value = (part.strip() for part in line.split("=", 1))
+        items = _parse_value(value, line_number)
+
+        if section == "assignments":
+            if len(items) != 3 or any(isinstance(item, list) for item in items):
+                raise ConfigError(f"Line {line_number}: expected {{\"description\", \"YYYY-MM-DD\", \"autograder\"}}")
+            description, due_date, autograder = items
+            try:
+                parsed_due = date.fromisoformat(due_date) if due_date else None
+            except ValueError:
+                raise ConfigError(f"Line {line_number}: invalid due date '{due_date}'")
+            config["assignments"][name] = {
+                "description": description,
+                "due_date": parsed_due,
+                "autograder": autograder
+            }
+        elif section == "autograders":
+            if len(items) != 2 or not all(isinstance(item, list) for item in items):
+                raise ConfigError(f"Line {line_number}: expected {{[outputs], [weights]}}")
+            outputs, weights = items
+            if len(outputs) != len(weights):
+                raise ConfigError(f"Line {line_number}: {len(outputs)} outputs but {len(weights)} weights")
+            try:
+                weights = [int(weight) for weight in weights]
+            except ValueError:
+                raise ConfigError(f"Line {line_number}: weights must be integers")
+            config["autograders"][name] = {"outputs": outputs, "weights": weights}
+        elif section == "tests":
+            if len(items) != 2 or not isinstance(items[1], list) or isinstance(items[0], list):
+                raise ConfigError(f"Line {line_number}: expected {{\"assignment\", [inputs]}}")
+            config["tests"][name] = {"assignment": items[0], "inputs": items[1]}
+        elif section == "profiles":
+            # Assignment = {"memory", cpus, timeout_seconds, "output limit"}; "" keeps the default
+            if len(items) != 4 or any(isinstance(item, list) for item in items):
+                raise ConfigError(f"Line {line_number}: expected {{\"memory\", cpus, timeout_seconds, \"output_limit\"}}")
+            try:
+                config["profiles"][name] = parse_profile(*items)
+            except ValueError as e:
+                raise ConfigError(f"Line {line_number}: {e}")
+
+    unknown = sorted(set(config["profiles"]) - set(config["assignments"]))
+    if unknown:
+        raise ConfigError(f"Profiles for unknown assignments: {', '.join(unknown)}")
+    return config
+
+def _json_equal(stored: Optional[str], value) -> bool:
+    try:
+        return json.loads(stored) == value if stored is not None else False
+    except json.JSONDecodeError:
+        return False
+
+def config_names(config: Dict) -> Dict[str, List[str]]:
+    """The names config defines per table, as recorded in the snapshot."""
+    return {table: sorted(config[table]) for table in ("autograders", "assignments", "tests")}
+
+def diff_config(db, config: Dict, previous: Optional[Dict[str, List[str]]] = None) -> Dict[str, Dict[str, List]]:
+    """Compare parsed config against the database.
+
+    Returns {"autograders"|"assignments"|"tests"|"profiles": {"upsert": [...], "delete": [...]}}
+    where upserts are (name, data) pairs and deletes are primary keys. Only rows named by the
+    previously applied config (previous, from config_names) are deleted when config drops them;
+    rows created on the admin pages are left alone. Profiles are only ever upserted: an
+    assignment without a profile line keeps the one set on the admin page.
+    """
+    diff = {}
+    previous = previous or {}
+
+    def dropped(table, existing, wanted):
+        return [name for name in previous.get(table, []) if name in existing and name not in wanted]
+
+    existing = {ag.name: ag for ag in db.query(Autograders).all()}
+    wanted = config["autograders"]
+    diff["autograders"] = {
+        "upsert": [(name, data) for name, data in wanted.items()
+                   if name not in existing
+                   or not _json_equal(existing[name].outputs, data["outputs"])
+                   or not _json_equal(existing[name].grade_weights, data["weights"])],
+        "delete": dropped("autograders", existing, wanted)
+    }
+
+    existing = {a.assignment_id: a for a in db.query(Assignments).all()}
+    wanted = config["assignments"]
+    diff["assignments"] = {
+        "upsert": [(name, data) for name, data in wanted.items()
+                   if name not in existing
+                   or existing[name].description != data["description"]
+                   or existing[name].due_date != data["due_date"]
+                   or existing[name].autograder != data["autograder"]],
+        "delete": dropped("assignments", existing, wanted)
+    }
+
+    diff["profiles"] = {
+        "upsert": [(name, data) for name, data in config["profiles"].items()
+                   if name not in existing
+                   or any(getattr(existing[name], column) != value for column, value in data.items())],
+        "delete": []
+    }
+
+    existing = {t.test_id: t for t in db.query(Tests).all()}
+    wanted = config["tests"]
+    diff["tests"] = {
+        "upsert": [(name, data) for name, data in wanted.items()
+                   if name not in existing
+                   or existing[name].assignment_id != data["assignment"]
+                   or not _json_equal(existing[name].input_data, data["inputs"])],
+        "delete": dropped("tests", existing, wanted)
+    }
+
+    return diff
+
+def apply_config_diff(db, diff: Dict[str, Dict[str, List]]):
+    """Apply a diff from diff_config. The caller owns the transaction."""
+    for name in diff["tests"]["delete"]:
+        db.query(Tests).filter(Tests.test_id == name).delete()
+    for name in diff["assignments"]["delete"]:
+        db.query(Assignments).filter(Assignments.assignment_id == name).delete()
+    for name in diff["autograders"]["delete"]:
+        db.query(Autograders).filter(Autograders.name == name).delete()
+
+    for name, data in diff["autograders"]["upsert"]:
+        db.merge(Autograders(
+            name=name,
+            outputs=json.dumps(data["outputs"]),
+            grade_weights=json.dumps(data["weights"])
+        ))
+    for name, data in diff["assignments"]["upsert"]:
+        db.merge(Assignments(
+            assignment_id=name,
+            description=data["description"],
+            due_date=data["due_date"],
+            autograder=data["autograder"]
+        ))
+    # Profiles may belong to assignments created just above, which merge() only finds once flushed
+    db.flush()
+    for name, data in diff["profiles"]["upsert"]:
+        db.merge(Assignments(assignment_id=name, **data))
+    for name, data in diff["tests"]["upsert"]:
+        db.merge(Tests(
+            test_id=name,
+            assignment_id=data["assignment"],
+            input_data=json.dumps(data["inputs"])
+        ))
+
+def load_config_to_database(force: bool = False) -> bool:
+    """Load config.txt into the database, applying only what changed.
+
+    Cheap no-op when the file's mtime/size or content hash matches the last load
+    by any worker. Returns False if the file could not be read or parsed; the
+    database is left untouched.
+    """
+    try:
+        stat = os.stat(CONFIG_FILE)
+    except OSError as e:
+        print(f"Cannot read config file {CONFIG_FILE}: {e}")
+        return False
+
+    if not force and _is_unchanged(stat):
+        return True
+
+    with _config_lock():
+        # Another worker may have applied this version while we waited for the lock
+        _read_snapshot()
+        if not force and _is_unchanged(stat):
+            return True
+
+        raw = CONFIG_FILE.read_bytes()
+        sha256 = hashlib.sha256(raw).hexdigest()
+        if not force and _loaded_state["sha256"] == sha256:
+            _loaded_state.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            _write_snapshot()
+            return True
+
+        try:
+            config = parse_config(raw.decode("utf-8"))
+        except (ConfigError, UnicodeDecodeError) as e:
+            print(f"Failed to parse config: {e}")
             return False
-        
+
         db = SessionLocal()
-        
-        # Clear existing data
-        db.query(Tests).delete()
-        db.query(Autograders).delete()
-        db.query(Assignments).delete()
-        
-        # Add autograders
-        for name, data in config_data.get("autograders", {}).items():
-            autograder = Autograders(
-                name=name,
-                outputs=json.dumps(data["outputs"]),
-                grade_weights=json.dumps(data["weights"])
-            )
-            db.add(autograder)
-            print(f"Added autograder: {name}")
-        
-        # Add assignments
-        for name, data in config_data.get("assignments", {}).items():
-            assignment = Assignments(
-                assignment_id=name,
-                description=data["description"],
-                due_date=date.fromisoformat(data["due_date"]) if data["due_date"] else None,
-                autograder=data["autograder"]
-            )
-            db.add(assignment)
-            print(f"Added assignment: {name}")
-        
-        # Add tests
-        for name, data in config_data.get("tests", {}).items():
-            test = Tests(
-                test_id=name,
-                assignment_id=data["assignment"],
-                input_data=json.dumps(data["inputs"])
-            )
-            db.add(test)
-            print(f"Added test: {name}")
-        
-        db.commit()
-        db.close()
-        print("Successfully loaded config data to database")
-        return True
-        
-    except Exception as e:
-        print(f"Error loading config to database: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+        try:
+            diff = diff_config(db, config, _loaded_state["names"])
+            apply_config_diff(db, diff)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Error loading config to database: {e}")
+            return False
+        finally:
+            db.close()
+
+        _loaded_state.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size, sha256=sha256, names=config_names(config))
+        _write_snapshot()
+
+    if diff["assignments"]["upsert"] or diff["assignments"]["delete"] or diff["profiles"]["upsert"]:
+        invalidate_catalog()
+        invalidate_student()
+        invalidate_analytics()
+
+    for table, changes in diff.items():
+        for name, _ in changes["upsert"]:
+            print(f"Upserted {table[:-1]}: {name}")
+        for name in changes["delete"]:
+            print(f"Deleted {table[:-1]}: {name}")
+    print("Successfully loaded config data to database")
+    return True
+
+async def watch_config(interval: float = CONFIG_POLL_INTERVAL):
+    """Poll config.txt and reload it whenever it changes."""
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(load_config_to_database)
 
 def create_admin_if_not_exists():
     db = SessionLocal()
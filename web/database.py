@@ -1,6 +1,6 @@
 # Defines SQLAlchemy models and db connection
 
-from sqlalchemy import Column, String, Float, Date, create_engine, UniqueConstraint, Text, ForeignKey, DateTime
+from sqlalchemy import Column, String, Float, Integer, Date, create_engine, UniqueConstraint, Text, ForeignKey, DateTime, Index, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -28,6 +28,17 @@ class Assignments(Base):
     description = Column(String)
     due_date = Column(Date)
     autograder = Column(String)
+    # Sandbox backend used to grade submissions; NULL means the deployment default (SANDBOX_BACKEND)
+    sandbox_backend = Column(String)
+    # Optional reference solution (see grading/reference.py); its outputs are the tests' expected outputs
+    reference_sha256 = Column(String)
+    output_normalization = Column(String)  # comma-separated REFERENCE_NORMALIZATIONS; NULL uses the default
+    partial_credit = Column(Integer)       # 1: points in proportion to matching lines; NULL means 1
+    # Resource profile (see grading/profiles.py); NULL fields use the deployment defaults
+    memory_limit = Column(String)          # docker-style size such as "256m"
+    cpu_limit = Column(Float)              # CPUs
+    grading_timeout = Column(Integer)      # seconds for a whole grading run
+    output_limit = Column(String)          # output per test run, e.g. "1m"
     submissions = relationship("Submissions", back_populates="assignment")
 
 class Autograders(Base):
@@ -41,8 +52,28 @@ class Tests(Base):
     test_id = Column(String, primary_key=True)
     assignment_id = Column(String, ForeignKey('assignments.assignment_id'))
     input_data = Column(Text)
+    # Optional performance budgets; budget_points are awarded when every set budget is met
+    time_budget_ms = Column(Integer)
+    memory_budget_kb = Column(Integer)
+    budget_points = Column(Integer)
+    # Wall/CPU time limit per run of this test; NULL uses the grader's default (DEFAULT_TEST_TIMEOUT)
+    timeout_seconds = Column(Float)
+    # Points for matching the reference solution's output; NULL uses REFERENCE_DEFAULT_POINTS
+    points = Column(Integer)
     assignment = relationship("Assignments")
 
+# Cached output of the assignment's reference solution for each test. version hashes the test
+# definition and the solution zip, so a row is stale as soon as either changes.
+class ReferenceOutputs(Base):
+    __tablename__ = "reference_outputs"
+    test_id = Column(String, primary_key=True)
+    assignment_id = Column(String, nullable=False, index=True)
+    version = Column(String, nullable=False)
+    status = Column(String)
+    exit_code = Column(Integer)
+    output = Column(Text)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
 class Submissions(Base):
     __tablename__ = "submissions"
     id = Column(String, primary_key=True)
@@ -65,6 +96,98 @@ class Submissions(Base):
         self.submission_time = submission_time
         self.grade = grade
 
+# Resource usage of the latest run of each test for a student's submission
+class TestResults(Base):
+    __tablename__ = "test_results"
+    id = Column(String, primary_key=True)
+    user_id = Column(String, ForeignKey('users.user_id'), nullable=False)
+    assignment_id = Column(String, ForeignKey('assignments.assignment_id'), nullable=False)
+    test_id = Column(String, nullable=False)
+    run_time = Column(DateTime, default=datetime.utcnow)
+    status = Column(String)
+    exit_code = Column(Integer)
+    wall_ms = Column(Integer)
+    user_cpu_ms = Column(Integer)
+    sys_cpu_ms = Column(Integer)
+    max_rss_kb = Column(Integer)
+    budget_points = Column(Integer)
+    budget_out_of = Column(Integer)
+    reference_points = Column(Integer)
+    reference_out_of = Column(Integer)
+    
+    def __init__(self, user_id, assignment_id, test_id, **metrics):
+        self.id = f"{user_id}_{assignment_id}_{test_id}"
+        self.user_id = user_id
+        self.assignment_id = assignment_id
+        self.test_id = test_id
+        for key, value in metrics.items():
+            setattr(self, key, value)
+
+# Code-similarity index (see similarity.py); submission_id is the Submissions.id format
+class SimilarityDocuments(Base):
+    __tablename__ = "similarity_documents"
+    submission_id = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False)
+    assignment_id = Column(String, nullable=False, index=True)
+    zip_sha256 = Column(String)
+    token_count = Column(Integer)
+    fingerprint_count = Column(Integer)
+    indexed_at = Column(DateTime, default=datetime.utcnow)
+
+# Inverted index: winnowed fingerprint -> submissions of the assignment that contain it
+class SimilarityFingerprints(Base):
+    __tablename__ = "similarity_fingerprints"
+    assignment_id = Column(String, primary_key=True)
+    fingerprint = Column(Integer, primary_key=True)
+    submission_id = Column(String, primary_key=True, index=True)
+
+# MinHash LSH buckets: submissions sharing any (band, bucket) are candidate matches
+class SimilarityBuckets(Base):
+    __tablename__ = "similarity_buckets"
+    assignment_id = Column(String, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    band = Column(Integer, primary_key=True)
+    submission_id = Column(String, primary_key=True, index=True)
+
+class SimilarityPairs(Base):
+    __tablename__ = "similarity_pairs"
+    id = Column(String, primary_key=True)
+    assignment_id = Column(String, nullable=False, index=True)
+    submission_a = Column(String, nullable=False, index=True)
+    submission_b = Column(String, nullable=False, index=True)
+    user_a = Column(String)
+    user_b = Column(String)
+    similarity = Column(Float)   # Jaccard similarity of the fingerprint sets
+    containment = Column(Float)  # shared fingerprints / fingerprints of the smaller submission
+    shared_fingerprints = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+# Grading jobs of every server process (see grading/jobs.py). Any worker can look up a job's
+# latest event, or mark a job another worker runs as superseded by a newer upload.
+class GradingJobs(Base):
+    __tablename__ = "grading_jobs"
+    job_id = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False)
+    assignment_id = Column(String, nullable=False)
+    owner = Column(String, nullable=False, index=True)  # "host:pid" of the server process running it
+    created_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)                       # NULL while queued or grading
+    superseded_by = Column(String)                       # job id of the newer upload
+    event = Column(Text)                                 # latest event, as JSON
+
+    __table_args__ = (
+        Index("ix_grading_jobs_student", "user_id", "assignment_id"),
+    )
+
+# Events published by each server process, relayed to the event streams open on the others
+class GradingEvents(Base):
+    __tablename__ = "grading_events"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    origin = Column(String, nullable=False)  # "host:pid" of the publishing process
+    user_id = Column(String, nullable=False)
+    data = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -73,4 +196,18 @@ def get_db():
         db.close()
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    """Create missing tables and add columns introduced since the database was created."""
+    Base.metadata.create_all(bind=engine)
+    
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+                    print(f"Migrated: added {table.name}.{column.name}")
+
+def db_initialized() -> bool:
+    return inspect(engine).has_table(Users.__tablename__)
\ No newline at end of file
@@ -0,0 +1,153 @@
+# In-process pub/sub that pushes grading updates to browsers over server-sent events.
+# Grading jobs publish to a user's channel; every open /events stream of that user gets the event.
+# An idle subscriber is a small bounded queue plus a sleeping coroutine, so thousands of open
+# streams cost little memory. The latest event of each recent job is kept for clients that
+# reconnect or poll /jobs/{job_id} instead.
+# With several server processes, a student's stream may be open on another worker than the one
+# grading their upload. Every EVENTS_RELAY_INTERVAL each process writes the events it published
+# to the grading_events table and delivers the ones the other processes wrote to its own streams.
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from sqlalchemy import func
+from .config import (EVENTS_QUEUE_SIZE, EVENTS_KEEPALIVE, EVENTS_JOB_HISTORY, EVENTS_RELAY_INTERVAL,
+                     EVENTS_RELAY_RETENTION)
+from .database import SessionLocal, GradingEvents, GradingJobs
+from .grading.lifecycle import process_owner
+
+class Subscription:
+    __slots__ = ("user_id", "queue")
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+
+    def put(self, message: str):
+        # A slow client only misses stale updates; the newest event always gets through
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+class EventBus:
+    """Per-user channels of grading events. Must be used from the event loop thread."""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._jobs: "OrderedDict[str, Tuple[str, Dict]]" = OrderedDict()
+        self._next_id = 0
+        # Published here and not yet written for the other processes
+        self._outbox: List[Tuple[str, Dict]] = []
+        self._last_relayed: Optional[int] = None
+        self._last_pruned = 0.0
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id: str, event: Dict):
+        """Send an event (a dict with at least "job_id" and "stage") to all of user_id's streams.
+
+        The SSE event name is the event's "kind", "grading" by default.
+        """
+        self._deliver(user_id, event)
+        self._outbox.append((user_id, event))
+
+    def _deliver(self, user_id: str, event: Dict):
+        self._next_id += 1
+        job_id = event.get("job_id")
+        if job_id:
+            self._jobs[job_id] = (user_id, event)
+            self._jobs.move_to_end(job_id)
+            while len(self._jobs) > EVENTS_JOB_HISTORY:
+                self._jobs.popitem(last=False)
+
+        subscribers = self._subscribers.get(user_id)
+        if subscribers:
+            message = f"id: {self._next_id}\nevent: {event.get('kind', 'grading')}\ndata: {json.dumps(event, default=str)}\n\n"
+            for subscription in subscribers:
+                subscription.put(message)
+
+    def job_status(self, user_id: str, job_id: str) -> Optional[Dict]:
+        entry = self._jobs.get(job_id)
+        if entry is not None:
+            return entry[1] if entry[0] == user_id else None
+        # Finished before this process started, or its events were pruned before it relayed them
+        db = SessionLocal()
+        job = db.query(GradingJobs).filter(GradingJobs.job_id == job_id, GradingJobs.user_id == user_id).first()
+        db.close()
+        return json.loads(job.event) if job is not None and job.event else None
+
+    def _exchange(self, outgoing: List[Tuple[str, Dict]]) -> List[Tuple[str, Dict]]:
+        """Write outgoing events for the other processes and return theirs since the last call. Blocking."""
+        db = SessionLocal()
+        try:
+            if self._last_relayed is None:
+                # Events from before this process started were delivered by the others
+                self._last_relayed = db.query(func.max(GradingEvents.id)).scalar() or 0
+            for user_id, event in outgoing:
+                data = json.dumps(event, default=str)
+                db.add(GradingEvents(origin=process_owner(), user_id=user_id, data=data))
+                if event.get("job_id"):
+                    db.query(GradingJobs).filter(GradingJobs.job_id == event["job_id"]).update({"event": data})
+            db.commit()
+
+            # SQLite commits one writer at a time, so ids become visible in order
+            incoming = []
+            rows = db.query(GradingEvents).filter(GradingEvents.id > self._last_relayed).order_by(GradingEvents.id)
+            for row in rows:
+                self._last_relayed = row.id
+                if row.origin != process_owner():
+                    incoming.append((row.user_id, json.loads(row.data)))
+
+            if time.monotonic() - self._last_pruned > EVENTS_RELAY_RETENTION / 10:
+                self._last_pruned = time.monotonic()
+                cutoff = datetime.utcnow() - timedelta(seconds=EVENTS_RELAY_RETENTION)
+                db.query(GradingEvents).filter(GradingEvents.created_at < cutoff).delete()
+                db.commit()
+            return incoming
+        finally:
+            db.close()
+
+    async def run_relay(self, interval: float = EVENTS_RELAY_INTERVAL):
+        """Exchange events with the other server processes every interval seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            outgoing, self._outbox = self._outbox, []
+            try:
+                incoming = await asyncio.to_thread(self._exchange, outgoing)
+            except Exception as e:
+                print(f"Event relay failed, {len(outgoing)} event(s) not relayed: {e}")
+                continue
+            for user_id, event in incoming:
+                self._deliver(user_id, event)
+
+    def connection_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    async def stream(self, user_id: str) -> AsyncIterator[str]:
+        """Yield SSE messages for user_id until the client goes away, with keep-alive comments."""
+        subscription = self.subscribe(user_id)
+        try:
+            # Tells EventSource how long to wait before reconnecting
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+event_bus = EventBus()
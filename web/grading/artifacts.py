@@ -0,0 +1,269 @@
+# Store of compiled submission binaries, so a submission is unzipped and built only once.
+# A binary is keyed by the sha256 of the submission zip, the assignment it was built for and the
+# toolchain that built it (the Docker image, or the host's g++ for the namespace sandbox). When
+# a submission is graded again (new tests, an admin regrade, a retry after a timeout) the sandbox
+# gets the stored binary and the autograder skips unzip and make. Fresh builds are exported by the
+# autograder into a per-run directory and collected here afterwards; submissions that ship data
+# files next to their sources are never exported, since the binary alone would not reproduce them.
+# The submission's tests run after the export and could overwrite it, so an export is stored only
+# if it matches the digest the autograder printed before any test ran.
+# Entries are evicted least recently used first once the store outgrows ARTIFACT_MAX_BYTES. The
+# store's size is kept as a running total, recounted from disk only when it passes the limit or is
+# ARTIFACT_RESCAN_INTERVAL old (other server processes store binaries too).
+
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from ..config import (ARTIFACT_DIR, ARTIFACT_MAX_BYTES, ARTIFACT_MAX_FILE_BYTES, ARTIFACT_TOOLCHAIN_TTL,
+                      ARTIFACT_RESCAN_INTERVAL, DOCKER_IMAGE, PRECOMPILED_HEADERS)
+from .docker_api import docker_client, DockerAPIError, DockerTimeout
+
+STORE_DIR = ARTIFACT_DIR / "store"
+# Per-run directories, mounted writable into the sandbox; the reaper removes abandoned ones
+INCOMING_DIR = ARTIFACT_DIR / "incoming"
+EXPORT_MARKER = "EXPORTED_BINARY "
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def exported_digest(output: Optional[str]) -> Optional[str]:
+    """SHA-256 of the binary a submission's autograder output says it exported, or None.
+
+    The program's own output never reaches the grader's stdout unquoted, so the line is the grader's.
+    """
+    for line in (output or "").split("\n"):
+        if line.startswith(EXPORT_MARKER):
+            try:
+                digest = json.loads(line[len(EXPORT_MARKER):])["sha256"]
+            except (json.JSONDecodeError, KeyError, TypeError):
+                return None
+            return digest if isinstance(digest, str) else None
+    return None
+
+class ArtifactRun:
+    """Artifact directory of one sandbox run: the stored binaries it may use and where it exports new ones.
+
+    Mounted into Docker containers as a whole; the namespace sandbox binds it writable in place.
+    """
+
+    def __init__(self, path: Path, keys: List[Optional[str]], prebuilt: List[Optional[Path]]):
+        self.path = path
+        self.keys = keys          # one per submission, None when it can't be stored
+        self.prebuilt = prebuilt  # stored binary per submission, copied into path/
+        self.out = path / "out"
+
+    def prebuilt_in(self, index: int, mount: Optional[str] = None) -> str:
+        """Path of submission index's stored binary as the sandbox sees it, or "" if there is none."""
+        prebuilt = self.prebuilt[index]
+        if prebuilt is None:
+            return ""
+        return f"{mount}/{prebuilt.name}" if mount else str(prebuilt)
+
+class ArtifactStore:
+    """Content-addressed binaries with LRU eviction. Thread-safe; the sandboxes call it from worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._toolchains: Dict[str, Tuple[Optional[str], float]] = {}  # backend -> (toolchain, when identified)
+        self._size: Optional[int] = None  # bytes in the store, as of the last scan plus what was stored since
+        self._scanned = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+
+    def toolchain(self, backend: str) -> Optional[str]:
+        """Identify the compiler a backend builds with; None if it can't be determined.
+
+        Looked up again after ARTIFACT_TOOLCHAIN_TTL, so binaries of a replaced image stop being used.
+        """
+        cached = self._toolchains.get(backend)
+        if cached and time.monotonic() - cached[1] < ARTIFACT_TOOLCHAIN_TTL:
+            return cached[0]
+        toolchain = None
+        if backend == "docker":
+            # A rebuilt image must not reuse binaries built by the old one
+            try:
+                image = docker_client.inspect_image(DOCKER_IMAGE)
+                toolchain = f"docker:{image['Id']}" if image else None
+            except (DockerAPIError, DockerTimeout, OSError) as e:
+                print(f"DEBUG: Cannot identify the Docker image: {e}")
+        else:
+            try:
+                version = subprocess.run(["g++", "--version"], capture_output=True, text=True, timeout=10).stdout
+                toolchain = "host:" + hashlib.sha256((version + platform.machine()).encode()).hexdigest()[:16]
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f"DEBUG: Cannot identify the host toolchain: {e}")
+        if toolchain:
+            # A build with the forced precompiled header may not compile without it
+            if PRECOMPILED_HEADERS:
+                toolchain += ":pch"
+            self._toolchains[backend] = (toolchain, time.monotonic())
+        return toolchain
+
+    def key(self, zip_path: Path, assignment_id: str, toolchain: Optional[str]) -> Optional[str]:
+        if toolchain is None:
+            return None
+        try:
+            zip_digest = _file_digest(zip_path)
+        except OSError:
+            return None
+        return hashlib.sha256(f"{zip_digest}\0{assignment_id}\0{toolchain}".encode()).hexdigest()
+
+    def prepare(self, zip_paths: List[Path], assignment_id: str, backend: str,
+                shared_out: bool = True) -> Optional[ArtifactRun]:
+        """Set up the artifact directory for a run grading zip_paths; None if artifacts are unavailable.
+
+        With shared_out, any user may write the export directory, as the unprivileged grader user of a
+        single Docker run must. A batch leaves that to the autograder running as root, which gives each
+        submission's UID only its own export directory. Either way the submission can write its export,
+        which is why collect() checks it against the autograder's digest.
+        """
+        toolchain = self.toolchain(backend)
+        if toolchain is None:
+            return None
+        try:
+            INCOMING_DIR.mkdir(parents=True, exist_ok=True)
+            STORE_DIR.mkdir(parents=True, exist_ok=True)
+            path = Path(tempfile.mkdtemp(prefix="run_", dir=INCOMING_DIR))
+            (path / "out").mkdir()
+            # Container users differ from the server's; they read the stored binaries and may write exports
+            path.chmod(0o755)
+            (path / "out").chmod(0o777 if shared_out else 0o755)
+        except OSError as e:
+            print(f"DEBUG: Artifact store unavailable: {e}")
+            return None
+
+        keys, prebuilt = [], []
+        for index, zip_path in enumerate(zip_paths):
+            key = self.key(zip_path, assignment_id, toolchain)
+            keys.append(key)
+            prebuilt.append(self._copy_in(key, path / f"prebuilt_{index}") if key else None)
+        with self._lock:
+            found = sum(1 for link in prebuilt if link)
+            self.hits += found
+            self.misses += len(prebuilt) - found
+        return ArtifactRun(path, keys, prebuilt)
+
+    def _copy_in(self, key: str, copy: Path) -> Optional[Path]:
+        """Copy a stored binary into a run. A copy, not a link: the sandbox can write the run's directory."""
+        stored = STORE_DIR / key
+        try:
+            shutil.copyfile(stored, copy)
+            copy.chmod(0o755)
+            # Recently used entries are evicted last
+            os.utime(stored)
+            return copy
+        except OSError:
+            return None
+
+    def collect(self, run: Optional[ArtifactRun], assignment_id: str, subdirs: List[str],
+                outputs: List[Optional[str]]):
+        """Store the binaries a run exported and remove its directory.
+
+        subdirs holds each submission's export directory below run.out ("" for a single run), and
+        outputs its autograder output, which names the digest of the export (see exported_digest).
+        Binaries are exported right after the build, so a run that later timed out still leaves a usable
+        one, as long as its output came back.
+        """
+        if run is None:
+            return
+        try:
+            for key, subdir, output in zip(run.keys, subdirs, outputs):
+                digest = exported_digest(output)
+                if key is None or digest is None:
+                    continue
+                binary = run.out / subdir / assignment_id
+                # The sandbox wrote it: a symlink could point anywhere on this host
+                if not binary.is_symlink() and binary.is_file() and not (STORE_DIR / key).exists():
+                    self._store(key, binary, digest)
+        finally:
+            shutil.rmtree(run.path, ignore_errors=True)
+        self.evict()
+
+    def _store(self, key: str, binary: Path, digest: str):
+        size = binary.stat().st_size
+        if size > ARTIFACT_MAX_FILE_BYTES:
+            print(f"DEBUG: Not storing a {size} byte binary; over ARTIFACT_MAX_FILE_BYTES")
+            return
+        # The export may belong to a sandbox user, so copy rather than move it into the store,
+        # and check the copy, which the sandbox can no longer change
+        tmp_path = STORE_DIR / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            shutil.copyfile(binary, tmp_path)
+            if _file_digest(tmp_path) != digest:
+                print(f"DEBUG: Not storing binary {key[:12]}: it changed after the autograder exported it")
+                tmp_path.unlink()
+                return
+            tmp_path.chmod(0o755)
+            os.replace(tmp_path, STORE_DIR / key)
+            with self._lock:
+                self.stored += 1
+                if self._size is not None:
+                    self._size += size
+        except OSError as e:
+            print(f"DEBUG: Failed to store binary {key[:12]}: {e}")
+            tmp_path.unlink(missing_ok=True)
+
+    def evict(self):
+        """Remove least recently used binaries until the store fits ARTIFACT_MAX_BYTES.
+
+        Lists the store only when the running total says it may not fit, or the total is stale.
+        """
+        with self._lock:
+            if (self._size is not None and self._size <= ARTIFACT_MAX_BYTES
+                    and time.monotonic() - self._scanned < ARTIFACT_RESCAN_INTERVAL):
+                return
+        entries = []
+        for path in STORE_DIR.glob("*"):
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= ARTIFACT_MAX_BYTES:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            with self._lock:
+                self.evicted += 1
+        with self._lock:
+            self._size = total
+            self._scanned = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        entries = [path for path in STORE_DIR.glob("*") if not path.name.startswith(".")] if STORE_DIR.exists() else []
+        size = 0
+        for path in entries:
+            try:
+                size += path.stat().st_size
+            except OSError:
+                pass
+        with self._lock:
+            return {
+                "entries": len(entries),
+                "bytes": size,
+                "max_bytes": ARTIFACT_MAX_BYTES,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stored": self.stored,
+                "evicted": self.evicted,
+            }
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,155 @@
+# Groups queued submissions for the same assignment into batches so one autograder
+# invocation (one container start, one load of the tests and autograder) grades many students.
+# A batch is dispatched as soon as it reaches GRADING_BATCH_MAX_SIZE, or GRADING_BATCH_MAX_WAIT
+# seconds after its first submission arrived, whichever comes first. A lone submission that finds
+# a free grading slot is dispatched right away: waiting would only delay it.
+# The autograder delimits each submission's output with BATCH_ITEM_BEGIN/END markers carrying a
+# random nonce made for the batch. Submissions can print too, but don't know the nonce, so a
+# marker without it is just part of the submission's output.
+
+import asyncio
+import hmac
+import json
+import re
+import secrets
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from ..config import GRADING_BATCH_MAX_SIZE, GRADING_BATCH_MAX_WAIT
+from .concurrency import grading_controller
+from .profiles import profile_for
+
+BATCH_MARKER = re.compile(r"^BATCH_ITEM_(BEGIN|END) (\S+) (\{.*\})\s*$")
+
+def new_batch_nonce() -> str:
+    return secrets.token_hex(16)
+
+def match_batch_marker(line: str, nonce: str) -> Optional[Tuple[str, Dict]]:
+    """("BEGIN" or "END", marker fields) if line is a marker of the batch with this nonce, else None."""
+    match = BATCH_MARKER.match(line)
+    if not match or not hmac.compare_digest(match.group(2), nonce):
+        return None
+    try:
+        marker = json.loads(match.group(3))
+    except json.JSONDecodeError:
+        return None
+    return (match.group(1), marker) if isinstance(marker, dict) else None
+
+def split_batch_output(output: str, count: int, nonce: str) -> List[Dict]:
+    """Split the autograder's --batch output into one result per submission.
+
+    Each result is shaped like a single run's {"output", "error"[, "timed_out"]}, so the
+    usual parsers can be applied to it. Submissions without an end marker (the container
+    was killed first) are reported as timed out.
+    """
+    results = [{"error": "Execution timeout - program took too long to run", "timed_out": True} for _ in range(count)]
+    current, lines = None, []
+
+    # Split on newlines only, as the autograder does; splitlines() would also break at \r, \x1c etc.
+    for line in output.split("\n"):
+        kind, marker = match_batch_marker(line, nonce) or (None, {})
+        index = marker.get("index")
+        if not isinstance(index, int) or not 0 <= index < count:
+            if current is not None:
+                lines.append(line + "\n")
+            continue
+
+        if kind == "BEGIN":
+            current, lines = index, []
+        elif index == current:
+            item_output = "".join(lines)
+            if marker.get("timed_out"):
+                results[index] = {"output": item_output, "error": "Execution timeout - program took too long to run",
+                                  "timed_out": True}
+            else:
+                exit_code = marker.get("exit_code", 1)
+                results[index] = {"output": item_output,
+                                  "error": f"Autograder exited with code {exit_code}" if exit_code != 0 else None}
+            current, lines = None, []
+
+    return results
+
+@dataclass
+class _QueuedSubmission:
+    zip_path: Path
+    student_id: str
+    future: asyncio.Future
+    progress: Optional[Callable[[Dict], None]] = None
+    job_id: Optional[str] = None
+
+class BatchScheduler:
+    """Collects submissions per (backend, assignment) and grades them in batches.
+
+    Each dispatched batch takes one slot, sized by the assignment's resource profile, from the
+    grading concurrency controller.
+    Must be used from the event loop thread.
+    """
+
+    def __init__(self, max_size: int = GRADING_BATCH_MAX_SIZE, max_wait: float = GRADING_BATCH_MAX_WAIT):
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._queues: Dict[Tuple[str, str], List[_QueuedSubmission]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._backends: Dict[str, object] = {}
+        self._running: Set[asyncio.Task] = set()
+
+    async def submit(self, backend, zip_path: Path, student_id: str, assignment_id: str,
+                     progress: Optional[Callable[[Dict], None]] = None, job_id: Optional[str] = None) -> Dict:
+        loop = asyncio.get_running_loop()
+        key = (backend.name, assignment_id)
+        self._backends[backend.name] = backend
+
+        queued = _QueuedSubmission(zip_path, student_id, loop.create_future(), progress, job_id)
+        queue = self._queues.setdefault(key, [])
+        queue.append(queued)
+        if len(queue) >= self.max_size:
+            self._dispatch(key)
+        elif len(queue) == 1 and grading_controller.has_room(backend.admission_profile(profile_for(assignment_id))):
+            self._dispatch(key)
+        elif len(queue) == 1:
+            self._timers[key] = loop.call_later(self.max_wait, self._dispatch, key)
+
+        return await queued.future
+
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _dispatch(self, key: Tuple[str, str]):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        # Submissions whose grading job went away (cancelled, e.g. superseded) are not graded
+        items = [item for item in self._queues.pop(key, []) if not item.future.done()]
+        if not items:
+            return
+        task = asyncio.create_task(self._run(self._backends[key[0]], key[1], items))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, backend, assignment_id: str, items: List[_QueuedSubmission]):
+        profile = profile_for(assignment_id)
+        async with grading_controller.slot(backend.admission_profile(profile)):
+            started = time.monotonic()
+            try:
+                if len(items) == 1:
+                    results = [await asyncio.to_thread(backend.run, items[0].zip_path, items[0].student_id,
+                                                       assignment_id, items[0].progress, items[0].job_id)]
+                else:
+                    print(f"DEBUG: Grading batch of {len(items)} submissions for {assignment_id}")
+                    results = await asyncio.to_thread(
+                        backend.run_batch, [(item.zip_path, item.student_id) for item in items], assignment_id,
+                        [item.progress for item in items]
+                    )
+            except Exception as e:
+                print(f"DEBUG: Batch grading failed: {e}")
+                results = [{"error": f"Grading failed: {e}"}] * len(items)
+
+            # The controller reasons about per-submission run times
+            per_item = (time.monotonic() - started) / len(items)
+            for item, result in zip(items, results):
+                grading_controller.record_run(per_item, result.get("timed_out", False), profile.timeout)
+                if not item.future.done():
+                    item.future.set_result(result)
+
+batch_scheduler = BatchScheduler()
@@ -0,0 +1,348 @@
+# Admission control for grading runs (containers, namespace sandboxes, reference runs).
+# Each run reserves its assignment's CPUs and memory (see profiles.py); waiting runs are packed
+# into the host's CPU/memory budget first-fit, so many light runs can share the room of one heavy
+# run. On top of that, an adaptive limit on the number of simultaneous runs moves between
+# admin-set bounds based on host CPU/memory pressure, recent run times and the rate of timeouts.
+# The limit starts where the CPU budget fits default-profile runs, and is re-evaluated every
+# GRADING_ADJUST_INTERVAL while runs are waiting (run_adjuster), not only when one starts or ends.
+# The budget and the limit are for the whole host: every server process records the runs it
+# admits in a shared ledger file (GRADING_BUDGET_FILE) and admits against all of them. Room freed
+# by another process is picked up every GRADING_ADMIT_POLL seconds.
+
+import asyncio
+import fcntl
+import itertools
+import json
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from statistics import median
+from typing import Dict, List, Optional
+from ..config import (
+    DOCKER_TIMEOUT,
+    GRADING_MIN_CONCURRENCY, GRADING_MAX_CONCURRENCY, GRADING_ADJUST_INTERVAL, GRADING_SAMPLE_WINDOW,
+    GRADING_CPU_HIGH, GRADING_CPU_LOW, GRADING_MEMORY_HIGH, GRADING_MEMORY_LOW,
+    GRADING_TIMEOUT_RATE_HIGH, GRADING_SLOW_RUN_FRACTION,
+    GRADING_CPU_BUDGET, GRADING_MEMORY_BUDGET, GRADING_MEMORY_BUDGET_FRACTION, GRADING_MAX_BYPASS,
+    GRADING_BUDGET_FILE, GRADING_ADMIT_POLL,
+)
+from .docker_api import parse_memory
+from .lifecycle import owner_alive, process_owner
+from .profiles import ResourceProfile, DEFAULT_PROFILE
+
+def read_cpu_pressure() -> Optional[float]:
+    """1-minute load average per core, or None if the platform doesn't report it."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+def _read_meminfo() -> Dict[str, int]:
+    meminfo = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            meminfo[key] = int(value.split()[0])
+    return meminfo
+
+def read_memory_pressure() -> Optional[float]:
+    """Fraction of host memory in use according to /proc/meminfo (Linux only)."""
+    try:
+        meminfo = _read_meminfo()
+        return 1.0 - meminfo["MemAvailable"] / meminfo["MemTotal"]
+    except (OSError, KeyError, ValueError, ZeroDivisionError):
+        return None
+
+def default_memory_budget() -> int:
+    """Bytes of memory grading runs may reserve: GRADING_MEMORY_BUDGET, or a fraction of host memory."""
+    if GRADING_MEMORY_BUDGET:
+        return parse_memory(GRADING_MEMORY_BUDGET)
+    try:
+        return int(_read_meminfo()["MemTotal"] * 1024 * GRADING_MEMORY_BUDGET_FRACTION)
+    except (OSError, KeyError, ValueError):
+        # Can't tell (not Linux): room for one default run per CPU
+        return int(DEFAULT_PROFILE.memory * max(1, GRADING_CPU_BUDGET))
+
+class BudgetLedger:
+    """Grading runs admitted by every server process on the host, in a JSON file kept under flock.
+
+    The file holds {"runs": {token: {"owner", "cpus", "memory"}}, "bounds": [min, max]}. Runs of
+    processes that have exited are dropped whenever it is updated.
+    """
+
+    def __init__(self, path: Path = GRADING_BUDGET_FILE):
+        self.path = path
+        self._warned = False
+
+    @contextmanager
+    def update(self, own: Dict[str, Dict]):
+        """Lock the ledger and yield its state for changing in place; it is written back afterwards.
+
+        own holds this process's runs. If the file can't be used, the state holds just those, so
+        this process keeps grading within the budget on its own.
+        """
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            f = open(self.path, "a+")
+        except OSError as e:
+            if not self._warned:
+                print(f"WARNING: Cannot open {self.path}; budgeting this server process's runs only: {e}")
+                self._warned = True
+            yield {"runs": dict(own)}
+            return
+        with f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                state = json.loads(f.read() or "{}")
+            except json.JSONDecodeError:
+                state = {}
+            me = process_owner()
+            state["runs"] = {token: run for token, run in state.get("runs", {}).items()
+                             if (token in own if run.get("owner") == me else owner_alive(run.get("owner", "")))}
+            yield state
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+
+@dataclass(eq=False)
+class _Waiter:
+    cpus: float
+    memory: int
+    future: asyncio.Future
+    bypassed: int = 0  # runs started ahead of this one
+    token: Optional[str] = None  # its entry in the ledger once admitted
+
+class ConcurrencyController:
+    """Must be used from the event loop thread.
+
+    active, cpu_reserved and memory_reserved count the runs of every server process on the host,
+    as of the last look at the ledger.
+    """
+
+    def __init__(self, min_limit: int = GRADING_MIN_CONCURRENCY, max_limit: int = GRADING_MAX_CONCURRENCY,
+                 cpu_budget: float = GRADING_CPU_BUDGET, memory_budget: Optional[int] = None,
+                 ledger: Optional[BudgetLedger] = None):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        # As many default-profile runs as the CPU budget holds; pressure moves it from there
+        self.limit = min(max(int(cpu_budget / DEFAULT_PROFILE.cpus), self.min_limit), self.max_limit)
+        self.active = 0
+        self.cpu_budget = cpu_budget
+        self.memory_budget = memory_budget or default_memory_budget()
+        self.cpu_reserved = 0.0
+        self.memory_reserved = 0
+        self.cpu_pressure = None
+        self.memory_pressure = None
+        self.last_decision = f"Starting at {self.limit}: {cpu_budget:g} CPUs of budget / {DEFAULT_PROFILE.cpus:g} per run"
+        self.last_adjusted = None
+        self._runs = deque(maxlen=GRADING_SAMPLE_WINDOW)  # (duration_seconds, timed_out, slow)
+        self._waiters: List[_Waiter] = []  # in arrival order
+        self.ledger = ledger or BudgetLedger()
+        self._own: Dict[str, Dict] = {}  # ledger token -> run, for this process's admitted runs
+        self._tokens = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def slot(self, profile: Optional[ResourceProfile] = None):
+        """Wait until a run with profile fits and hold its share for the duration of the block.
+
+        A run fits when a slot is free and its CPUs and memory fit in what the running ones
+        left of the budget; one bigger than the whole budget runs when nothing else does.
+        """
+        profile = profile or DEFAULT_PROFILE
+        waiter = _Waiter(profile.cpus, profile.memory, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self.adjust()
+        self._admit()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            else:
+                # Admitted just before the waiting task was cancelled
+                self._release(waiter)
+            raise
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    def _fits(self, cpus: float, memory: int) -> bool:
+        if self.active >= self.limit:
+            return False
+        if self.active == 0:
+            return True
+        return (self.cpu_reserved + cpus <= self.cpu_budget + 1e-9
+                and self.memory_reserved + memory <= self.memory_budget)
+
+    def has_room(self, profile: Optional[ResourceProfile] = None) -> bool:
+        """Whether a run with profile would start right away, as of the last look at the ledger."""
+        profile = profile or DEFAULT_PROFILE
+        return not self._waiters and self._fits(profile.cpus, profile.memory)
+
+    def _admit(self, released: Optional[str] = None):
+        """Drop the released run from the ledger, then start waiting runs that fit, oldest first.
+
+        A run that fits may start ahead of an older one that doesn't (first-fit packing), but
+        after GRADING_MAX_BYPASS such overtakes the older run is next, so big runs don't starve.
+        """
+        with self.ledger.update(self._own) as state:
+            runs = state["runs"]
+            runs.pop(released, None)
+            self._apply_bounds(state.get("bounds"))
+            self.active = len(runs)
+            self.cpu_reserved = sum(run["cpus"] for run in runs.values())
+            self.memory_reserved = sum(run["memory"] for run in runs.values())
+
+            blocked = None
+            for waiter in list(self._waiters):
+                if self.active >= self.limit:
+                    break
+                if waiter.future.done():
+                    continue  # cancelled; its task removes it
+                if self._fits(waiter.cpus, waiter.memory):
+                    self._waiters.remove(waiter)
+                    waiter.token = f"{process_owner()}:{next(self._tokens)}"
+                    runs[waiter.token] = self._own[waiter.token] = {
+                        "owner": process_owner(), "cpus": waiter.cpus, "memory": waiter.memory}
+                    self.active += 1
+                    self.cpu_reserved += waiter.cpus
+                    self.memory_reserved += waiter.memory
+                    waiter.future.set_result(None)
+                    if blocked is not None:
+                        blocked.bypassed += 1
+                elif blocked is None:
+                    blocked = waiter
+                if blocked is not None and blocked.bypassed >= GRADING_MAX_BYPASS:
+                    break
+
+    def _release(self, waiter: _Waiter):
+        self._own.pop(waiter.token, None)
+        self._admit(released=waiter.token)
+
+    def refresh(self):
+        """Start waiting runs that fit in room other server processes freed."""
+        self._admit()
+
+    def record_run(self, duration: float, timed_out: bool, timeout: float = DOCKER_TIMEOUT):
+        self._runs.append((duration, timed_out, duration > timeout * GRADING_SLOW_RUN_FRACTION))
+        self.adjust()
+
+    def set_bounds(self, min_limit: int, max_limit: int):
+        """Set the bounds of every server process on the host; the others apply them at their next admission."""
+        if min_limit < 1 or max_limit < min_limit:
+            raise ValueError("Bounds must satisfy 1 <= min <= max")
+        with self.ledger.update(self._own) as state:
+            state["bounds"] = [min_limit, max_limit]
+        self._admit()
+
+    def _apply_bounds(self, bounds: Optional[List[int]]):
+        if not bounds or (bounds[0], bounds[1]) == (self.min_limit, self.max_limit):
+            return
+        self.min_limit, self.max_limit = bounds[0], bounds[1]
+        self.limit = min(max(self.limit, self.min_limit), self.max_limit)
+        self.last_decision = f"Bounds set to {self.min_limit}-{self.max_limit} by admin"
+
+    def timeout_rate(self) -> float:
+        if not self._runs:
+            return 0.0
+        return sum(1 for _, timed_out, _ in self._runs if timed_out) / len(self._runs)
+
+    def slow_rate(self) -> float:
+        if not self._runs:
+            return 0.0
+        return sum(1 for _, _, slow in self._runs if slow) / len(self._runs)
+
+    def adjust(self, force: bool = False):
+        """Re-evaluate the limit at most once per GRADING_ADJUST_INTERVAL."""
+        now = time.monotonic()
+        if not force and self.last_adjusted is not None and now - self.last_adjusted < GRADING_ADJUST_INTERVAL:
+            return
+        self.last_adjusted = now
+
+        self.cpu_pressure = read_cpu_pressure()
+        self.memory_pressure = read_memory_pressure()
+        cpu = self.cpu_pressure or 0.0
+        memory = self.memory_pressure or 0.0
+        timeout_rate = self.timeout_rate()
+        slow_rate = self.slow_rate()
+
+        previous = self.limit
+        if memory > GRADING_MEMORY_HIGH:
+            self.limit = max(self.min_limit, self.limit - max(1, self.limit // 4))
+            reason = f"memory pressure {memory:.0%}"
+        elif timeout_rate > GRADING_TIMEOUT_RATE_HIGH:
+            self.limit = max(self.min_limit, self.limit - max(1, self.limit // 4))
+            reason = f"timeout rate {timeout_rate:.0%}"
+        elif cpu > GRADING_CPU_HIGH:
+            self.limit = max(self.min_limit, self.limit - 1)
+            reason = f"CPU load {cpu:.2f} per core"
+        elif slow_rate > GRADING_TIMEOUT_RATE_HIGH:
+            self.limit = max(self.min_limit, self.limit - 1)
+            reason = f"{slow_rate:.0%} of runs close to the timeout"
+        elif self.waiting > 0 and self.active >= self.limit and cpu < GRADING_CPU_LOW and memory < GRADING_MEMORY_LOW:
+            # Light runs can pack many to a host, so grow in proportion rather than one at a time
+            self.limit = min(self.max_limit, self.limit + max(1, self.limit // 4))
+            reason = f"{self.waiting} queued with headroom (CPU {cpu:.2f}, memory {memory:.0%})"
+        else:
+            return
+
+        if self.limit > previous:
+            self.last_decision = f"Raised limit {previous} -> {self.limit}: {reason}"
+            self._admit()
+        elif self.limit < previous:
+            self.last_decision = f"Lowered limit {previous} -> {self.limit}: {reason}"
+        else:
+            self.last_decision = f"Holding at {self.limit}: {reason}"
+        print(f"DEBUG: Grading concurrency - {self.last_decision}")
+
+    def snapshot(self) -> Dict:
+        durations = [duration for duration, _, _ in self._runs]
+        return {
+            "limit": self.limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "active": self.active,
+            "process_active": len(self._own),
+            "waiting": self.waiting,
+            "cpu_budget": self.cpu_budget,
+            "cpu_reserved": self.cpu_reserved,
+            "memory_budget": self.memory_budget,
+            "memory_reserved": self.memory_reserved,
+            "cpu_pressure": self.cpu_pressure,
+            "memory_pressure": self.memory_pressure,
+            "timeout_rate": self.timeout_rate(),
+            "median_run_seconds": median(durations) if durations else None,
+            "sampled_runs": len(durations),
+            "last_decision": self.last_decision,
+        }
+
+grading_controller = ConcurrencyController()
+
+async def run_adjuster(controller: ConcurrencyController = grading_controller,
+                       interval: float = GRADING_ADJUST_INTERVAL, poll: float = GRADING_ADMIT_POLL):
+    """While runs are waiting, admit them into room other server processes freed every poll
+    seconds, and re-evaluate the controller's limit every interval seconds.
+
+    Without this, a burst that fills every slot is only re-evaluated when a run of this process finishes.
+    """
+    last_adjusted = time.monotonic()
+    while True:
+        await asyncio.sleep(poll)
+        if not controller.waiting:
+            continue
+        try:
+            controller.refresh()
+            if time.monotonic() - last_adjusted >= interval:
+                last_adjusted = time.monotonic()
+                controller.adjust(force=True)
+        except Exception as e:
+            print(f"Grading concurrency adjustment failed: {e}")
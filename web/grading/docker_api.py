@@ -0,0 +1,238 @@
+# Minimal Docker Engine API client that talks HTTP over the Docker Unix socket.
+# Keeps a pool of keep-alive connections so grading does not fork the docker CLI
+# (and open a fresh API connection) for every image check, run and kill.
+
+import http.client
+import json
+import queue
+import socket
+import struct
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+from ..config import DOCKER_SOCKET, DOCKER_API_VERSION, DOCKER_API_POOL_SIZE, DOCKER_API_TIMEOUT
+
+class DockerAPIError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+class DockerTimeout(TimeoutError):
+    pass
+
+def _protocol_error(e: http.client.HTTPException) -> DockerAPIError:
+    # A garbled or truncated response (status 0: no HTTP status was received)
+    return DockerAPIError(0, f"{type(e).__name__}: {e}")
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+def parse_memory(value: str) -> int:
+    """Convert a docker-style memory string such as '128m' to bytes."""
+    units = {"b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    value = str(value).strip().lower()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+def demux_frames(chunks: Iterator[bytes]) -> Iterator[Tuple[int, bytes]]:
+    """Split Docker's multiplexed log stream into (stream, payload) frames.
+
+    Each frame has an 8-byte header: stream type (1 = stdout, 2 = stderr),
+    three padding bytes and a big-endian payload length.
+    """
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= 8:
+            stream, size = buffer[0], struct.unpack(">I", buffer[4:8])[0]
+            if len(buffer) < 8 + size:
+                break
+            yield stream, buffer[8:8 + size]
+            buffer = buffer[8 + size:]
+
+class DockerClient:
+    def __init__(self, socket_path: str = DOCKER_SOCKET, pool_size: int = DOCKER_API_POOL_SIZE,
+                 timeout: float = DOCKER_API_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a pooled connection.
+
+        Callers set conn.keep_alive once they have consumed the whole response; any
+        other outcome (errors, abandoned streams) closes the connection instead.
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = UnixHTTPConnection(self.socket_path, self.timeout)
+        conn.keep_alive = False
+        try:
+            yield conn
+        finally:
+            if conn.keep_alive:
+                try:
+                    self._pool.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+            else:
+                conn.close()
+
+    def _path(self, path: str, params: Optional[Dict] = None) -> str:
+        url = f"/{DOCKER_API_VERSION}{path}"
+        if params:
+            url += "?" + urlencode(params)
+        return url
+
+    def _send(self, conn, method: str, path: str, body=None, params=None, timeout=None):
+        headers = {"Host": "docker"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        reused = conn.sock is not None
+        for attempt in range(2):
+            if conn.sock is None:
+                conn.connect()
+            conn.sock.settimeout(timeout if timeout is not None else self.timeout)
+            try:
+                conn.request(method, self._path(path, params), body=payload, headers=headers)
+                return conn.getresponse()
+            except (http.client.HTTPException, BrokenPipeError, ConnectionResetError) as e:
+                # The daemon may close idle keep-alive connections; retry once on a fresh one
+                conn.close()
+                if not reused or attempt == 1:
+                    if isinstance(e, OSError):
+                        raise
+                    raise _protocol_error(e)
+
+    def request(self, method: str, path: str, body=None, params=None, timeout=None):
+        """Send a request and return the decoded JSON body (or None for empty responses)."""
+        with self._connection() as conn:
+            try:
+                response = self._send(conn, method, path, body, params, timeout)
+                data = response.read()
+            except socket.timeout:
+                raise DockerTimeout(f"{method} {path} timed out")
+            except http.client.HTTPException as e:
+                raise _protocol_error(e)
+            conn.keep_alive = not response.will_close
+        if response.status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except (json.JSONDecodeError, AttributeError):
+                message = data.decode("utf-8", "replace")
+            raise DockerAPIError(response.status, message)
+        return json.loads(data) if data else None
+
+    def stream(self, method: str, path: str, params=None, deadline: Optional[float] = None) -> Iterator[bytes]:
+        """Yield raw body chunks as they arrive. Raises DockerTimeout once time.monotonic() passes deadline."""
+        with self._connection() as conn:
+            try:
+                response = self._send(conn, method, path, params=params, timeout=self._remaining(deadline))
+                if response.status >= 400:
+                    raise DockerAPIError(response.status, response.read().decode("utf-8", "replace"))
+                while True:
+                    conn.sock.settimeout(self._remaining(deadline))
+                    chunk = response.read1(65536)
+                    if not chunk:
+                        break
+                    yield chunk
+            except socket.timeout:
+                raise DockerTimeout(f"{method} {path} timed out")
+            except http.client.HTTPException as e:
+                raise _protocol_error(e)
+            conn.keep_alive = not response.will_close
+
+    def _remaining(self, deadline: Optional[float]) -> float:
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DockerTimeout("deadline exceeded")
+        return remaining
+
+    # Engine API operations
+
+    def ping(self) -> bool:
+        try:
+            with self._connection() as conn:
+                response = self._send(conn, "GET", "/_ping")
+                response.read()
+                conn.keep_alive = not response.will_close
+            return response.status == 200
+        except (OSError, DockerAPIError, http.client.HTTPException):
+            return False
+
+    def inspect_image(self, image: str) -> Optional[Dict]:
+        try:
+            return self.request("GET", f"/images/{quote(image, safe='/:')}/json")
+        except DockerAPIError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def create_container(self, name: str, image: str, cmd: List[str], host_config: Dict,
+                         labels: Optional[Dict[str, str]] = None, env: Optional[List[str]] = None,
+                         user: Optional[str] = None) -> str:
+        body = {
+            "Image": image,
+            "Cmd": cmd,
+            "Labels": labels or {},
+            "Env": env or [],
+            "NetworkDisabled": True,
+            "HostConfig": host_config,
+        }
+        if user is not None:
+            body["User"] = user
+        return self.request("POST", "/containers/create", body=body, params={"name": name})["Id"]
+
+    def start(self, container_id: str):
+        self.request("POST", f"/containers/{container_id}/start")
+
+    def wait(self, container_id: str, timeout: float) -> int:
+        """Block until the container exits and return its exit code."""
+        result = self.request("POST", f"/containers/{container_id}/wait", timeout=timeout)
+        return result.get("StatusCode", -1)
+
+    def logs(self, container_id: str, follow: bool = False, deadline: Optional[float] = None) -> Iterator[Tuple[int, bytes]]:
+        """Yield (stream, data) frames; with follow=True this streams until the container exits."""
+        params = {"stdout": 1, "stderr": 1, "follow": int(follow)}
+        return demux_frames(self.stream("GET", f"/containers/{container_id}/logs", params=params, deadline=deadline))
+
+    def kill(self, container_id: str, signal: str = "KILL"):
+        try:
+            self.request("POST", f"/containers/{container_id}/kill", params={"signal": signal})
+        except DockerAPIError as e:
+            # 404: already gone, 409: not running
+            if e.status not in (404, 409):
+                raise
+
+    def remove(self, container_id: str, force: bool = True):
+        try:
+            self.request("DELETE", f"/containers/{container_id}", params={"force": int(force)})
+        except DockerAPIError as e:
+            if e.status != 404:
+                raise
+
+    def list_containers(self, labels: Optional[List[str]] = None, all: bool = True) -> List[Dict]:
+        params = {"all": int(all)}
+        if labels:
+            params["filters"] = json.dumps({"label": labels})
+        return self.request("GET", "/containers/json", params=params)
+
+docker_client = DockerClient()
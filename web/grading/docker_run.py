@@ -1,68 +1,267 @@
+# Docker sandbox backend: runs the autograder in a fresh container through the Engine API.
+# Containers get job-scoped names and labels from the lifecycle manager, which reaps any that leak.
+# Memory, CPUs, timeout and output limit come from the assignment's resource profile.
+# Submissions built before run from the artifact store's binary (artifacts.py), mounted at /artifacts.
+
+import shutil
 import subprocess
+import tempfile
+import time
 from pathlib import Path
-from datetime import datetime
-from typing import Dict
-from ..config import DOCKER_IMAGE, DOCKER_MEMORY_LIMIT, DOCKER_CPU_LIMIT, DOCKER_TIMEOUT, BASE_DIR, DATA_DIR
+from typing import Callable, Dict, List, Optional, Tuple
+from ..config import DOCKER_IMAGE, BASE_DIR, DATA_DIR, GRADING_BATCH_UID_BASE, PRECOMPILED_HEADERS, PCH_BIN_DIR
+from .artifacts import artifact_store, ArtifactRun
+from .docker_api import docker_client, DockerAPIError, DockerTimeout
+from .batch import new_batch_nonce, split_batch_output
+from .lifecycle import lifecycle, new_job_id
+from .profiles import ResourceProfile, profile_for
+from .progress import ProgressReader, ProgressCallback
+
+AUTOGRADER_COMMAND = "./autograding_src/autograder"
+ARTIFACT_MOUNT = "/artifacts"
+
+def ensure_image() -> bool:
+    """Make sure DOCKER_IMAGE exists, building it with the docker CLI if it doesn't.
+
+    Building through the API would mean streaming a tar of the build context;
+    this only happens once per host, so the CLI is good enough here.
+    """
+    if docker_client.inspect_image(DOCKER_IMAGE) is not None:
+        return True
+
+    print("DEBUG: Docker image not found, building...")
+    build_result = subprocess.run(
+        ["docker", "build", "-t", DOCKER_IMAGE, str(BASE_DIR)],
+        capture_output=True, text=True, timeout=300
+    )
+    if build_result.returncode != 0:
+        print(f"DEBUG: Docker build failed: {build_result.stderr}")
+        return False
+    return True
 
-async def run_autograder(zip_path: Path, autograder_filename: str, student_id: str, assignment_id: str) -> Dict:
-    """Run Docker container to grade submission."""
+def _host_config(binds: List[str], profile: ResourceProfile) -> Dict:
+    return {
+        "Memory": profile.memory,
+        "NanoCpus": int(profile.cpus * 1e9),
+        "NetworkMode": "none",
+        "SecurityOpt": ["no-new-privileges:false"],
+        "Tmpfs": {"/tmp": "exec,size=100m"},
+        "Binds": binds + [f"{DATA_DIR}:/data:ro"],
+    }
+
+def _grading_env(profile: ResourceProfile) -> List[str]:
+    # Docker's cgroup already limits memory; the autograder caps each test's output itself
+    return [f"AUTOGRADER_OUTPUT_LIMIT_KB={max(1, profile.output_limit // 1024)}",
+            f"AUTOGRADER_PCH_BIN={PCH_BIN_DIR if PRECOMPILED_HEADERS else ''}"]
+
+def _artifact_env(artifacts: ArtifactRun, index: Optional[int] = None) -> List[str]:
+    """Tell the autograder where to export new builds and, for a single run, its stored binary."""
+    env = [f"AUTOGRADER_ARTIFACT_OUT={ARTIFACT_MOUNT}/out"]
+    if index is not None and artifacts.prebuilt[index]:
+        env.append(f"AUTOGRADER_ARTIFACT_IN={artifacts.prebuilt_in(index, ARTIFACT_MOUNT)}")
+    return env
+
+def _run(job_id: str, container_name: str, cmd: List[str], host_config: Dict, timeout: float,
+         labels: Dict[str, str], env: Optional[List[str]] = None, user: Optional[str] = None,
+         on_output: Optional[Callable[[bytes], None]] = None) -> Dict:
+    """Create, start and follow a container until it exits or timeout passes, then remove it.
+
+    Returns {"exit_code", "output", "error_output", "timed_out"}; output collected before a
+    timeout is kept. on_output is called with each chunk of stdout as it arrives. Docker API
+    errors propagate to the caller. A container that can't be removed stays tracked and is
+    left to the reaper.
+    """
+    container_id = None
+    stdout, stderr = [], []
+    try:
+        print(f"DEBUG: Creating container {container_name}: {' '.join(cmd)}")
+        container_id = docker_client.create_container(container_name, DOCKER_IMAGE, cmd, host_config,
+                                                      labels=labels, env=env, user=user)
+        lifecycle.track(container_id, container_name, job_id, time.time() + timeout)
+        docker_client.start(container_id)
+        if lifecycle.cancelled(job_id):
+            # Cancelled while the container was being created, too early for cancel_job to kill it
+            docker_client.kill(container_id)
+
+        # Stream logs until the container exits or the deadline passes
+        deadline = time.monotonic() + timeout
+        try:
+            for stream, data in docker_client.logs(container_id, follow=True, deadline=deadline):
+                if stream == 2:
+                    stderr.append(data)
+                else:
+                    stdout.append(data)
+                    if on_output:
+                        on_output(data)
+            exit_code = docker_client.wait(container_id, timeout=max(1.0, deadline - time.monotonic()))
+            timed_out = False
+        except DockerTimeout:
+            print(f"DEBUG: Docker container {container_name} timed out")
+            docker_client.kill(container_id)
+            exit_code, timed_out = None, True
+
+        return {
+            "exit_code": exit_code,
+            "output": b"".join(stdout).decode("utf-8", "replace"),
+            "error_output": b"".join(stderr).decode("utf-8", "replace"),
+            "timed_out": timed_out
+        }
+    finally:
+        if container_id:
+            try:
+                docker_client.remove(container_id, force=True)
+                lifecycle.untrack(container_id)
+            except (DockerAPIError, DockerTimeout, OSError) as e:
+                print(f"DEBUG: Failed to remove container {container_name}: {e}")
+
+def run_in_container(zip_path: Path, student_id: str, assignment_id: str,
+                     progress: Optional[ProgressCallback] = None, job_id: Optional[str] = None) -> Dict:
+    """Grade a submission in a new container. Blocking; run it in a worker thread.
+
+    progress is called from this thread with each PROGRESS update the autograder prints.
+    The container belongs to the grading job job_id, if given, so cancelling the job kills it.
+    """
+    job_id = job_id or new_job_id()
+    container_name = lifecycle.container_name(job_id)
+    artifacts = None
+    output = None
     try:
         print(f"DEBUG: Starting grading for {student_id}, assignment {assignment_id}")
-        
-        # Check if image exists
-        check_image = subprocess.run(
-            ["docker", "images", "-q", DOCKER_IMAGE],
-            capture_output=True, text=True
-        )
-        
-        if not check_image.stdout.strip():
-            print("DEBUG: Docker image not found, building...")
-            build_result = subprocess.run(
-                ["docker", "build", "-t", DOCKER_IMAGE, str(BASE_DIR)],
-                capture_output=True, text=True, timeout=300
-            )
-            
-            if build_result.returncode != 0:
-                return {"error": f"Docker build failed: {build_result.stderr}"}
-        
-        container_name = f"grader_{student_id}_{int(datetime.now().timestamp())}"
-        
-        docker_cmd = [
-            "docker", "run", "--rm",
-            "--name", container_name,
-            f"--memory={DOCKER_MEMORY_LIMIT}",
-            f"--cpus={DOCKER_CPU_LIMIT}",
-            "--network=none",
-            "--security-opt", "no-new-privileges:false",
-            "--tmpfs", "/tmp:exec,size=100m",
-            "-v", f"{zip_path}:/input.zip:ro",
-            "-v", f"{DATA_DIR}:/data:ro",
-            DOCKER_IMAGE,
-            "./autograding_src/autograder", "/input.zip", student_id, assignment_id
-        ]
-        
-        print(f"DEBUG: Running Docker command: {' '.join(docker_cmd)}")
-        
-        result = subprocess.run(
-            docker_cmd,
-            capture_output=True,
-            text=True,
-            timeout=DOCKER_TIMEOUT
-        )
-        
-        print(f"DEBUG: Docker exit code: {result.returncode}")
-        print(f"DEBUG: Docker stdout: {result.stdout}")
-        print(f"DEBUG: Docker stderr: {result.stderr}")
-        
+
+        if not ensure_image():
+            return {"error": "Docker build failed"}
+
+        profile = profile_for(assignment_id)
+        cmd = [AUTOGRADER_COMMAND, "/input.zip", student_id, assignment_id]
+        binds = [f"{zip_path}:/input.zip:ro"]
+        env = _grading_env(profile)
+        artifacts = artifact_store.prepare([zip_path], assignment_id, "docker")
+        if artifacts:
+            binds.append(f"{artifacts.path}:{ARTIFACT_MOUNT}")
+            env += _artifact_env(artifacts, 0)
+        host_config = _host_config(binds, profile)
+        labels = lifecycle.labels(job_id, profile.timeout, student=student_id, assignment=assignment_id)
+        result = _run(job_id, container_name, cmd, host_config, profile.timeout, labels, env=env,
+                      on_output=ProgressReader([progress]).feed if progress else None)
+        output = result["output"]
+        if lifecycle.cancelled(job_id):
+            return {"error": "Grading cancelled", "cancelled": True}
+        if result["timed_out"]:
+            return {"error": "Execution timeout - program took too long to run", "timed_out": True}
+
+        print(f"DEBUG: Docker exit code: {result['exit_code']}")
+        print(f"DEBUG: Docker stdout: {result['output']}")
+        print(f"DEBUG: Docker stderr: {result['error_output']}")
+
+        return {
+            "output": result["output"],
+            "error": result["error_output"] if result["exit_code"] != 0 else None
+        }
+
+    except (DockerAPIError, DockerTimeout, OSError) as e:
+        print(f"DEBUG: Exception in run_in_container: {str(e)}")
+        return {"error": f"Docker execution failed: {str(e)}"}
+    finally:
+        artifact_store.collect(artifacts, assignment_id, [""], [output])
+
+def run_reference_in_container(zip_path: Path, assignment_id: str, test_ids: List[str]) -> Dict:
+    """Run an assignment's reference solution on test_ids (autograder --reference). Blocking.
+
+    Returns {"output", "error"[, "timed_out"]} like run_in_container.
+    """
+    job_id = new_job_id()
+    container_name = lifecycle.container_name(job_id, kind="grader_reference")
+    try:
+        print(f"DEBUG: Running reference solution for {assignment_id} on {len(test_ids)} test(s)")
+
+        if not ensure_image():
+            return {"error": "Docker build failed"}
+
+        profile = profile_for(assignment_id)
+        cmd = [AUTOGRADER_COMMAND, "--reference", "/reference.zip", assignment_id]
+        host_config = _host_config([f"{zip_path}:/reference.zip:ro"], profile)
+        env = _grading_env(profile) + ["AUTOGRADER_REFERENCE_TESTS=" + "\n".join(test_ids)]
+        labels = lifecycle.labels(job_id, profile.timeout, assignment=assignment_id)
+        result = _run(job_id, container_name, cmd, host_config, profile.timeout, labels, env=env)
+        if result["timed_out"]:
+            return {"output": result["output"], "error": "Execution timeout - program took too long to run",
+                    "timed_out": True}
+
+        print(f"DEBUG: Reference container exit code: {result['exit_code']}")
         return {
-            "output": result.stdout,
-            "error": result.stderr if result.returncode != 0 else None
+            "output": result["output"],
+            "error": result["error_output"] or f"Autograder exited with code {result['exit_code']}"
+                     if result["exit_code"] != 0 else None
         }
-            
-    except subprocess.TimeoutExpired:
-        print(f"DEBUG: Docker container {container_name} timed out")
-        subprocess.run(["docker", "kill", container_name], capture_output=True)
-        return {"error": "Execution timeout - program took too long to run"}
-    except Exception as e:
-        print(f"DEBUG: Exception in run_autograder: {str(e)}")
-        return {"error": f"Docker execution failed: {str(e)}"}
\ No newline at end of file
+
+    except (DockerAPIError, DockerTimeout, OSError) as e:
+        print(f"DEBUG: Exception in run_reference_in_container: {str(e)}")
+        return {"error": f"Docker execution failed: {str(e)}"}
+
+def run_batch_in_container(items: List[Tuple[Path, str]], assignment_id: str,
+                           progress: Optional[List[Optional[ProgressCallback]]] = None) -> List[Dict]:
+    """Grade several (zip_path, student_id) submissions for one assignment in a single container.
+
+    The autograder runs in --batch mode as root inside the container so it can give each
+    submission its own UID; only the capabilities needed for that are kept. Returns one
+    result per item, in order, shaped like run_in_container's. progress, if given, holds
+    one optional callback per item.
+    """
+    job_id = new_job_id()
+    container_name = lifecycle.container_name(job_id, kind="grader_batch")
+    # Private to the server user; the autograder copies each zip out for its submission's UID
+    batch_dir = Path(tempfile.mkdtemp(prefix="grader_batch_"))
+    artifacts = None
+    outputs = [None] * len(items)
+    try:
+        print(f"DEBUG: Starting batch of {len(items)} for assignment {assignment_id}")
+
+        if not ensure_image():
+            return [{"error": "Docker build failed"}] * len(items)
+
+        artifacts = artifact_store.prepare([zip_path for zip_path, _ in items], assignment_id, "docker",
+                                           shared_out=False)
+        manifest = []
+        for index, (zip_path, student_id) in enumerate(items):
+            shutil.copyfile(zip_path, batch_dir / f"{index}.zip")
+            # A third field points the autograder at the submission's stored binary
+            prebuilt = artifacts.prebuilt_in(index, ARTIFACT_MOUNT) if artifacts else ""
+            manifest.append(f"{student_id}\t/batch/{index}.zip" + (f"\t{prebuilt}" if prebuilt else "") + "\n")
+        (batch_dir / "manifest.txt").write_text("".join(manifest))
+        # Readable only to root in the container: the submissions' UIDs can't enter batch_dir
+        nonce = new_batch_nonce()
+        (batch_dir / "nonce").write_text(nonce + "\n")
+
+        profile = profile_for(assignment_id)
+        cmd = [AUTOGRADER_COMMAND, "--batch", "/batch/manifest.txt", assignment_id]
+        binds = [f"{batch_dir}:/batch:ro"]
+        if artifacts:
+            binds.append(f"{artifacts.path}:{ARTIFACT_MOUNT}")
+        host_config = _host_config(binds, profile)
+        host_config["CapDrop"] = ["ALL"]
+        host_config["CapAdd"] = ["CHOWN", "DAC_OVERRIDE", "FOWNER", "SETUID", "SETGID", "KILL"]
+        # Root here only drops to the item UIDs; nothing it or a submission runs may gain privileges
+        host_config["SecurityOpt"] = ["no-new-privileges:true"]
+        env = _grading_env(profile) + [f"AUTOGRADER_BATCH_UID_BASE={GRADING_BATCH_UID_BASE}",
+                                       f"AUTOGRADER_ITEM_TIMEOUT={profile.timeout}",
+                                       "AUTOGRADER_BATCH_NONCE_FILE=/batch/nonce"]
+        if artifacts:
+            env += _artifact_env(artifacts)
+
+        # Every item gets the profile's timeout inside the container; the extra one covers startup
+        timeout = profile.timeout * (len(items) + 1)
+        labels = lifecycle.labels(job_id, timeout, assignment=assignment_id, batch_size=len(items))
+        result = _run(job_id, container_name, cmd, host_config, timeout, labels, env=env, user="0",
+                      on_output=ProgressReader(progress, nonce).feed if progress else None)
+        if result["error_output"]:
+            print(f"DEBUG: Docker batch stderr: {result['error_output']}")
+        results = split_batch_output(result["output"], len(items), nonce)
+        outputs = [item.get("output") for item in results]
+        return results
+
+    except (DockerAPIError, DockerTimeout, OSError) as e:
+        print(f"DEBUG: Exception in run_batch_in_container: {str(e)}")
+        return [{"error": f"Docker execution failed: {str(e)}"}] * len(items)
+    finally:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        artifact_store.collect(artifacts, assignment_id, [str(index) for index in range(len(items))], outputs)
@@ -1,7 +1,10 @@
 import re
+import json
 from typing import List, Dict
 from datetime import datetime
-from ..database import SessionLocal, Submissions
+from ..database import SessionLocal, Submissions, TestResults
+from ..catalog import invalidate_student
+from ..analytics import record_grade
 
 def parse_grading_output(output: str, expected_student_id: str, expected_assignment_id: str) -> List[Dict]:
     """Parse grading output and extract results."""
@@ -48,9 +51,12 @@ def parse_grading_output(output: str, expected_student_id: str, expected_assignm
                 
                 grade_str = f"{score}/{total}"
                 
-                # Extract output field
-                output_match = re.search(r'"output"\s*:\s*"([^"]*(?:\n[^"]*)*)"', full_json, re.DOTALL)
-                student_output = output_match.group(1) if output_match else ""
+                # Extract output field (a JSON string; the autograder escapes the program's output)
+                output_match = re.search(r'"output"\s*:\s*("(?:[^"\\]|\\.)*")', full_json, re.DOTALL)
+                try:
+                    student_output = json.loads(output_match.group(1)) if output_match else ""
+                except json.JSONDecodeError:
+                    student_output = output_match.group(1)[1:-1]
                 
                 results.append({
                     "assignment": expected_assignment_id,
@@ -74,16 +80,49 @@ def parse_grading_output(output: str, expected_student_id: str, expected_assignm
     
     return results
 
+TEST_METRIC_FIELDS = ("status", "exit_code", "wall_ms", "user_cpu_ms", "sys_cpu_ms",
+                      "max_rss_kb", "budget_points", "budget_out_of", "reference_points", "reference_out_of")
+
+def parse_test_results(output: str) -> List[Dict]:
+    """Extract the per-test {"test_result": {...}} lines the autograder prints."""
+    results = []
+    for line in output.split('\n'):
+        line = line.strip()
+        if not line.startswith('{"test_result"'):
+            continue
+        try:
+            results.append(json.loads(line)["test_result"])
+        except (json.JSONDecodeError, KeyError, TypeError):
+            print(f"DEBUG parse_test_results: Skipping malformed line: {line}")
+    return results
+
+def save_test_results(user_id: str, assignment_id: str, test_results: List[Dict]):
+    """Replace the stored metrics for this student's latest run of each test."""
+    try:
+        db = SessionLocal()
+        run_time = datetime.now()
+        for result in test_results:
+            metrics = {field: result.get(field) for field in TEST_METRIC_FIELDS}
+            db.merge(TestResults(user_id, assignment_id, result["test_id"], run_time=run_time, **metrics))
+        db.commit()
+        db.close()
+    except Exception as e:
+        print(f"Error saving test results: {e}")
+        if 'db' in locals():
+            db.close()
+
+def _grade_percentage(grade_str: str) -> float:
+    if "/" in grade_str:
+        earned, total = grade_str.split("/")
+        return (float(earned) / float(total)) * 100
+    return 0.0
+
 def save_submission_to_db(user_id: str, assignment_id: str, grade_str: str):
     """Save or update submission in database."""
     try:
         print(f"DEBUG save_submission_to_db: Received grade_str='{grade_str}'")
         
-        if "/" in grade_str:
-            earned, total = grade_str.split("/")
-            grade_percentage = (float(earned) / float(total)) * 100
-        else:
-            grade_percentage = 0.0
+        grade_percentage = _grade_percentage(grade_str)
         
         db = SessionLocal()
         
@@ -92,18 +131,21 @@ def save_submission_to_db(user_id: str, assignment_id: str, grade_str: str):
             Submissions.assignment_id == assignment_id
         ).first()
         
+        submission_time = datetime.now()
         if existing:
-            if grade_percentage >= (existing.grade or 0):
+            updated = grade_percentage >= (existing.grade or 0)
+            if updated:
                 existing.grade = grade_percentage
-                existing.submission_time = datetime.now()
+                existing.submission_time = submission_time
                 print(f"Updated submission: {grade_percentage}%")
             else:
                 print(f"Keeping existing grade: {existing.grade}%")
         else:
+            updated = True
             new_submission = Submissions(
                 user_id=user_id,
                 assignment_id=assignment_id,
-                submission_time=datetime.now(),
+                submission_time=submission_time,
                 grade=grade_percentage
             )
             db.add(new_submission)
@@ -111,8 +153,43 @@ def save_submission_to_db(user_id: str, assignment_id: str, grade_str: str):
         
         db.commit()
         db.close()
+        invalidate_student(user_id)
+        if updated:
+            record_grade(user_id, assignment_id, grade_percentage, submission_time)
         
     except Exception as e:
         print(f"Error saving submission: {e}")
         if 'db' in locals():
-            db.close()
\ No newline at end of file
+            db.close()
+
+def save_regrade_to_db(user_id: str, assignment_id: str, grade_str: str):
+    """Replace a student's grade with the regrade of their kept submission.
+
+    Unlike a new upload, the regrade may lower the grade, and the submission keeps its original time.
+    """
+    try:
+        print(f"DEBUG save_regrade_to_db: Received grade_str='{grade_str}'")
+        grade_percentage = _grade_percentage(grade_str)
+
+        db = SessionLocal()
+        existing = db.query(Submissions).filter(
+            Submissions.user_id == user_id,
+            Submissions.assignment_id == assignment_id
+        ).first()
+        if existing is None:
+            # The submission was deleted while it was being regraded
+            db.close()
+            print(f"Regraded submission no longer exists: {user_id} {assignment_id}")
+            return
+        existing.grade = grade_percentage
+        submission_time = existing.submission_time
+        db.commit()
+        db.close()
+        print(f"Regraded submission: {grade_percentage}%")
+        invalidate_student(user_id)
+        record_grade(user_id, assignment_id, grade_percentage, submission_time)
+
+    except Exception as e:
+        print(f"Error saving regrade: {e}")
+        if 'db' in locals():
+            db.close()
@@ -0,0 +1,262 @@
+# Background grading jobs. /upload starts a job and returns its id right away; the job
+# grades the submission, saves the results and publishes each stage (queued, compiling,
+# running test k/N, done or failed) to the student's event stream (see events.py).
+# Graded uploads are then handed to the similarity indexer (see similarity.py). Assignments
+# with a reference solution get their expected outputs brought up to date first (see reference.py).
+# A student has at most one job in flight per assignment: uploading again supersedes the earlier
+# job, which is dropped from the queue or has its sandbox killed. Jobs are recorded in the
+# grading_jobs table, so the worker that takes a new upload also finds an earlier job running on
+# another worker; it marks that job superseded, and the owning worker cancels it within
+# GRADING_SUPERSEDE_POLL (watch_superseded_jobs). Each job grades its own copy of the upload,
+# which replaces the kept submission zip only once it has been graded; until then the reaper
+# leaves it alone.
+# An admin can regrade an assignment's kept submissions, e.g. after adding tests; submissions
+# built before then run from their stored binary (see artifacts.py). A regrade replaces the grade,
+# even with a lower one, and keeps the submission's time.
+
+import asyncio
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import and_, or_
+from ..config import SUBMISSIONS_DIR, GRADING_SUPERSEDE_POLL
+from ..database import SessionLocal, Submissions, GradingJobs
+from ..events import event_bus
+from ..similarity import similarity_indexer
+from .sandbox import run_autograder
+from .grader import (parse_grading_output, save_submission_to_db, save_regrade_to_db, parse_test_results,
+                     save_test_results)
+from .lifecycle import lifecycle, new_job_id
+from .reference import reference_cache
+
+# job_id -> task of each job this process is running
+_tasks: Dict[str, asyncio.Task] = {}
+
+def submission_path(user_id: str, assignment_id: str) -> Path:
+    """The kept zip of a student's latest graded upload for an assignment."""
+    return SUBMISSIONS_DIR / f"{user_id}_{assignment_id}.zip"
+
+def upload_path(user_id: str, assignment_id: str, job_id: str) -> Path:
+    """Where an upload waits while job_id grades it."""
+    return SUBMISSIONS_DIR / f"{user_id}_{assignment_id}.{job_id}.zip"
+
+def _live_jobs(db, user_id: str, assignment_id: str):
+    return db.query(GradingJobs).filter(GradingJobs.user_id == user_id, GradingJobs.assignment_id == assignment_id,
+                                        GradingJobs.finished_at.is_(None), GradingJobs.superseded_by.is_(None))
+
+def _register_job(user_id: str, assignment_id: str, job_id: str, regrade: bool = False) -> Optional[List[str]]:
+    """Record job_id as the student's newest job for the assignment. Blocking.
+
+    Returns the ids of the earlier live jobs it supersedes, or None for a regrade that gives way
+    to a job already in flight (which grades a newer upload anyway).
+    """
+    db = SessionLocal()
+    try:
+        created_at = datetime.utcnow()
+        db.add(GradingJobs(job_id=job_id, user_id=user_id, assignment_id=assignment_id, owner=lifecycle.owner,
+                           created_at=created_at))
+        db.commit()
+        # Every process inserts its job before looking, so of two uploads taken at the same time by
+        # different workers, the later one always finds the earlier
+        others = _live_jobs(db, user_id, assignment_id).filter(GradingJobs.job_id != job_id)
+        if regrade:
+            if others.first() is not None:
+                db.query(GradingJobs).filter(GradingJobs.job_id == job_id).delete()
+                db.commit()
+                return None
+            return []
+        earlier = others.filter(or_(GradingJobs.created_at < created_at,
+                                    and_(GradingJobs.created_at == created_at, GradingJobs.job_id < job_id))).all()
+        superseded = [job.job_id for job in earlier]
+        for job in earlier:
+            job.superseded_by = job_id
+        db.commit()
+        return superseded
+    finally:
+        db.close()
+
+def _finish_job(job_id: str):
+    db = SessionLocal()
+    db.query(GradingJobs).filter(GradingJobs.job_id == job_id).update({"finished_at": datetime.utcnow()})
+    db.commit()
+    db.close()
+
+def _is_superseded(job_id: str) -> bool:
+    db = SessionLocal()
+    job = db.query(GradingJobs).filter(GradingJobs.job_id == job_id).first()
+    db.close()
+    return job is not None and job.superseded_by is not None
+
+def start_grading_job(user_id: str, assignment_id: str, job_id: str, file_path: Path,
+                      filename: str) -> Optional[str]:
+    """Start grading an upload saved at upload_path(...) in the background as job_id.
+
+    Returns the id of the student's earlier job for the assignment that this one superseded, if any.
+    """
+    superseded = _register_job(user_id, assignment_id, job_id)
+    for old_job_id in superseded:
+        _supersede(user_id, assignment_id, old_job_id, job_id)
+    _launch(user_id, assignment_id, job_id, file_path, filename, superseded[-1] if superseded else None)
+    return superseded[-1] if superseded else None
+
+def _launch(user_id: str, assignment_id: str, job_id: str, file_path: Path, filename: str,
+            superseded: Optional[str] = None, regrade: bool = False):
+    # A regrade replaces the student's grade instead of keeping the best one (see save_regrade_to_db)
+    event_bus.publish(user_id, {"job_id": job_id, "assignment_id": assignment_id, "stage": "queued",
+                                "supersedes": superseded})
+    task = asyncio.create_task(_grade(job_id, user_id, assignment_id, file_path, filename, regrade))
+    _tasks[job_id] = task
+
+    def finished(task: asyncio.Task):
+        _tasks.pop(job_id, None)
+        asyncio.get_running_loop().run_in_executor(None, _finish_job, job_id)
+
+    task.add_done_callback(finished)
+
+def _supersede(user_id: str, assignment_id: str, job_id: str, newer_job_id: str):
+    # A job of another process is cancelled by that process once it sees superseded_by
+    print(f"DEBUG: Grading job {job_id} superseded by {newer_job_id}")
+    _cancel(job_id)
+    event_bus.publish(user_id, {"job_id": job_id, "assignment_id": assignment_id, "stage": "superseded",
+                                "superseded_by": newer_job_id})
+
+def _cancel(job_id: str):
+    # Cancelling the task drops a queued submission and discards any result; a sandbox that is
+    # already running has to be killed separately (a Docker batch shared with other students
+    # runs on, and only this student's result is thrown away)
+    task = _tasks.get(job_id)
+    if task is None or task.done():
+        return
+    task.cancel()
+    asyncio.get_running_loop().run_in_executor(None, lifecycle.cancel_job, job_id)
+
+def _superseded_jobs(job_ids: List[str]) -> List[str]:
+    db = SessionLocal()
+    rows = db.query(GradingJobs.job_id).filter(GradingJobs.job_id.in_(job_ids),
+                                               GradingJobs.superseded_by.isnot(None)).all()
+    db.close()
+    return [job_id for (job_id,) in rows]
+
+async def watch_superseded_jobs(interval: float = GRADING_SUPERSEDE_POLL):
+    """Cancel this process's jobs that a newer upload to another process superseded."""
+    while True:
+        await asyncio.sleep(interval)
+        if not _tasks:
+            continue
+        try:
+            superseded = await asyncio.to_thread(_superseded_jobs, list(_tasks))
+        except Exception as e:
+            print(f"Checking for superseded jobs failed: {e}")
+            continue
+        for job_id in superseded:
+            if job_id in _tasks:
+                print(f"DEBUG: Grading job {job_id} was superseded on another server process")
+                _cancel(job_id)
+
+def _regrade_uploads(assignment_id: str) -> Dict[str, Tuple[str, Path]]:
+    """Copy each student's kept zip to a fresh upload path and register a regrade job for it. Blocking.
+
+    Returns {user_id: (job_id, upload)}. Students with a job in flight are skipped.
+    """
+    db = SessionLocal()
+    user_ids = [user_id for (user_id,) in db.query(Submissions.user_id).filter(
+        Submissions.assignment_id == assignment_id).distinct()]
+    db.close()
+    uploads = {}
+    for user_id in user_ids:
+        kept_path = submission_path(user_id, assignment_id)
+        if not kept_path.exists():
+            continue
+        job_id = new_job_id()
+        if _register_job(user_id, assignment_id, job_id, regrade=True) is None:
+            continue
+        upload = upload_path(user_id, assignment_id, job_id)
+        try:
+            shutil.copyfile(kept_path, upload)
+        except OSError as e:
+            print(f"DEBUG: Cannot regrade {kept_path}: {e}")
+            _finish_job(job_id)
+            continue
+        uploads[user_id] = (job_id, upload)
+    return uploads
+
+async def regrade_assignment(assignment_id: str) -> int:
+    """Grade every student's kept submission for an assignment again; returns how many jobs started.
+
+    Students with a job in flight are skipped, since that job grades a newer upload anyway.
+    """
+    uploads = await asyncio.to_thread(_regrade_uploads, assignment_id)
+    for user_id, (job_id, upload) in uploads.items():
+        _launch(user_id, assignment_id, job_id, upload, submission_path(user_id, assignment_id).name, regrade=True)
+    print(f"DEBUG: Regrading {len(uploads)} submissions for {assignment_id}")
+    return len(uploads)
+
+def running_jobs() -> int:
+    return len(_tasks)
+
+async def _grade(job_id: str, user_id: str, assignment_id: str, file_path: Path, filename: str,
+                 regrade: bool):
+    loop = asyncio.get_running_loop()
+
+    def publish(event: Dict):
+        event_bus.publish(user_id, {**event, "job_id": job_id, "assignment_id": assignment_id})
+
+    def progress(update: Dict):
+        # Called from the worker thread running the sandbox
+        loop.call_soon_threadsafe(publish, update)
+
+    try:
+        # Shielded so a superseded job doesn't abort a reference run other submissions wait on
+        await asyncio.shield(reference_cache.ensure(assignment_id))
+        docker_result = await run_autograder(file_path, file_path.name, user_id, assignment_id, progress, job_id)
+        # Superseded on another process since watch_superseded_jobs last looked
+        if await asyncio.to_thread(_is_superseded, job_id):
+            raise asyncio.CancelledError
+
+        if docker_result.get("output"):
+            parsed_results = parse_grading_output(
+                docker_result["output"],
+                user_id,
+                assignment_id
+            )
+
+            save_grade = save_regrade_to_db if regrade else save_submission_to_db
+            if parsed_results:
+                for result in parsed_results:
+                    save_grade(user_id, assignment_id, result["grade"])
+
+            test_results = parse_test_results(docker_result["output"])
+            save_test_results(user_id, assignment_id, test_results)
+        else:
+            parsed_results = []
+            test_results = []
+
+        # This is the latest upload (a newer one would have cancelled the job), so it's kept
+        kept_path = submission_path(user_id, assignment_id)
+        os.replace(file_path, kept_path)
+
+        publish({
+            "stage": "done",
+            "success": True,
+            "filename": filename,
+            "results": {
+                "grading_results": parsed_results,
+                "test_results": test_results,
+                "docker_output": docker_result.get("output", ""),
+                "docker_error": docker_result.get("error")
+            }
+        })
+        if parsed_results:
+            similarity_indexer.schedule(user_id, assignment_id, kept_path)
+
+    except asyncio.CancelledError:
+        # Superseded; the process that took the newer upload has told the student
+        file_path.unlink(missing_ok=True)
+        raise
+    except Exception as e:
+        print(f"DEBUG: Grading job {job_id} failed: {e}")
+        if file_path.exists():
+            file_path.unlink()
+        publish({"stage": "failed", "success": False, "filename": filename, "error": f"Grading failed: {str(e)}"})
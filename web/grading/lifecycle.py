@@ -0,0 +1,266 @@
+# Lifecycle of grading resources. Every container gets a unique job-scoped name and labels
+# recording its owning worker and deadline, and is tracked while this worker runs it.
+# A periodic reaper kills and removes labelled containers that are past their deadline or
+# whose owning worker is gone, and deletes abandoned extraction/batch/artifact directories and
+# uploaded zips that never became a submission (e.g. after a worker crashed mid-grading).
+# Uploads of jobs that are still queued or grading (on any worker) are kept, however long they
+# have waited; jobs whose worker exited are marked finished, and old finished jobs are forgotten.
+# Grading jobs can be cancelled (a newer upload superseded them): their container or
+# namespace sandbox is killed, including one that only starts after the cancellation.
+
+import asyncio
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+from ..config import (SUBMISSIONS_DIR, ARTIFACT_DIR, LIFECYCLE_REAP_INTERVAL, LIFECYCLE_STALE_AFTER, LIFECYCLE_DEADLINE_GRACE,
+                      LIFECYCLE_JOB_RETENTION)
+from ..database import SessionLocal, Submissions, GradingJobs
+from .docker_api import docker_client, DockerAPIError, DockerTimeout
+
+LABEL_MANAGED = "autograder.managed"
+LABEL_JOB = "autograder.job"
+LABEL_OWNER = "autograder.owner"
+LABEL_DEADLINE = "autograder.deadline"
+
+# Leftovers in the temp directory: autograder runs on the host and Docker batch directories
+STALE_TEMP_PATTERNS = ("student_*", "grader_batch_*")
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def process_owner() -> str:
+    """This server process as "host:pid"; worked out on each call, so a forked worker gets its own."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def owner_alive(owner: str) -> bool:
+    """Whether the server process named by process_owner() is still running."""
+    if owner == process_owner():
+        return True
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True  # can't tell for another host; rely on the deadline
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+@dataclass
+class TrackedContainer:
+    container_id: str
+    name: str
+    job_id: str
+    deadline: float  # time.time() after which the reaper may kill it
+
+class LifecycleManager:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tracked: Dict[str, TrackedContainer] = {}
+        # Namespace sandboxes by job id, and cancelled job ids -> when they were cancelled
+        self._processes: Dict[str, subprocess.Popen] = {}
+        self._cancelled: Dict[str, float] = {}
+        # Leaks found by the last reap, and everything reaped since startup
+        self.last_reap: Optional[datetime] = None
+        self.last_found = {"expired_containers": 0, "orphaned_containers": 0, "stale_dirs": 0, "stale_zips": 0,
+                           "abandoned_jobs": 0}
+        self.total_reaped = dict(self.last_found)
+        self.docker_reachable: Optional[bool] = None
+
+    @property
+    def owner(self) -> str:
+        return process_owner()
+
+    def container_name(self, job_id: str, kind: str = "grader") -> str:
+        return f"{kind}_{job_id}"
+
+    def labels(self, job_id: str, timeout: float, **extra: str) -> Dict[str, str]:
+        labels = {
+            LABEL_MANAGED: "1",
+            LABEL_JOB: job_id,
+            LABEL_OWNER: self.owner,
+            LABEL_DEADLINE: str(int(time.time() + timeout + LIFECYCLE_DEADLINE_GRACE)),
+        }
+        labels.update({f"autograder.{key}": str(value) for key, value in extra.items()})
+        return labels
+
+    def track(self, container_id: str, name: str, job_id: str, deadline: float):
+        with self._lock:
+            self._tracked[container_id] = TrackedContainer(container_id, name, job_id, deadline)
+
+    def untrack(self, container_id: str):
+        with self._lock:
+            self._tracked.pop(container_id, None)
+
+    def track_process(self, job_id: str, process: subprocess.Popen):
+        with self._lock:
+            self._processes[job_id] = process
+
+    def untrack_process(self, job_id: str):
+        with self._lock:
+            self._processes.pop(job_id, None)
+
+    def cancelled(self, job_id: Optional[str]) -> bool:
+        """Whether job_id was cancelled; sandboxes check this right after starting."""
+        with self._lock:
+            return job_id in self._cancelled
+
+    def cancel_job(self, job_id: str):
+        """Kill the sandbox running job_id, now or as soon as it starts. Blocking."""
+        with self._lock:
+            self._cancelled[job_id] = time.time()
+            containers = [tracked for tracked in self._tracked.values() if tracked.job_id == job_id]
+            process = self._processes.get(job_id)
+        if process is not None:
+            try:
+                # Killing unshare takes every process in the sandbox down too
+                os.killpg(process.pid, signal.SIGKILL)
+                print(f"DEBUG: Killed namespace sandbox of cancelled job {job_id}")
+            except (ProcessLookupError, PermissionError):
+                pass
+        for tracked in containers:
+            try:
+                docker_client.kill(tracked.container_id)
+                print(f"DEBUG: Killed container {tracked.name} of cancelled job {job_id}")
+            except (DockerAPIError, DockerTimeout, OSError) as e:
+                # Not running yet; the sandbox kills it once started (see cancelled())
+                print(f"DEBUG: Could not kill container {tracked.name}: {e}")
+
+    def tracked_count(self) -> int:
+        with self._lock:
+            return len(self._tracked)
+
+    def _reap_containers(self, now: float) -> Dict[str, int]:
+        found = {"expired_containers": 0, "orphaned_containers": 0}
+        containers = docker_client.list_containers(labels=[f"{LABEL_MANAGED}=1"], all=True)
+        for container in containers:
+            labels = container.get("Labels") or {}
+            container_id = container["Id"]
+            try:
+                deadline = float(labels.get(LABEL_DEADLINE, 0))
+            except ValueError:
+                deadline = 0
+            if now > deadline:
+                reason = "expired_containers"
+            elif not owner_alive(labels.get(LABEL_OWNER, "")):
+                reason = "orphaned_containers"
+            else:
+                continue
+
+            found[reason] += 1
+            print(f"DEBUG: Reaping {reason[:-1].replace('_', ' ')} {container.get('Names')} (job {labels.get(LABEL_JOB)})")
+            try:
+                docker_client.kill(container_id)
+                docker_client.remove(container_id, force=True)
+                self.untrack(container_id)
+            except (DockerAPIError, DockerTimeout, OSError) as e:
+                print(f"DEBUG: Failed to reap container {container_id[:12]}: {e}")
+        return found
+
+    def _reap_jobs(self) -> Dict[str, int]:
+        found = {"abandoned_jobs": 0}
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            owners = {owner for (owner,) in db.query(GradingJobs.owner).filter(GradingJobs.finished_at.is_(None)).distinct()}
+            gone = [owner for owner in owners if not owner_alive(owner)]
+            if gone:
+                found["abandoned_jobs"] = db.query(GradingJobs).filter(
+                    GradingJobs.owner.in_(gone), GradingJobs.finished_at.is_(None)).update({"finished_at": now})
+            db.query(GradingJobs).filter(
+                GradingJobs.finished_at < now - timedelta(seconds=LIFECYCLE_JOB_RETENTION)).delete()
+            db.commit()
+        finally:
+            db.close()
+        return found
+
+    def _reap_paths(self, now: float) -> Dict[str, int]:
+        found = {"stale_dirs": 0, "stale_zips": 0}
+        cutoff = now - LIFECYCLE_STALE_AFTER
+
+        temp_dir = Path(tempfile.gettempdir())
+        stale_dirs = [path for pattern in STALE_TEMP_PATTERNS for path in temp_dir.glob(pattern)]
+        # Per-run artifact directories of runs that never finished
+        stale_dirs += list((ARTIFACT_DIR / "incoming").glob("run_*"))
+        for path in stale_dirs:
+            try:
+                if path.is_dir() and path.stat().st_mtime < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+                    found["stale_dirs"] += 1
+            except OSError:
+                pass
+
+        # A kept zip is the latest upload behind a submission; one without a submission row
+        # is an upload whose grading never finished
+        db = SessionLocal()
+        submission_ids = {submission_id for (submission_id,) in db.query(Submissions.id)}
+        # A job's upload is <student>_<assignment>.<job>.zip
+        live_jobs = {job_id for (job_id,) in db.query(GradingJobs.job_id).filter(GradingJobs.finished_at.is_(None))}
+        db.close()
+        for path in SUBMISSIONS_DIR.glob("*.zip"):
+            try:
+                if path.stem in submission_ids or path.stem.rpartition(".")[2] in live_jobs:
+                    continue
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    found["stale_zips"] += 1
+            except OSError:
+                pass
+        return found
+
+    def reap(self) -> Dict[str, int]:
+        """Find and clean up leaked grading resources. Blocking; returns what was found."""
+        now = time.time()
+        found = {"expired_containers": 0, "orphaned_containers": 0}
+        try:
+            found = self._reap_containers(now)
+            self.docker_reachable = True
+        except (DockerAPIError, DockerTimeout, OSError) as e:
+            # No Docker daemon (e.g. only the namespace backend is used); still clean up files
+            if self.docker_reachable is not False:
+                print(f"DEBUG: Reaper cannot list containers: {e}")
+            self.docker_reachable = False
+        found.update(self._reap_jobs())
+        found.update(self._reap_paths(now))
+        with self._lock:
+            self._cancelled = {job_id: when for job_id, when in self._cancelled.items()
+                               if now - when < LIFECYCLE_STALE_AFTER}
+
+        self.last_reap = datetime.now()
+        self.last_found = found
+        for key, count in found.items():
+            self.total_reaped[key] += count
+        if any(found.values()):
+            print(f"Reaped leaked grading resources: {found}")
+        return found
+
+    def snapshot(self) -> Dict:
+        return {
+            "tracked_containers": self.tracked_count(),
+            "last_reap": self.last_reap,
+            "last_found": dict(self.last_found),
+            "total_reaped": dict(self.total_reaped),
+            "docker_reachable": self.docker_reachable,
+        }
+
+lifecycle = LifecycleManager()
+
+async def run_reaper(interval: float = LIFECYCLE_REAP_INTERVAL):
+    """Reap leaked grading resources every interval seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(lifecycle.reap)
+        except Exception as e:
+            print(f"Reaper failed: {e}")
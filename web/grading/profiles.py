@@ -0,0 +1,83 @@
+# Per-assignment resource profiles: the memory, CPUs, time and output a grading run may use.
+# Profiles are stored on the assignment (admin assignments page, or the "### Profiles" section of
+# config.txt); fields left unset use the deployment defaults from config.py. The sandboxes enforce
+# a run's profile, and the concurrency controller packs runs into the host's budget by it, so a
+# light assignment can run many submissions side by side while a heavy one takes a bigger share.
+
+import math
+from dataclasses import dataclass
+from typing import Dict, Optional
+from ..config import DOCKER_MEMORY_LIMIT, DOCKER_CPU_LIMIT, DOCKER_TIMEOUT, GRADING_OUTPUT_LIMIT
+from ..catalog import get_catalog
+from .docker_api import parse_memory
+
+# Docker refuses containers with less memory than this
+MIN_MEMORY_LIMIT = 6 * 1024 ** 2
+
+@dataclass(frozen=True)
+class ResourceProfile:
+    memory: int        # bytes
+    cpus: float
+    timeout: int       # seconds for a whole grading run
+    output_limit: int  # bytes a student program may write per test run
+
+DEFAULT_PROFILE = ResourceProfile(
+    memory=parse_memory(DOCKER_MEMORY_LIMIT),
+    cpus=float(DOCKER_CPU_LIMIT),
+    timeout=DOCKER_TIMEOUT,
+    output_limit=parse_memory(GRADING_OUTPUT_LIMIT),
+)
+
+def profile_for(assignment_id: str) -> ResourceProfile:
+    assignment = get_catalog().by_id.get(assignment_id)
+    if not assignment:
+        return DEFAULT_PROFILE
+    return ResourceProfile(
+        memory=parse_memory(assignment.memory_limit) if assignment.memory_limit else DEFAULT_PROFILE.memory,
+        cpus=assignment.cpu_limit or DEFAULT_PROFILE.cpus,
+        timeout=assignment.grading_timeout or DEFAULT_PROFILE.timeout,
+        output_limit=parse_memory(assignment.output_limit) if assignment.output_limit else DEFAULT_PROFILE.output_limit,
+    )
+
+def parse_profile(memory_limit: Optional[str], cpu_limit: Optional[str], grading_timeout: Optional[str],
+                  output_limit: Optional[str]) -> Dict:
+    """Validate profile fields as entered by an admin; blank means the default.
+
+    Returns the Assignments column values. Raises ValueError with a message for the admin.
+    """
+    def blank(value):
+        return value is None or str(value).strip() == ""
+
+    def size(value, name, minimum, minimum_text):
+        if blank(value):
+            return None
+        value = str(value).strip().lower()
+        try:
+            size_bytes = parse_memory(value)
+        except ValueError:
+            raise ValueError(f"{name} must be a size such as 256m")
+        if size_bytes < minimum:
+            raise ValueError(f"{name} must be at least {minimum_text}")
+        return value
+
+    values = {
+        "memory_limit": size(memory_limit, "Memory limit", MIN_MEMORY_LIMIT, "6m"),
+        "cpu_limit": None,
+        "grading_timeout": None,
+        "output_limit": size(output_limit, "Output limit", 1024, "1k"),
+    }
+    if not blank(cpu_limit):
+        try:
+            values["cpu_limit"] = float(cpu_limit)
+        except ValueError:
+            raise ValueError("CPU limit must be a number")
+        if not math.isfinite(values["cpu_limit"]) or values["cpu_limit"] <= 0:
+            raise ValueError("CPU limit must be a positive number")
+    if not blank(grading_timeout):
+        try:
+            values["grading_timeout"] = int(grading_timeout)
+        except ValueError:
+            raise ValueError("Timeout must be a whole number of seconds")
+        if values["grading_timeout"] < 1:
+            raise ValueError("Timeout must be at least 1 second")
+    return values
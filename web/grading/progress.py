@@ -0,0 +1,73 @@
+# Reads the autograder's PROGRESS lines ("PROGRESS {json}") from its stdout as it streams in,
+# so stage updates (compiling, running test k/N) reach the browser while grading runs.
+
+import json
+import re
+from typing import Callable, Dict, List, Optional
+from .batch import match_batch_marker
+
+PROGRESS_MARKER = re.compile(r"^PROGRESS (\{.*\})\s*$")
+
+ProgressCallback = Callable[[Dict], None]
+
+PROGRESS_STAGES = ("compiling", "running")
+
+def progress_event(fields) -> Optional[Dict]:
+    """The event to publish for a PROGRESS line's fields, or None if they aren't a valid update.
+
+    The event is built here from known fields only, so a line can't set anything else
+    (job_id, results, ...) on the events the browser sees.
+    """
+    if not isinstance(fields, dict) or fields.get("stage") not in PROGRESS_STAGES:
+        return None
+    if fields["stage"] == "compiling":
+        return {"stage": "compiling"}
+    test, total = fields.get("test"), fields.get("total")
+    if type(test) is not int or type(total) is not int or not 1 <= test <= total:
+        return None
+    return {"stage": "running", "test": test, "total": total}
+
+class ProgressReader:
+    """Splits streamed output into lines and reports each PROGRESS line to a callback.
+
+    With several callbacks the output is --batch output, and a line goes to the callback of
+    the submission whose BATCH_ITEM_BEGIN marker (with the batch's nonce) came last. Callbacks
+    run on the reading thread.
+    """
+
+    def __init__(self, callbacks: List[Optional[ProgressCallback]], nonce: str = ""):
+        self.callbacks = callbacks
+        self.nonce = nonce
+        self.current = 0 if len(callbacks) == 1 else None
+        self._partial = b""
+
+    def feed(self, data: bytes):
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line.decode("utf-8", "replace"))
+
+    def _line(self, line: str):
+        if len(self.callbacks) > 1:
+            batch = match_batch_marker(line, self.nonce)
+            if batch:
+                index = batch[1].get("index")
+                self.current = index if batch[0] == "BEGIN" and isinstance(index, int) else None
+                return
+
+        match = PROGRESS_MARKER.match(line)
+        if not match or self.current is None or not 0 <= self.current < len(self.callbacks):
+            return
+        callback = self.callbacks[self.current]
+        if callback is None:
+            return
+        try:
+            event = progress_event(json.loads(match.group(1)))
+        except json.JSONDecodeError:
+            return
+        if event is None:
+            return
+        try:
+            callback(event)
+        except Exception as e:
+            print(f"DEBUG: Progress callback failed: {e}")
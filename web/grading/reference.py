@@ -0,0 +1,184 @@
+# Expected outputs from an assignment's reference solution.
+# The solution zip is compiled and run in the assignment's sandbox (autograder --reference),
+# and each test's output is cached in reference_outputs together with a version hash of the
+# test definition and the zip. Before a submission is graded, only tests whose version
+# changed are re-run, so the reference runs once per test change rather than per submission.
+# The autograder then diffs each test's output against the cached one (outputdiff.cpp).
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+from ..config import REFERENCE_DIR
+from ..database import SessionLocal, Assignments, Tests, ReferenceOutputs
+from .concurrency import grading_controller
+from .profiles import profile_for
+from .sandbox import backend_for
+
+REFERENCE_MARKER = re.compile(r"^REFERENCE_OUTPUT (\{.*\})\s*$")
+
+def reference_zip_path(sha256: str) -> Path:
+    return REFERENCE_DIR / f"{sha256}.zip"
+
+def save_reference_zip(data: bytes) -> str:
+    """Store an uploaded reference solution under its content hash and return the hash."""
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = reference_zip_path(sha256)
+    if not path.exists():
+        REFERENCE_DIR.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    return sha256
+
+def remove_unused_reference_zips(db):
+    """Delete stored solutions no assignment points at any more."""
+    used = {sha for (sha,) in db.query(Assignments.reference_sha256).filter(Assignments.reference_sha256.isnot(None))}
+    for path in REFERENCE_DIR.glob("*.zip"):
+        if path.stem not in used:
+            path.unlink(missing_ok=True)
+
+def test_version(reference_sha256: str, test: Tests) -> str:
+    """Everything that determines the reference output of a test; the binary is named after the assignment."""
+    key = json.dumps([reference_sha256, test.assignment_id, test.input_data, test.timeout_seconds])
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+def parse_reference_output(output: str) -> Dict[str, Dict]:
+    """Extract {test_id: {"status", "exit_code", "output"}} from autograder --reference output."""
+    results = {}
+    for line in output.splitlines():
+        match = REFERENCE_MARKER.match(line)
+        if not match:
+            continue
+        try:
+            result = json.loads(match.group(1))
+            results[result["test_id"]] = result
+        except (json.JSONDecodeError, KeyError, TypeError):
+            print(f"DEBUG parse_reference_output: Skipping malformed line: {line[:200]}")
+    return results
+
+def _stale_tests(assignment_id: str) -> Tuple[Optional[str], Dict[str, str]]:
+    """Return the assignment's reference hash and {test_id: version} of tests needing a reference run.
+
+    Cached outputs that are out of date, or no longer belong to a test of the assignment,
+    are deleted here so the grader never compares against them.
+    """
+    db = SessionLocal()
+    try:
+        assignment = db.query(Assignments).filter(Assignments.assignment_id == assignment_id).first()
+        sha256 = assignment.reference_sha256 if assignment else None
+        wanted = {}
+        if sha256:
+            wanted = {test.test_id: test_version(sha256, test)
+                      for test in db.query(Tests).filter(Tests.assignment_id == assignment_id)}
+        cached = {row.test_id: row.version for row in db.query(ReferenceOutputs.test_id, ReferenceOutputs.version).filter(
+            (ReferenceOutputs.assignment_id == assignment_id) | ReferenceOutputs.test_id.in_(list(wanted))
+        )}
+        obsolete = [test_id for test_id, version in cached.items() if wanted.get(test_id) != version]
+        if obsolete:
+            db.query(ReferenceOutputs).filter(ReferenceOutputs.test_id.in_(obsolete)).delete(synchronize_session=False)
+            db.commit()
+        return sha256, {test_id: version for test_id, version in wanted.items() if cached.get(test_id) != version}
+    finally:
+        db.close()
+
+def _store_outputs(assignment_id: str, outputs: Dict[str, Tuple[str, Dict]]):
+    db = SessionLocal()
+    try:
+        computed_at = datetime.now()
+        for test_id, (version, result) in outputs.items():
+            db.merge(ReferenceOutputs(
+                test_id=test_id,
+                assignment_id=assignment_id,
+                version=version,
+                status=result.get("status"),
+                exit_code=result.get("exit_code"),
+                output=result.get("output", ""),
+                computed_at=computed_at
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+def reference_status() -> Dict[str, Dict[str, int]]:
+    """Cached expected outputs and tests per assignment with a reference solution."""
+    db = SessionLocal()
+    status = {}
+    for assignment in db.query(Assignments).filter(Assignments.reference_sha256.isnot(None)):
+        status[assignment.assignment_id] = {
+            "tests": db.query(Tests).filter(Tests.assignment_id == assignment.assignment_id).count(),
+            "cached": db.query(ReferenceOutputs).filter(ReferenceOutputs.assignment_id == assignment.assignment_id).count()
+        }
+    db.close()
+    return status
+
+class ReferenceCache:
+    """Keeps each assignment's cached expected outputs in step with its tests and solution.
+
+    Must be used from the event loop thread.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Last failed run per assignment: (what it ran on, message); not retried until something changes
+        self._failures: Dict[str, Tuple[str, str]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def error(self, assignment_id: str) -> Optional[str]:
+        failure = self._failures.get(assignment_id)
+        return failure[1] if failure else None
+
+    def schedule(self, assignment_id: str):
+        """Refresh an assignment's expected outputs in the background, e.g. right after an admin edit."""
+        task = asyncio.create_task(self.ensure(assignment_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def ensure(self, assignment_id: str) -> Optional[str]:
+        """Run the reference solution on any test whose expected output is missing or stale.
+
+        Submissions of the assignment wait here while that happens. Returns an error message
+        if the solution could not produce some outputs; those tests are then graded without one.
+        """
+        lock = self._locks.setdefault(assignment_id, asyncio.Lock())
+        async with lock:
+            sha256, stale = await asyncio.to_thread(_stale_tests, assignment_id)
+            if not stale:
+                self._failures.pop(assignment_id, None)
+                return None
+            attempt = sha256 + ":" + ",".join(f"{test_id}={version}" for test_id, version in sorted(stale.items()))
+            failure = self._failures.get(assignment_id)
+            if failure and failure[0] == attempt:
+                return failure[1]
+
+            zip_path = reference_zip_path(sha256)
+            if not zip_path.exists():
+                message = f"Reference solution for {assignment_id} is missing from {REFERENCE_DIR}"
+            else:
+                backend = backend_for(assignment_id)
+                async with grading_controller.slot(backend.admission_profile(profile_for(assignment_id))):
+                    result = await asyncio.to_thread(backend.run_reference, zip_path, assignment_id, sorted(stale))
+                outputs = parse_reference_output(result.get("output") or "")
+                found = {test_id: (version, outputs[test_id]) for test_id, version in stale.items() if test_id in outputs}
+                if found:
+                    await asyncio.to_thread(_store_outputs, assignment_id, found)
+                print(f"Reference outputs for {assignment_id}: computed {len(found)}/{len(stale)} test(s)")
+                if len(found) == len(stale):
+                    self._failures.pop(assignment_id, None)
+                    return None
+                missing = sorted(set(stale) - set(found))
+                # The autograder explains what went wrong (e.g. a compile error) on an "Error:" line
+                reasons = [line for line in (result.get("output") or "").splitlines() if line.startswith("Error:")]
+                reason = reasons[-1] if reasons else result.get("error")
+                message = (f"Reference solution for {assignment_id} produced no output for {', '.join(missing)}"
+                           + (f" ({reason})" if reason else ""))
+
+            print(f"WARNING: {message}")
+            self._failures[assignment_id] = (attempt, message)
+            return message
+
+reference_cache = ReferenceCache()
@@ -0,0 +1,350 @@
+# Sandbox backends that run the autograder on a submission.
+# "docker" starts a fresh container per submission (docker_run.py). "namespace" runs the
+# host-built autograder in unprivileged user/mount/network/PID namespaces with rlimits, on a minimal
+# root of read-only system binds, which starts in milliseconds instead of paying for container create/start.
+# In both, the autograder installs a seccomp filter and rlimits before running the student's build and program.
+# The backend is chosen per assignment (Assignments.sandbox_backend) or per deployment (SANDBOX_BACKEND).
+# Each run is admitted by the concurrency controller and limited according to its assignment's
+# resource profile (profiles.py). Submissions built before run from the artifact store's
+# binary (artifacts.py) instead of being unzipped and compiled again.
+
+import asyncio
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from ..config import (SANDBOX_BACKEND, AUTOGRADER_BINARY, DATA_DIR, PRECOMPILED_HEADERS, PCH_BIN_DIR,
+                      NAMESPACE_TMPFS_SIZE, NAMESPACE_MAX_OPEN_FILES, NAMESPACE_MAX_FILE_SIZE)
+from ..catalog import get_catalog
+from .artifacts import artifact_store, ArtifactRun
+from .concurrency import grading_controller
+from .docker_api import docker_client
+from .docker_run import run_in_container, run_batch_in_container, run_reference_in_container
+from .lifecycle import lifecycle
+from .batch import batch_scheduler
+from .profiles import ResourceProfile, profile_for
+from .progress import ProgressReader, ProgressCallback
+
+class SandboxBackend(ABC):
+    """Runs the autograder on one submission and returns {"output", "error"[, "timed_out"]}.
+
+    Backends with supports_batch set are fed through the batch scheduler and can grade
+    several submissions for one assignment in a single run_batch call. progress callbacks
+    receive the autograder's PROGRESS updates, from the thread running the backend. A run
+    given the grading job's id is killed when the job is cancelled (lifecycle.cancel_job)
+    and then returns {"error", "cancelled": True}.
+    """
+    name = ""
+    supports_batch = False
+    # Whether a run is held to its profile's CPU share; when not, it is admitted as a full core
+    enforces_cpu_share = True
+
+    def available(self) -> bool:
+        return True
+
+    def admission_profile(self, profile: ResourceProfile) -> ResourceProfile:
+        """The profile the concurrency controller reserves for a run limited by profile."""
+        if self.enforces_cpu_share:
+            return profile
+        return replace(profile, cpus=max(profile.cpus, 1.0))
+
+    @abstractmethod
+    def run(self, zip_path: Path, student_id: str, assignment_id: str,
+            progress: Optional[ProgressCallback] = None, job_id: Optional[str] = None) -> Dict:
+        """Grade one submission. Blocking; called from a worker thread."""
+
+    def run_batch(self, items: List[Tuple[Path, str]], assignment_id: str,
+                  progress: Optional[List[Optional[ProgressCallback]]] = None) -> List[Dict]:
+        progress = progress or [None] * len(items)
+        return [self.run(zip_path, student_id, assignment_id, callback)
+                for (zip_path, student_id), callback in zip(items, progress)]
+
+    @abstractmethod
+    def run_reference(self, zip_path: Path, assignment_id: str, test_ids: List[str]) -> Dict:
+        """Run the assignment's reference solution on test_ids; the output has REFERENCE_OUTPUT lines."""
+
+class DockerBackend(SandboxBackend):
+    name = "docker"
+    # Container startup dominates short runs, so queued submissions share a container
+    supports_batch = True
+
+    def available(self) -> bool:
+        return docker_client.ping()
+
+    def run(self, zip_path: Path, student_id: str, assignment_id: str,
+            progress: Optional[ProgressCallback] = None, job_id: Optional[str] = None) -> Dict:
+        return run_in_container(zip_path, student_id, assignment_id, progress, job_id)
+
+    def run_batch(self, items: List[Tuple[Path, str]], assignment_id: str,
+                  progress: Optional[List[Optional[ProgressCallback]]] = None) -> List[Dict]:
+        return run_batch_in_container(items, assignment_id, progress)
+
+    def run_reference(self, zip_path: Path, assignment_id: str, test_ids: List[str]) -> Dict:
+        return run_reference_in_container(zip_path, assignment_id, test_ids)
+
+class NamespaceBackend(SandboxBackend):
+    name = "namespace"
+    # There is no cgroup to set a CPU quota on, and rlimits only cap CPU time
+    enforces_cpu_share = False
+
+    # Runs as root of the new user namespace and builds the sandbox's whole filesystem on a tmpfs:
+    # read-only binds of the system directories and of the files the grader needs, writable binds
+    # of per-run directories, a private /tmp and /proc. pivot_root then makes that the root and the
+    # host's tree is detached, so nothing else on the host is reachable, let alone writable.
+    # Arguments: the /tmp size, then "<kind> <path>" pairs up to "--", then the command.
+    # Kinds: ro/rw bind the host path at the same path; link recreates a symlink given as path:target.
+    # Remounting keeps the mount's existing flags, which the kernel requires inside a user namespace.
+    SETUP_SCRIPT = (
+        'set -e\n'
+        'root="$SANDBOX_ROOT"\n'
+        'mount -t tmpfs -o size=1m,mode=755 tmpfs "$root"\n'
+        'mkdir "$root/tmp" "$root/proc" "$root/.oldroot"\n'
+        'mount -t tmpfs -o size="$1",mode=1777 tmpfs "$root/tmp"\n'
+        'shift\n'
+        'while [ "$1" != "--" ]; do\n'
+        '  case "$1" in\n'
+        '  ro|rw)\n'
+        '    target="$root$2"\n'
+        '    if [ -d "$2" ]; then mkdir -p "$target"; else mkdir -p "${target%/*}"; : > "$target"; fi\n'
+        '    mount --bind "$2" "$target"\n'
+        '    if [ "$1" = ro ]; then\n'
+        '      mount -o "remount,bind,$(findmnt -no VFS-OPTIONS -T "$target" | sed "s/^rw/ro/")" "$target"\n'
+        '    fi ;;\n'
+        '  link)\n'
+        '    target="$root${2%%:*}"\n'
+        '    mkdir -p "${target%/*}"\n'
+        '    ln -s "${2#*:}" "$target" ;;\n'
+        '  esac\n'
+        '  shift 2\n'
+        'done\n'
+        'shift\n'
+        'cd "$root"\n'
+        'pivot_root . .oldroot\n'
+        # A new proc is only allowed while a full one is still visible, i.e. before the old root goes
+        'mount -t proc proc /proc\n'
+        'umount -l /.oldroot\n'
+        'rmdir /.oldroot\n'
+        'mount -o remount,ro /\n'
+        'cd /tmp\n'
+        'exec "$@"\n'
+    )
+    # Host directories every sandbox sees read-only; symlinked ones (merged /usr) are recreated as links
+    SYSTEM_PATHS = ("/usr", "/bin", "/sbin", "/lib", "/lib32", "/lib64", "/libx32",
+                    "/etc/ld.so.cache", "/etc/alternatives", "/opt/pch")
+    DEVICES = ("/dev/null", "/dev/zero", "/dev/random", "/dev/urandom")
+    # Mount point for the sandbox's root, mounted over in each sandbox's own mount namespace only
+    ROOT_MOUNT_POINT = Path(tempfile.gettempdir()) / "autograder_sandbox_root"
+
+    def available(self) -> bool:
+        return (sys.platform.startswith("linux") and AUTOGRADER_BINARY.exists()
+                and all(shutil.which(tool) for tool in ("unshare", "prlimit", "findmnt", "pivot_root")))
+
+    def mounts(self, read_only: List[Path], writable: List[Path]) -> List[str]:
+        """The "<kind> <path>" arguments of SETUP_SCRIPT for a sandbox that sees the given host paths.
+
+        The grader binary is always included. Paths must not lie inside one another.
+        """
+        specs = []
+        for path in self.SYSTEM_PATHS:
+            if os.path.islink(path):
+                specs += ["link", f"{path}:{os.readlink(path)}"]
+            elif os.path.exists(path):
+                specs += ["ro", path]
+        for path in [AUTOGRADER_BINARY, *read_only]:
+            specs += ["ro", str(path)]
+        for path in [*self.DEVICES, *writable]:
+            specs += ["rw", str(path)]
+        return specs + ["--"]
+
+    def command(self, args: List[str], profile: ResourceProfile, mounts: List[str]):
+        return [
+            "prlimit", f"--cpu={profile.timeout}", f"--nofile={NAMESPACE_MAX_OPEN_FILES}",
+            f"--fsize={NAMESPACE_MAX_FILE_SIZE}", "--core=0", "--",
+            "unshare", "--user", "--map-root-user", "--mount", "--net", "--pid", "--fork",
+            "--mount-proc", "--kill-child",
+            "sh", "-c", self.SETUP_SCRIPT, "sandbox", NAMESPACE_TMPFS_SIZE, *mounts,
+            str(AUTOGRADER_BINARY), *args,
+        ]
+
+    def _root_mount_point(self) -> Optional[Path]:
+        path = self.ROOT_MOUNT_POINT
+        try:
+            path.mkdir(mode=0o700, exist_ok=True)
+            # Anyone can create names in the temp directory; mount must not follow someone else's symlink
+            if path.is_symlink() or path.stat().st_uid != os.getuid():
+                print(f"WARNING: {path} is not a directory owned by this user; namespace sandbox disabled")
+                return None
+        except OSError as e:
+            print(f"WARNING: Cannot create {path}: {e}")
+            return None
+        return path
+
+    def run(self, zip_path: Path, student_id: str, assignment_id: str,
+            progress: Optional[ProgressCallback] = None, job_id: Optional[str] = None) -> Dict:
+        print(f"DEBUG: Starting namespace sandbox for {student_id}, assignment {assignment_id}")
+        artifacts = artifact_store.prepare([zip_path], assignment_id, self.name) if self.available() else None
+        result = {}
+        try:
+            result = self._execute([str(zip_path), student_id, assignment_id], assignment_id, [zip_path], progress,
+                                   job_id=job_id, artifacts=artifacts)
+            return result
+        finally:
+            artifact_store.collect(artifacts, assignment_id, [""], [result.get("output")])
+
+    def run_reference(self, zip_path: Path, assignment_id: str, test_ids: List[str]) -> Dict:
+        print(f"DEBUG: Running reference solution for {assignment_id} on {len(test_ids)} test(s) in a namespace sandbox")
+        return self._execute(["--reference", str(zip_path), assignment_id], assignment_id, [zip_path],
+                             extra_env={"AUTOGRADER_REFERENCE_TESTS": "\n".join(test_ids)})
+
+    @staticmethod
+    def _grading_database(assignment_id: str) -> Path:
+        """Copy the rows the autograder reads for one assignment into a fresh database; returns its directory.
+
+        The student's program can read any file the sandbox sees, so it gets this copy rather than
+        the real database with every user and submission in it.
+        """
+        directory = Path(tempfile.mkdtemp(prefix="autograder_db_"))
+        try:
+            db = sqlite3.connect(directory / "database.db")
+            try:
+                db.execute("ATTACH DATABASE ? AS source", (str(DATA_DIR / "database.db"),))
+                db.execute("CREATE TABLE assignments AS SELECT * FROM source.assignments WHERE assignment_id = ?",
+                           (assignment_id,))
+                db.execute("CREATE TABLE autograders AS SELECT * FROM source.autograders "
+                           "WHERE name IN (SELECT autograder FROM assignments)")
+                db.execute("CREATE TABLE tests AS SELECT * FROM source.tests WHERE assignment_id = ?", (assignment_id,))
+                db.execute("CREATE TABLE reference_outputs AS SELECT * FROM source.reference_outputs "
+                           "WHERE test_id IN (SELECT test_id FROM tests)")
+                db.commit()
+            finally:
+                db.close()
+            directory.chmod(0o755)
+            return directory
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+    def _execute(self, args: List[str], assignment_id: str, inputs: List[Path],
+                 progress: Optional[ProgressCallback] = None,
+                 extra_env: Optional[Dict[str, str]] = None, job_id: Optional[str] = None,
+                 artifacts: Optional[ArtifactRun] = None) -> Dict:
+        root_mount_point = self._root_mount_point() if self.available() else None
+        if root_mount_point is None:
+            return {"error": "Namespace sandbox is not available on this host"}
+        try:
+            db_dir = self._grading_database(assignment_id)
+        except (OSError, sqlite3.Error) as e:
+            print(f"DEBUG: Cannot prepare the grading database for {assignment_id}: {e}")
+            return {"error": f"Cannot prepare the grading database: {e}"}
+        try:
+            return self._sandboxed(args, profile_for(assignment_id), root_mount_point, db_dir, inputs,
+                                   progress, extra_env, job_id, artifacts)
+        finally:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    def _sandboxed(self, args: List[str], profile: ResourceProfile, root_mount_point: Path, db_dir: Path,
+                   inputs: List[Path], progress: Optional[ProgressCallback], extra_env: Optional[Dict[str, str]],
+                   job_id: Optional[str], artifacts: Optional[ArtifactRun]) -> Dict:
+        env = {
+            "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+            "HOME": "/tmp",
+            "LANG": "C.UTF-8",
+            "AUTOGRADER_DB_PATH": str(db_dir / "database.db"),
+            "AUTOGRADER_MEMORY_LIMIT_KB": str(profile.memory // 1024),
+            "AUTOGRADER_OUTPUT_LIMIT_KB": str(max(1, profile.output_limit // 1024)),
+            "AUTOGRADER_PCH_BIN": PCH_BIN_DIR if PRECOMPILED_HEADERS else "",
+            "SANDBOX_ROOT": str(root_mount_point),
+            **(extra_env or {}),
+        }
+        if artifacts:
+            # The project tree, and so the artifact directory, has the same path inside the sandbox
+            env["AUTOGRADER_ARTIFACT_OUT"] = str(artifacts.out)
+            env["AUTOGRADER_ARTIFACT_IN"] = artifacts.prebuilt_in(0)
+        process = subprocess.Popen(
+            self.command(args, profile, self.mounts([db_dir, *inputs], [artifacts.path] if artifacts else [])),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, start_new_session=True
+        )
+        if job_id:
+            lifecycle.track_process(job_id, process)
+            if lifecycle.cancelled(job_id):
+                os.killpg(process.pid, signal.SIGKILL)
+        # Read both pipes as output arrives so progress is reported while the grader runs
+        stdout, stderr = [], []
+        reader = ProgressReader([progress]) if progress else None
+        readers = [
+            threading.Thread(target=self._drain, args=(process.stdout, stdout, reader), daemon=True),
+            threading.Thread(target=self._drain, args=(process.stderr, stderr, None), daemon=True),
+        ]
+        for thread in readers:
+            thread.start()
+        try:
+            process.wait(timeout=profile.timeout)
+        except subprocess.TimeoutExpired:
+            # Killing unshare takes the namespace's init, and with it every process inside, down too
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            print(f"DEBUG: Namespace sandbox for {' '.join(args)} timed out")
+            return {"error": "Execution timeout - program took too long to run", "timed_out": True}
+        finally:
+            for thread in readers:
+                thread.join()
+            if job_id:
+                lifecycle.untrack_process(job_id)
+
+        if lifecycle.cancelled(job_id):
+            print(f"DEBUG: Namespace sandbox for {' '.join(args)} was cancelled")
+            return {"error": "Grading cancelled", "cancelled": True}
+
+        output = b"".join(stdout).decode("utf-8", "replace")
+        error_output = b"".join(stderr).decode("utf-8", "replace")
+        print(f"DEBUG: Namespace sandbox exit code: {process.returncode}")
+        print(f"DEBUG: Namespace sandbox stderr: {error_output}")
+        return {
+            "output": output,
+            "error": error_output if process.returncode != 0 else None
+        }
+
+    @staticmethod
+    def _drain(pipe, chunks: List[bytes], reader: Optional[ProgressReader]):
+        with pipe:
+            for data in iter(lambda: pipe.read1(65536), b""):
+                chunks.append(data)
+                if reader:
+                    reader.feed(data)
+
+BACKENDS: Dict[str, SandboxBackend] = {backend.name: backend for backend in (DockerBackend(), NamespaceBackend())}
+
+def backend_for(assignment_id: str) -> SandboxBackend:
+    assignment = get_catalog().by_id.get(assignment_id)
+    name = (assignment.sandbox_backend if assignment else None) or SANDBOX_BACKEND
+    if name not in BACKENDS:
+        print(f"WARNING: Unknown sandbox backend '{name}', using {SANDBOX_BACKEND}")
+        name = SANDBOX_BACKEND
+    return BACKENDS[name]
+
+async def run_autograder(zip_path: Path, autograder_filename: str, student_id: str, assignment_id: str,
+                         progress: Optional[ProgressCallback] = None, job_id: Optional[str] = None) -> Dict:
+    """Grade a submission in its assignment's sandbox, waiting for a free grading slot first.
+
+    progress is called from a worker thread with each PROGRESS update the autograder prints.
+    Cancelling the awaiting task drops a still queued submission; the running sandbox of
+    job_id has to be killed with lifecycle.cancel_job.
+    """
+    backend = backend_for(assignment_id)
+    if backend.supports_batch:
+        return await batch_scheduler.submit(backend, zip_path, student_id, assignment_id, progress, job_id)
+    profile = profile_for(assignment_id)
+    async with grading_controller.slot(backend.admission_profile(profile)):
+        started = time.monotonic()
+        result = await asyncio.to_thread(backend.run, zip_path, student_id, assignment_id, progress, job_id)
+        grading_controller.record_run(time.monotonic() - started, result.get("timed_out", False), profile.timeout)
+    return result
@@ -1,19 +1,59 @@
 # Routing logic for all admin pages
 
-from fastapi import APIRouter, Request, Form, HTTPException
+from fastapi import APIRouter, Request, Form, File, UploadFile, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from datetime import datetime
+from typing import List, Optional
+import asyncio
+import io
 import json
+import zipfile
 from sqlalchemy import func
-from ..config import WEB_DIR
-from ..database import SessionLocal, Users, Assignments, Submissions, Autograders, Tests
+from ..config import (WEB_DIR, SANDBOX_BACKENDS, SANDBOX_BACKEND, DEFAULT_TEST_TIMEOUT, REFERENCE_MAX_ZIP_BYTES,
+                      REFERENCE_NORMALIZATIONS, REFERENCE_DEFAULT_NORMALIZATION, REFERENCE_DEFAULT_POINTS,
+                      DOCKER_MEMORY_LIMIT, DOCKER_CPU_LIMIT, DOCKER_TIMEOUT, GRADING_OUTPUT_LIMIT)
+from ..database import SessionLocal, Users, Assignments, Submissions, Autograders, Tests, TestResults, ReferenceOutputs
 from ..dependencies import require_admin, get_current_user_info
 from ..auth import hash_password
+from ..grading.artifacts import artifact_store
+from ..grading.concurrency import grading_controller
+from ..grading.jobs import regrade_assignment
+from ..grading.lifecycle import lifecycle
+from ..grading.profiles import parse_profile
+from ..grading.sandbox import BACKENDS
+from ..grading.reference import reference_cache, reference_status, save_reference_zip, remove_unused_reference_zips
+from ..catalog import get_catalog, invalidate_catalog, invalidate_student
+from ..analytics import get_analytics, invalidate_analytics
+from ..similarity import similarity_indexer, suspicious_pairs, index_summary, remove_assignment_index
+from ..student_import import parse_csv, start_import_job, ON_EXISTING
 
 router = APIRouter()
 templates = Jinja2Templates(directory=str(WEB_DIR / "templates"))
 
+def _optional_int(value):
+    """Parse an optional numeric form field; blank means not set."""
+    if value is None or str(value).strip() == "":
+        return None
+    return int(value)
+
+def _timeout_seconds(value):
+    """Parse the optional per-test timeout; blank means the grader's default."""
+    if value is None or str(value).strip() == "":
+        return None
+    seconds = float(value)
+    if seconds <= 0:
+        raise ValueError("timeout must be positive")
+    return seconds
+
+def _sandbox_backend(value):
+    """Validate the sandbox backend form field; blank means the deployment default."""
+    if not value:
+        return None
+    if value not in SANDBOX_BACKENDS:
+        raise HTTPException(status_code=400, detail=f"Unknown sandbox backend: {value}")
+    return value
+
 # Admin dashboard
 @router.get("/admin", response_class=HTMLResponse)
 async def admin_dashboard(request: Request):
@@ -36,21 +76,23 @@ async def admin_dashboard(request: Request):
             'submission_time': sub.submission_time
         })
     
-    students = db.query(Users).filter(Users.role == "student").all()
-    student_stats = []
-    for student in students:
-        subs = db.query(Submissions).filter(Submissions.user_id == student.user_id).all()
-        grades = [s.grade for s in subs if s.grade is not None]
-        avg_grade = sum(grades) / len(grades) if grades else 0
-        student_stats.append({
-            'user_id': student.user_id,
-            'name': student.name,
-            'submission_count': len(subs),
-            'avg_grade': avg_grade
-        })
+    # One grouped query instead of a submissions query per student
+    student_rows = db.query(
+        Users.user_id, Users.name, func.count(Submissions.id), func.avg(Submissions.grade)
+    ).outerjoin(Submissions, Submissions.user_id == Users.user_id).filter(
+        Users.role == "student"
+    ).group_by(Users.user_id, Users.name).all()
+    student_stats = [
+        {'user_id': user_id, 'name': name, 'submission_count': count, 'avg_grade': avg_grade or 0}
+        for user_id, name, count, avg_grade in student_rows
+    ]
     
     assignments = db.query(Assignments).all()
     
+    heaviest_runs = db.query(TestResults, Users.name).join(Users).order_by(
+        (func.coalesce(TestResults.user_cpu_ms, 0) + func.coalesce(TestResults.sys_cpu_ms, 0)).desc()
+    ).limit(10).all()
+    
     db.close()
     
     return templates.TemplateResponse("admin_dashboard.html", {
@@ -61,9 +103,46 @@ async def admin_dashboard(request: Request):
         "total_submissions": total_submissions,
         "recent_submissions": recent_submissions,
         "student_stats": student_stats,
-        "assignments": assignments
+        "assignments": assignments,
+        "heaviest_runs": heaviest_runs,
+        "grading": grading_controller.snapshot(),
+        "lifecycle": lifecycle.snapshot(),
+        "artifacts": await asyncio.to_thread(artifact_store.snapshot),
+        "analytics": get_analytics()["assignments"]
     })
 
+@router.get("/admin/analytics")
+async def admin_analytics(request: Request, assignment_id: Optional[str] = None):
+    """Grade statistics per assignment as JSON, served from the analytics cache."""
+    require_admin(request)
+
+    analytics = await asyncio.to_thread(get_analytics, assignment_id)
+    if assignment_id and assignment_id not in analytics["assignments"]:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    return analytics
+
+@router.post("/admin/grading/concurrency")
+async def update_grading_concurrency(
+    request: Request,
+    min_concurrency: int = Form(...),
+    max_concurrency: int = Form(...)
+):
+    require_admin(request)
+    
+    try:
+        grading_controller.set_bounds(min_concurrency, max_concurrency)
+    except ValueError as e:
+        return RedirectResponse(url=f"/admin?error={e}", status_code=302)
+    
+    return RedirectResponse(url="/admin?success=Grading concurrency bounds updated", status_code=302)
+
+@router.post("/admin/lifecycle/reap")
+async def reap_leaked_resources(request: Request):
+    require_admin(request)
+
+    found = await asyncio.to_thread(lifecycle.reap)
+    return RedirectResponse(url=f"/admin?success=Reaped {sum(found.values())} leaked resources", status_code=302)
+
 # Student view/management
 @router.get("/admin/students", response_class=HTMLResponse)
 async def admin_students(request: Request):
@@ -76,19 +155,49 @@ async def admin_students(request: Request):
     student_data = []
     for student in students:
         submissions = db.query(Submissions).filter(Submissions.user_id == student.user_id).all()
+        test_results = {}
+        for result in db.query(TestResults).filter(TestResults.user_id == student.user_id).order_by(TestResults.test_id):
+            test_results.setdefault(result.assignment_id, []).append(result)
         student_data.append({
             'student': student,
-            'submissions': submissions
+            'submissions': submissions,
+            'test_results': test_results
         })
     
+    assignments = db.query(Assignments).all()
     db.close()
     
     return templates.TemplateResponse("admin_students.html", {
         "request": request,
         "admin": admin,
-        "student_data": student_data
+        "student_data": student_data,
+        "assignments": assignments
     })
 
+# Bulk student import; progress is pushed to the admin's /events stream
+@router.post("/admin/students/import")
+async def import_students_csv(
+    request: Request,
+    file: UploadFile = File(...),
+    on_existing: str = Form("skip")
+):
+    admin_id = require_admin(request)
+    
+    if on_existing not in ON_EXISTING:
+        raise HTTPException(status_code=400, detail=f"on_existing must be one of: {', '.join(ON_EXISTING)}")
+    try:
+        text = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return RedirectResponse(url="/admin/students?error=The CSV file must be UTF-8 encoded", status_code=302)
+    
+    rows, errors = parse_csv(text)
+    if not rows:
+        message = errors[0][1] if errors else "The CSV file has no student rows"
+        return RedirectResponse(url=f"/admin/students?error={message}", status_code=302)
+    
+    job_id = start_import_job(admin_id, rows, errors, on_existing)
+    return RedirectResponse(url=f"/admin/students?import_job={job_id}", status_code=302)
+
 # Assignment management/CRUD interface
 @router.get("/admin/assignments", response_class=HTMLResponse)
 async def admin_assignments(request: Request):
@@ -100,11 +209,23 @@ async def admin_assignments(request: Request):
     autograders = db.query(Autograders).all()
     db.close()
     
+    references = await asyncio.to_thread(reference_status)
+    for assignment_id, status in references.items():
+        status["error"] = reference_cache.error(assignment_id)
+    
     return templates.TemplateResponse("admin_assignments.html", {
         "request": request,
         "admin": admin,
         "assignments": assignments,
-        "autograders": autograders
+        "autograders": autograders,
+        "sandbox_backends": SANDBOX_BACKENDS,
+        "cpu_share_unenforced": [name for name, backend in BACKENDS.items() if not backend.enforces_cpu_share],
+        "default_sandbox_backend": SANDBOX_BACKEND,
+        "references": references,
+        "default_profile": {"memory_limit": DOCKER_MEMORY_LIMIT, "cpu_limit": DOCKER_CPU_LIMIT,
+                            "grading_timeout": DOCKER_TIMEOUT, "output_limit": GRADING_OUTPUT_LIMIT},
+        "normalizations": REFERENCE_NORMALIZATIONS,
+        "default_normalization": REFERENCE_DEFAULT_NORMALIZATION.split(",")
     })
 
 @router.post("/admin/assignments/create")
@@ -113,9 +234,19 @@ async def create_assignment(
     assignment_id: str = Form(...),
     description: str = Form(...),
     due_date: str = Form(None),
-    autograder: str = Form(...)
+    autograder: str = Form(...),
+    sandbox_backend: str = Form(""),
+    memory_limit: str = Form(""),
+    cpu_limit: str = Form(""),
+    grading_timeout: str = Form(""),
+    output_limit: str = Form("")
 ):
     require_admin(request)
+    sandbox_backend = _sandbox_backend(sandbox_backend)
+    try:
+        profile = parse_profile(memory_limit, cpu_limit, grading_timeout, output_limit)
+    except ValueError as e:
+        return RedirectResponse(url=f"/admin/assignments?error={e}", status_code=302)
     
     db = SessionLocal()
     existing = db.query(Assignments).filter(Assignments.assignment_id == assignment_id).first()
@@ -128,12 +259,15 @@ async def create_assignment(
         assignment_id=assignment_id,
         description=description,
         due_date=datetime.strptime(due_date, "%Y-%m-%d").date() if due_date else None,
-        autograder=autograder
+        autograder=autograder,
+        sandbox_backend=sandbox_backend,
+        **profile
     )
     
     db.add(new_assignment)
     db.commit()
     db.close()
+    invalidate_catalog()
     
     return RedirectResponse(url="/admin/assignments?success=Assignment created successfully", status_code=302)
 
@@ -143,9 +277,19 @@ async def update_assignment(
     assignment_id: str,
     description: str = Form(...),
     due_date: str = Form(None),
-    autograder: str = Form(...)
+    autograder: str = Form(...),
+    sandbox_backend: str = Form(""),
+    memory_limit: str = Form(""),
+    cpu_limit: str = Form(""),
+    grading_timeout: str = Form(""),
+    output_limit: str = Form("")
 ):
     require_admin(request)
+    sandbox_backend = _sandbox_backend(sandbox_backend)
+    try:
+        profile = parse_profile(memory_limit, cpu_limit, grading_timeout, output_limit)
+    except ValueError as e:
+        return RedirectResponse(url=f"/admin/assignments?error={e}", status_code=302)
     
     db = SessionLocal()
     assignment = db.query(Assignments).filter(Assignments.assignment_id == assignment_id).first()
@@ -157,9 +301,13 @@ async def update_assignment(
     assignment.description = description
     assignment.due_date = datetime.strptime(due_date, "%Y-%m-%d").date() if due_date else None
     assignment.autograder = autograder
+    assignment.sandbox_backend = sandbox_backend
+    for column, value in profile.items():
+        setattr(assignment, column, value)
     
     db.commit()
     db.close()
+    invalidate_catalog()
     
     return RedirectResponse(url="/admin/assignments?success=Assignment updated successfully", status_code=302)
 
@@ -177,12 +325,95 @@ async def delete_assignment(request: Request, assignment_id: str):
     # Delete any related submissions and tests
     db.query(Submissions).filter(Submissions.assignment_id == assignment_id).delete()
     db.query(Tests).filter(Tests.assignment_id == assignment_id).delete()
+    db.query(ReferenceOutputs).filter(ReferenceOutputs.assignment_id == assignment_id).delete()
+    remove_assignment_index(db, assignment_id)
     db.delete(assignment)
     db.commit()
+    remove_unused_reference_zips(db)
     db.close()
+    invalidate_catalog()
+    invalidate_student()
+    invalidate_analytics()
     
     return RedirectResponse(url="/admin/assignments?success=Assignment deleted successfully", status_code=302)
 
+# Reference solution: its outputs become the expected outputs of the assignment's tests
+@router.post("/admin/assignments/{assignment_id}/reference")
+async def update_reference(
+    request: Request,
+    assignment_id: str,
+    file: Optional[UploadFile] = File(None),
+    output_normalization: List[str] = Form([]),
+    partial_credit: Optional[str] = Form(None)
+):
+    require_admin(request)
+    
+    unknown = set(output_normalization) - set(REFERENCE_NORMALIZATIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown output normalization: {', '.join(sorted(unknown))}")
+    
+    sha256 = None
+    if file is not None and file.filename:
+        data = await file.read(REFERENCE_MAX_ZIP_BYTES + 1)
+        if len(data) > REFERENCE_MAX_ZIP_BYTES:
+            return RedirectResponse(url="/admin/assignments?error=Reference solution zip is too large", status_code=302)
+        if not zipfile.is_zipfile(io.BytesIO(data)):
+            return RedirectResponse(url="/admin/assignments?error=Reference solution must be a zip file", status_code=302)
+        sha256 = await asyncio.to_thread(save_reference_zip, data)
+    
+    db = SessionLocal()
+    assignment = db.query(Assignments).filter(Assignments.assignment_id == assignment_id).first()
+    
+    if not assignment:
+        db.close()
+        return RedirectResponse(url="/admin/assignments?error=Assignment not found", status_code=302)
+    if sha256 is None and not assignment.reference_sha256:
+        db.close()
+        return RedirectResponse(url="/admin/assignments?error=Upload a reference solution zip", status_code=302)
+    
+    if sha256 is not None:
+        assignment.reference_sha256 = sha256
+    assignment.output_normalization = ",".join(output_normalization)
+    assignment.partial_credit = 1 if partial_credit else 0
+    db.commit()
+    remove_unused_reference_zips(db)
+    db.close()
+    
+    # Compute the expected outputs now rather than when the next submission arrives
+    reference_cache.schedule(assignment_id)
+    return RedirectResponse(url="/admin/assignments?success=Reference solution saved; computing expected outputs",
+                            status_code=302)
+
+@router.post("/admin/assignments/{assignment_id}/regrade")
+async def regrade(request: Request, assignment_id: str):
+    require_admin(request)
+    
+    if assignment_id not in get_catalog().by_id:
+        return RedirectResponse(url="/admin/assignments?error=Assignment not found", status_code=302)
+    
+    started = await regrade_assignment(assignment_id)
+    return RedirectResponse(url=f"/admin/assignments?success=Regrading {started} submissions in the background",
+                            status_code=302)
+
+@router.post("/admin/assignments/{assignment_id}/reference/delete")
+async def delete_reference(request: Request, assignment_id: str):
+    require_admin(request)
+    
+    db = SessionLocal()
+    assignment = db.query(Assignments).filter(Assignments.assignment_id == assignment_id).first()
+    
+    if not assignment:
+        db.close()
+        return RedirectResponse(url="/admin/assignments?error=Assignment not found", status_code=302)
+    
+    assignment.reference_sha256 = None
+    db.query(ReferenceOutputs).filter(ReferenceOutputs.assignment_id == assignment_id).delete()
+    db.commit()
+    remove_unused_reference_zips(db)
+    db.close()
+    
+    return RedirectResponse(url="/admin/assignments?success=Reference solution removed", status_code=302)
+
 # Autograder management/CRUD interface
 @router.get("/admin/autograders", response_class=HTMLResponse)
 async def admin_autograders(request: Request):
@@ -309,7 +540,9 @@ async def admin_tests(request: Request):
         "request": request,
         "admin": admin,
         "tests": tests,
-        "assignments": assignments
+        "assignments": assignments,
+        "default_test_timeout": DEFAULT_TEST_TIMEOUT,
+        "default_reference_points": REFERENCE_DEFAULT_POINTS
     })
 
 @router.post("/admin/tests/create")
@@ -317,7 +550,12 @@ async def create_test(
     request: Request,
     test_id: str = Form(...),
     assignment_id: str = Form(...),
-    input_data: str = Form(...)
+    input_data: str = Form(...),
+    time_budget_ms: str = Form(None),
+    memory_budget_kb: str = Form(None),
+    budget_points: str = Form(None),
+    timeout_seconds: str = Form(None),
+    points: str = Form(None)
 ):
     require_admin(request)
     
@@ -326,6 +564,20 @@ async def create_test(
     except json.JSONDecodeError:
         return RedirectResponse(url="/admin/tests?error=Invalid JSON format", status_code=302)
     
+    try:
+        budgets = {
+            "time_budget_ms": _optional_int(time_budget_ms),
+            "memory_budget_kb": _optional_int(memory_budget_kb),
+            "budget_points": _optional_int(budget_points),
+            "points": _optional_int(points)
+        }
+    except ValueError:
+        return RedirectResponse(url="/admin/tests?error=Budgets and points must be whole numbers", status_code=302)
+    try:
+        timeout = _timeout_seconds(timeout_seconds)
+    except ValueError:
+        return RedirectResponse(url="/admin/tests?error=Timeout must be a positive number of seconds", status_code=302)
+    
     db = SessionLocal()
     existing = db.query(Tests).filter(Tests.test_id == test_id).first()
     
@@ -336,12 +588,15 @@ async def create_test(
     new_test = Tests(
         test_id=test_id,
         assignment_id=assignment_id,
-        input_data=input_data
+        input_data=input_data,
+        timeout_seconds=timeout,
+        **budgets
     )
     
     db.add(new_test)
     db.commit()
     db.close()
+    reference_cache.schedule(assignment_id)
     
     return RedirectResponse(url="/admin/tests?success=Test created successfully", status_code=302)
 
@@ -350,7 +605,12 @@ async def update_test(
     request: Request,
     test_id: str,
     assignment_id: str = Form(...),
-    input_data: str = Form(...)
+    input_data: str = Form(...),
+    time_budget_ms: str = Form(None),
+    memory_budget_kb: str = Form(None),
+    budget_points: str = Form(None),
+    timeout_seconds: str = Form(None),
+    points: str = Form(None)
 ):
     require_admin(request)
     
@@ -359,6 +619,20 @@ async def update_test(
     except json.JSONDecodeError:
         return RedirectResponse(url="/admin/tests?error=Invalid JSON format", status_code=302)
     
+    try:
+        budgets = {
+            "time_budget_ms": _optional_int(time_budget_ms),
+            "memory_budget_kb": _optional_int(memory_budget_kb),
+            "budget_points": _optional_int(budget_points),
+            "points": _optional_int(points)
+        }
+    except ValueError:
+        return RedirectResponse(url="/admin/tests?error=Budgets and points must be whole numbers", status_code=302)
+    try:
+        timeout = _timeout_seconds(timeout_seconds)
+    except ValueError:
+        return RedirectResponse(url="/admin/tests?error=Timeout must be a positive number of seconds", status_code=302)
+    
     db = SessionLocal()
     test = db.query(Tests).filter(Tests.test_id == test_id).first()
     
@@ -366,11 +640,18 @@ async def update_test(
         db.close()
         return RedirectResponse(url="/admin/tests?error=Test not found", status_code=302)
     
+    previous_assignment_id = test.assignment_id
     test.assignment_id = assignment_id
     test.input_data = input_data
+    for field, value in budgets.items():
+        setattr(test, field, value)
+    test.timeout_seconds = timeout
     
     db.commit()
     db.close()
+    reference_cache.schedule(assignment_id)
+    if previous_assignment_id != assignment_id:
+        reference_cache.schedule(previous_assignment_id)
     
     return RedirectResponse(url="/admin/tests?success=Test updated successfully", status_code=302)
 
@@ -385,17 +666,50 @@ async def delete_test(request: Request, test_id: str):
         db.close()
         return RedirectResponse(url="/admin/tests?error=Test not found", status_code=302)
     
+    db.query(ReferenceOutputs).filter(ReferenceOutputs.test_id == test_id).delete()
     db.delete(test)
     db.commit()
     db.close()
     
     return RedirectResponse(url="/admin/tests?success=Test deleted successfully", status_code=302)
 
+# Code-similarity index: ranked suspicious pairs per assignment
+@router.get("/admin/similarity", response_class=HTMLResponse)
+async def admin_similarity(request: Request, assignment_id: Optional[str] = None):
+    require_admin(request)
+    admin = get_current_user_info(request)
+    
+    assignments = get_catalog().assignments
+    if not assignment_id and assignments:
+        assignment_id = assignments[0].assignment_id
+    pairs = await asyncio.to_thread(suspicious_pairs, assignment_id) if assignment_id else []
+    
+    return templates.TemplateResponse("admin_similarity.html", {
+        "request": request,
+        "admin": admin,
+        "assignments": assignments,
+        "assignment_id": assignment_id,
+        "pairs": pairs,
+        "indexed": await asyncio.to_thread(index_summary),
+        "pending": similarity_indexer.pending()
+    })
+
+@router.post("/admin/similarity/{assignment_id}/reindex")
+async def reindex_similarity(request: Request, assignment_id: str):
+    require_admin(request)
+    
+    scheduled = similarity_indexer.reindex_assignment(assignment_id)
+    return RedirectResponse(
+        url=f"/admin/similarity?assignment_id={assignment_id}&success=Indexing {scheduled} submissions in the background",
+        status_code=302
+    )
+
 @router.get("/reload-config")
 async def reload_config(request: Request):
     require_admin(request)
     
     from ..config_loader import load_config_to_database
-    load_config_to_database()
+    if not load_config_to_database():
+        return RedirectResponse(url="/admin?error=Failed to load config.txt, see server log", status_code=302)
     
     return RedirectResponse(url="/admin?success=Configuration reloaded successfully", status_code=302)
\ No newline at end of file
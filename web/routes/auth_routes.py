@@ -1,13 +1,15 @@
 # Routing for /login, /register and /logout
 
+import asyncio
 from fastapi import APIRouter, Request, Form, Response
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-from datetime import datetime
+from datetime import datetime, time, timezone
 from ..config import WEB_DIR
 from ..auth import authenticate_user, create_access_token, hash_password
-from ..database import SessionLocal, Users, Assignments, Submissions
+from ..database import SessionLocal, Users
 from ..dependencies import get_current_user
+from ..catalog import get_catalog, get_student_view, validators, is_not_modified, not_modified, set_validators
 
 router = APIRouter()
 templates = Jinja2Templates(directory=str(WEB_DIR / "templates"))
@@ -19,27 +21,32 @@ async def root(request: Request):
     if not user_id:
         return templates.TemplateResponse("login.html", {"request": request})
     
-    db = SessionLocal()
-    user = db.query(Users).filter(Users.user_id == user_id).first()
+    student = get_student_view(user_id)
+    if not student:
+        return templates.TemplateResponse("login.html", {"request": request})
     
-    if user and user.role == "admin":
-        db.close()
+    if student.role == "admin":
         return RedirectResponse(url="/admin", status_code=302)
     
-    all_assignments = db.query(Assignments).all()
-    submissions = db.query(Submissions).filter(Submissions.user_id == user_id).all()
-    db.close()
+    catalog = get_catalog()
     
-    submission_dict = {s.assignment_id: s for s in submissions}
+    # The overdue flags change at local midnight (due dates are local dates), so the page is also
+    # versioned by date. HTTP dates are UTC: convert that midnight rather than relabel it.
+    today = datetime.now().date()
+    midnight = datetime.combine(today, time.min).astimezone(timezone.utc)
+    etag = validators(catalog.etag, student.etag, today)
+    last_modified = max(catalog.last_modified, student.last_modified, midnight)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
     
     assignments = []
-    for assignment in all_assignments:
-        submission = submission_dict.get(assignment.assignment_id)
+    for assignment in catalog.assignments:
+        submission = student.submissions.get(assignment.assignment_id)
         
         # Check if overdue
         is_overdue = False
         if assignment.due_date:
-            is_overdue = datetime.now().date() > assignment.due_date
+            is_overdue = today > assignment.due_date
         
         assignments.append({
             'assignment_id': assignment.assignment_id,
@@ -50,11 +57,12 @@ async def root(request: Request):
             'grade': submission.grade if submission else 0
         })
     
-    return templates.TemplateResponse("index.html", {
+    response = templates.TemplateResponse("index.html", {
         "request": request,
-        "student": user,
+        "student": student,
         "assignments": assignments
     })
+    return set_validators(response, etag, last_modified)
 
 @router.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
@@ -97,10 +105,11 @@ async def register(
             {"request": request, "error": "User ID already exists"}
         )
     
+    # bcrypt is deliberately slow; keep it off the event loop
     new_user = Users(
         user_id=student_id,  # Use student_id
         name=name,
-        password_hash=hash_password(password),
+        password_hash=await asyncio.to_thread(hash_password, password),
         role="student"
     )
     
@@ -0,0 +1,158 @@
+# Streaming gradebook/submission exports for admins (CSV or NDJSON)
+# Rows are read in short keyset-paginated batches and streamed from a generator,
+# so memory stays constant and no long read transaction blocks grading writes.
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from ..config import EXPORT_BATCH_SIZE
+from ..database import SessionLocal, Users, Assignments, Submissions
+from ..dependencies import require_admin
+
+router = APIRouter()
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+def _parse_filters(export_format: str, assignment_id: Optional[str], start: Optional[str], end: Optional[str]):
+    if export_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'")
+    try:
+        start_time = datetime.strptime(start, "%Y-%m-%d") if start else None
+        # end is inclusive: everything before midnight of the following day
+        end_time = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD")
+    assignment_ids = [a.strip() for a in assignment_id.split(",") if a.strip()] if assignment_id else []
+    return assignment_ids, start_time, end_time
+
+def _filter_submissions(query, assignment_ids: List[str], start_time, end_time):
+    if assignment_ids:
+        query = query.filter(Submissions.assignment_id.in_(assignment_ids))
+    if start_time:
+        query = query.filter(Submissions.submission_time >= start_time)
+    if end_time:
+        query = query.filter(Submissions.submission_time < end_time)
+    return query
+
+def _encode(rows: Iterator[dict], export_format: str, columns: List[str]) -> Iterator[str]:
+    """Turn dict rows into CSV or NDJSON text, yielding roughly one chunk per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == "csv" else None
+    if writer:
+        writer.writerow(columns)
+
+    for count, row in enumerate(rows, start=1):
+        if writer:
+            writer.writerow(["" if row.get(column) is None else row.get(column) for column in columns])
+        else:
+            buffer.write(json.dumps(row, default=str) + "\n")
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+def _gradebook_rows(assignment_ids: List[str], start_time, end_time) -> Iterator[dict]:
+    last_user_id = ""
+    while True:
+        db = SessionLocal()
+        try:
+            students = (db.query(Users.user_id, Users.name)
+                        .filter(Users.role == "student", Users.user_id > last_user_id)
+                        .order_by(Users.user_id)
+                        .limit(EXPORT_BATCH_SIZE)
+                        .all())
+            if not students:
+                return
+            grades = {}
+            query = db.query(Submissions.user_id, Submissions.assignment_id, Submissions.grade).filter(
+                Submissions.user_id.in_([user_id for user_id, _ in students])
+            )
+            for user_id, assignment_id, grade in _filter_submissions(query, assignment_ids, start_time, end_time).yield_per(EXPORT_BATCH_SIZE):
+                grades[(user_id, assignment_id)] = grade
+        finally:
+            db.close()
+
+        for user_id, name in students:
+            row = {"user_id": user_id, "name": name}
+            for assignment_id in assignment_ids:
+                row[assignment_id] = grades.get((user_id, assignment_id))
+            yield row
+        last_user_id = students[-1][0]
+
+def _submission_rows(assignment_ids: List[str], start_time, end_time) -> Iterator[dict]:
+    last_id = ""
+    while True:
+        db = SessionLocal()
+        try:
+            query = (db.query(Submissions.id, Submissions.user_id, Users.name, Submissions.assignment_id,
+                              Submissions.submission_time, Submissions.grade)
+                     .join(Users, Users.user_id == Submissions.user_id)
+                     .filter(Submissions.id > last_id))
+            batch = (_filter_submissions(query, assignment_ids, start_time, end_time)
+                     .order_by(Submissions.id)
+                     .limit(EXPORT_BATCH_SIZE)
+                     .all())
+        finally:
+            db.close()
+        if not batch:
+            return
+
+        for submission_id, user_id, name, assignment_id, submission_time, grade in batch:
+            yield {
+                "submission_id": submission_id,
+                "user_id": user_id,
+                "name": name,
+                "assignment_id": assignment_id,
+                "submission_time": submission_time.isoformat() if submission_time else None,
+                "grade": grade
+            }
+        last_id = batch[-1][0]
+
+def _streaming_response(chunks: Iterator[str], export_format: str, name: str) -> StreamingResponse:
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[export_format], headers={
+        "Content-Disposition": f'attachment; filename="{filename}"'
+    })
+
+# Student x assignment grade matrix, one row per student
+@router.get("/admin/export/grades")
+async def export_grades(
+    request: Request,
+    export_format: str = Query("csv", alias="format"),
+    assignment_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None
+):
+    require_admin(request)
+    assignment_ids, start_time, end_time = _parse_filters(export_format, assignment_id, start, end)
+
+    if not assignment_ids:
+        db = SessionLocal()
+        assignment_ids = [a for (a,) in db.query(Assignments.assignment_id).order_by(Assignments.assignment_id)]
+        db.close()
+
+    rows = _gradebook_rows(assignment_ids, start_time, end_time)
+    columns = ["user_id", "name"] + assignment_ids
+    return _streaming_response(_encode(rows, export_format, columns), export_format, "gradebook")
+
+# Raw submission rows, one per student/assignment
+@router.get("/admin/export/submissions")
+async def export_submissions(
+    request: Request,
+    export_format: str = Query("csv", alias="format"),
+    assignment_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None
+):
+    require_admin(request)
+    assignment_ids, start_time, end_time = _parse_filters(export_format, assignment_id, start, end)
+
+    rows = _submission_rows(assignment_ids, start_time, end_time)
+    columns = ["submission_id", "user_id", "name", "assignment_id", "submission_time", "grade"]
+    return _streaming_response(_encode(rows, export_format, columns), export_format, "submissions")
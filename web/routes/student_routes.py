@@ -1,14 +1,16 @@
 # Routing logic for student accounts
 
 from fastapi import APIRouter, Request, Form, File, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 import shutil
-from ..config import WEB_DIR, SUBMISSIONS_DIR
-from ..database import SessionLocal, Assignments, Submissions, Users
+from ..config import WEB_DIR
+from ..database import SessionLocal, Assignments
 from ..dependencies import require_auth
-from ..grading.docker_run import run_autograder
-from ..grading.grader import parse_grading_output, save_submission_to_db
+from ..catalog import get_catalog, get_student_view, validators, is_not_modified, not_modified, set_validators
+from ..events import event_bus
+from ..grading.jobs import start_grading_job, upload_path
+from ..grading.lifecycle import new_job_id
 
 router = APIRouter()
 templates = Jinja2Templates(directory=str(WEB_DIR / "templates"))
@@ -17,30 +19,31 @@ templates = Jinja2Templates(directory=str(WEB_DIR / "templates"))
 async def assignment_detail(request: Request, assignment_id: str):
     user_id = require_auth(request)
     
-    db = SessionLocal()
-    
-    assignment = db.query(Assignments).filter(Assignments.assignment_id == assignment_id).first()
+    catalog = get_catalog()
+    assignment = catalog.by_id.get(assignment_id)
     if not assignment:
-        db.close()
         raise HTTPException(status_code=404, detail="Assignment not found")
     
-    student = db.query(Users).filter(Users.user_id == user_id).first()
+    student = get_student_view(user_id)
+    if not student:
+        raise HTTPException(status_code=401, detail="Authentication required")
     
-    submission = db.query(Submissions).filter(
-        Submissions.user_id == user_id,
-        Submissions.assignment_id == assignment_id
-    ).first()
+    submission = student.submissions.get(assignment_id)
     
-    db.close()
+    etag = validators(assignment, student.etag)
+    last_modified = max(catalog.last_modified, student.last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
     
-    return templates.TemplateResponse("assignment.html", {
+    response = templates.TemplateResponse("assignment.html", {
         "request": request,
         "assignment": assignment,
         "student": student,
         "submission": submission
     })
+    return set_validators(response, etag, last_modified)
 
-# Invokes the autograder Docker container and processes the results
+# Saves the upload and starts grading it in the background
 @router.post("/upload")
 async def upload_and_grade(
     request: Request,
@@ -59,41 +62,50 @@ async def upload_and_grade(
     if not assignment:
         raise HTTPException(status_code=400, detail="Invalid assignment ID")
 
-    autograder_filename = f"{user_id}_{assignment_id}.zip"
-    file_path = SUBMISSIONS_DIR / autograder_filename
+    # Each job grades its own copy, so a newer upload can't overwrite one still being graded
+    job_id = new_job_id()
+    file_path = upload_path(user_id, assignment_id, job_id)
     
     try:
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
-        
-        docker_result = await run_autograder(file_path, autograder_filename, user_id, assignment_id)
-        
-        if docker_result.get("output"):
-            parsed_results = parse_grading_output(
-                docker_result["output"],
-                user_id,
-                assignment_id
-            )
-            
-            if parsed_results:
-                for result in parsed_results:
-                    save_submission_to_db(user_id, assignment_id, result["grade"])
-        else:
-            parsed_results = []
-        
-        return {
-            "success": True,
-            "filename": file.filename,
-            "assignment_id": assignment_id,
-            "user_id": user_id,
-            "results": {
-                "grading_results": parsed_results,
-                "docker_output": docker_result.get("output", ""),
-                "docker_error": docker_result.get("error")
-            }
-        }
-        
     except Exception as e:
         if file_path.exists():
             file_path.unlink()
-        raise HTTPException(status_code=500, detail=f"Grading failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    
+    # Grading runs in the background; progress and results are pushed to /events.
+    # An earlier upload for the assignment that is still being graded is cancelled.
+    superseded_job_id = start_grading_job(user_id, assignment_id, job_id, file_path, file.filename)
+    
+    return {
+        "success": True,
+        "job_id": job_id,
+        "superseded_job_id": superseded_job_id,
+        "status": "queued",
+        "filename": file.filename,
+        "assignment_id": assignment_id,
+        "user_id": user_id
+    }
+
+# Server-sent events stream of the current user's grading jobs
+@router.get("/events")
+async def grading_events(request: Request):
+    user_id = require_auth(request)
+    
+    return StreamingResponse(
+        event_bus.stream(user_id),
+        media_type="text/event-stream",
+        # No caching, and no buffering by proxies such as nginx
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Latest state of a grading job, for clients that lost their event stream
+@router.get("/jobs/{job_id}")
+async def grading_job_status(request: Request, job_id: str):
+    user_id = require_auth(request)
+    
+    status = event_bus.job_status(user_id, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
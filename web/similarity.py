@@ -0,0 +1,317 @@
+# Incremental code-similarity index for plagiarism checks.
+# After a submission is graded, its C++ sources are tokenized (identifiers and literals
+# normalized, so renaming variables doesn't hide a copy), hashed as k-grams and winnowed
+# into fingerprints. The fingerprints go into an inverted index table, and a MinHash
+# signature of them into LSH band buckets. Candidate matches for a new submission are the
+# submissions sharing a bucket, so lookups don't scan the class. Shared fingerprints are
+# then counted through the inverted index, and pairs above SIMILARITY_MIN_SCORE are stored
+# for the admin similarity page. Fingerprinting runs in a process pool off the grading path.
+
+import asyncio
+import hashlib
+import multiprocessing
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+import numpy as np
+from sqlalchemy import func
+from .config import (SUBMISSIONS_DIR, SIMILARITY_WORKERS, SIMILARITY_KGRAM, SIMILARITY_WINDOW, SIMILARITY_NUM_PERM,
+                     SIMILARITY_LSH_BANDS, SIMILARITY_MIN_SCORE, SIMILARITY_MAX_SOURCE_BYTES)
+from .database import (SessionLocal, Submissions, SimilarityDocuments, SimilarityFingerprints, SimilarityBuckets,
+                       SimilarityPairs)
+
+SOURCE_EXTENSIONS = {".cpp", ".cc", ".cxx", ".c", ".h", ".hpp", ".hh"}
+
+CPP_KEYWORDS = frozenset("""
+    alignas alignof auto bool break case catch char class const constexpr const_cast continue decltype default
+    delete do double dynamic_cast else enum explicit extern false float for friend goto if inline int long
+    mutable namespace new noexcept nullptr operator private protected public return short signed sizeof static
+    static_cast struct switch template this throw true try typedef typename union unsigned using virtual void
+    volatile while
+""".split())
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<skip>//[^\n]*|/\*(?:[^*]|\*(?!/))*(?:\*/|\Z)|^[ \t]*\#[^\n]*|\s+)
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<number>\.?\d(?:[\w.]|[eEpP][+-])*)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op><<=|>>=|->\*?|::|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||[-+*/%&|^!~<>=]=?|[{}()\[\];,.?:])
+  | (?P<other>.)
+""", re.S | re.M | re.X)
+
+# MinHash over 31-bit values, so a * x + b stays well inside uint64
+_PRIME = (1 << 31) - 1
+_random = np.random.RandomState(20240611)
+_PERM_A = _random.randint(1, _PRIME, SIMILARITY_NUM_PERM).astype(np.uint64)
+_PERM_B = _random.randint(0, _PRIME, SIMILARITY_NUM_PERM).astype(np.uint64)
+
+def tokenize(source: str) -> List[str]:
+    """C++ tokens with comments and preprocessor lines dropped and names/literals normalized."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(source):
+        kind = match.lastgroup
+        if kind == "skip":
+            continue
+        if kind == "name":
+            value = match.group()
+            tokens.append(value if value in CPP_KEYWORDS else "ID")
+        elif kind == "string":
+            tokens.append("STR")
+        elif kind == "number":
+            tokens.append("NUM")
+        else:
+            tokens.append(match.group())
+    return tokens
+
+def _hash63(data: bytes) -> int:
+    # SQLite integers are signed 64-bit
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big") >> 1
+
+def winnow(tokens: List[str], k: int = SIMILARITY_KGRAM, window: int = SIMILARITY_WINDOW) -> np.ndarray:
+    """Fingerprints of a token stream: the minimum k-gram hash of every window of k-grams."""
+    if len(tokens) < k:
+        return np.array([_hash63("\x1f".join(tokens).encode())] if tokens else [], dtype=np.int64)
+    hashes = np.array([_hash63("\x1f".join(tokens[i:i + k]).encode()) for i in range(len(tokens) - k + 1)],
+                      dtype=np.int64)
+    if hashes.size <= window:
+        return np.unique(hashes)
+    return np.unique(np.lib.stride_tricks.sliding_window_view(hashes, window).min(axis=1))
+
+def minhash(fingerprints: np.ndarray) -> np.ndarray:
+    values = (fingerprints.astype(np.uint64) % np.uint64(_PRIME))[None, :]
+    return ((_PERM_A[:, None] * values + _PERM_B[:, None]) % np.uint64(_PRIME)).min(axis=1)
+
+def lsh_buckets(signature: np.ndarray, bands: int = SIMILARITY_LSH_BANDS) -> List[int]:
+    return [_hash63(band.tobytes()) for band in np.array_split(signature, bands)]
+
+def read_sources(zip_path: str) -> Optional[str]:
+    """The C++ sources in a submission zip, concatenated in name order, or None if unreadable."""
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            remaining = SIMILARITY_MAX_SOURCE_BYTES
+            parts = []
+            for info in sorted(archive.infolist(), key=lambda info: info.filename):
+                if info.is_dir() or Path(info.filename).suffix.lower() not in SOURCE_EXTENSIONS:
+                    continue
+                if "__MACOSX" in info.filename or remaining <= 0:
+                    continue
+                with archive.open(info) as source:
+                    data = source.read(remaining)
+                remaining -= len(data)
+                parts.append(data.decode("utf-8", "replace"))
+            return "\n".join(parts)
+    except (OSError, zipfile.BadZipFile):
+        return None
+
+def fingerprint_zip(zip_path: str) -> Optional[Dict]:
+    """Runs in the worker pool: tokens, fingerprints and LSH buckets of a submission zip."""
+    try:
+        with open(zip_path, "rb") as f:
+            zip_sha256 = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+    sources = read_sources(zip_path)
+    if sources is None:
+        return None
+
+    tokens = tokenize(sources)
+    fingerprints = winnow(tokens)
+    return {
+        "zip_sha256": zip_sha256,
+        "token_count": len(tokens),
+        "fingerprints": fingerprints.tolist(),
+        "buckets": lsh_buckets(minhash(fingerprints)) if fingerprints.size else [],
+    }
+
+def _chunks(values: List, size: int = 500):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _remove(db, submission_id: str):
+    db.query(SimilarityFingerprints).filter(SimilarityFingerprints.submission_id == submission_id).delete()
+    db.query(SimilarityBuckets).filter(SimilarityBuckets.submission_id == submission_id).delete()
+    db.query(SimilarityPairs).filter(
+        (SimilarityPairs.submission_a == submission_id) | (SimilarityPairs.submission_b == submission_id)
+    ).delete(synchronize_session=False)
+
+def store_index(user_id: str, assignment_id: str, index: Dict) -> int:
+    """Replace a submission's entry in the index and score it against its LSH candidates.
+
+    Returns the number of suspicious pairs stored for it. Blocking; run it in a worker thread.
+    """
+    submission_id = f"{user_id}_{assignment_id}"
+    fingerprints: List[int] = index["fingerprints"]
+    db = SessionLocal()
+    try:
+        document = db.query(SimilarityDocuments).filter(SimilarityDocuments.submission_id == submission_id).first()
+        if document and document.zip_sha256 == index["zip_sha256"]:
+            return -1  # same upload as last time
+
+        _remove(db, submission_id)
+        if document is None:
+            document = SimilarityDocuments(submission_id=submission_id, user_id=user_id, assignment_id=assignment_id)
+            db.add(document)
+        document.zip_sha256 = index["zip_sha256"]
+        document.token_count = index["token_count"]
+        document.fingerprint_count = len(fingerprints)
+        document.indexed_at = datetime.now()
+
+        # Candidates: anything sharing an LSH bucket in the same band
+        wanted = set(enumerate(index["buckets"]))
+        candidates: Set[str] = set()
+        for buckets in _chunks([bucket for _, bucket in wanted]):
+            rows = db.query(SimilarityBuckets.band, SimilarityBuckets.bucket, SimilarityBuckets.submission_id).filter(
+                SimilarityBuckets.assignment_id == assignment_id, SimilarityBuckets.bucket.in_(buckets)
+            )
+            candidates.update(other for band, bucket, other in rows if (band, bucket) in wanted)
+        candidates.discard(submission_id)
+
+        db.bulk_insert_mappings(SimilarityFingerprints, [
+            {"assignment_id": assignment_id, "fingerprint": fingerprint, "submission_id": submission_id}
+            for fingerprint in fingerprints
+        ])
+        db.bulk_insert_mappings(SimilarityBuckets, [
+            {"assignment_id": assignment_id, "band": band, "bucket": bucket, "submission_id": submission_id}
+            for band, bucket in wanted
+        ])
+
+        # Exact overlap with each candidate, counted through the inverted index
+        shared: Dict[str, int] = {}
+        if candidates and fingerprints:
+            for chunk in _chunks(fingerprints):
+                rows = db.query(SimilarityFingerprints.submission_id, SimilarityFingerprints.fingerprint).filter(
+                    SimilarityFingerprints.assignment_id == assignment_id,
+                    SimilarityFingerprints.fingerprint.in_(chunk),
+                    SimilarityFingerprints.submission_id.in_(candidates)
+                )
+                for other, _ in rows:
+                    shared[other] = shared.get(other, 0) + 1
+
+        stored = 0
+        others = {d.submission_id: d for d in db.query(SimilarityDocuments).filter(
+            SimilarityDocuments.submission_id.in_(list(shared))
+        )} if shared else {}
+        for other_id, count in shared.items():
+            other = others.get(other_id)
+            if other is None or not other.fingerprint_count:
+                continue
+            similarity = count / (len(fingerprints) + other.fingerprint_count - count)
+            containment = count / min(len(fingerprints), other.fingerprint_count)
+            if max(similarity, containment) < SIMILARITY_MIN_SCORE:
+                continue
+            first, second = sorted([(submission_id, user_id), (other_id, other.user_id)])
+            db.add(SimilarityPairs(
+                id=f"{first[0]}|{second[0]}", assignment_id=assignment_id,
+                submission_a=first[0], submission_b=second[0], user_a=first[1], user_b=second[1],
+                similarity=similarity, containment=containment, shared_fingerprints=count,
+                updated_at=datetime.now()
+            ))
+            stored += 1
+
+        db.commit()
+        return stored
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def remove_assignment_index(db, assignment_id: str):
+    """Drop every index row of an assignment; the caller commits."""
+    for model in (SimilarityFingerprints, SimilarityBuckets, SimilarityPairs, SimilarityDocuments):
+        db.query(model).filter(model.assignment_id == assignment_id).delete()
+
+def suspicious_pairs(assignment_id: str, limit: int = 100) -> List[SimilarityPairs]:
+    db = SessionLocal()
+    pairs = db.query(SimilarityPairs).filter(SimilarityPairs.assignment_id == assignment_id).order_by(
+        SimilarityPairs.similarity.desc(), SimilarityPairs.containment.desc()
+    ).limit(limit).all()
+    db.close()
+    return pairs
+
+def index_summary() -> Dict[str, int]:
+    """Indexed submissions per assignment."""
+    db = SessionLocal()
+    rows = db.query(SimilarityDocuments.assignment_id, func.count(SimilarityDocuments.submission_id)).group_by(
+        SimilarityDocuments.assignment_id
+    ).all()
+    db.close()
+    return dict(rows)
+
+class SimilarityIndexer:
+    """Indexes submissions in the background: fingerprinting in a process pool, then a DB write.
+
+    Must be used from the event loop thread.
+    """
+
+    def __init__(self, workers: int = SIMILARITY_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        # Writes are serialized; SQLite would serialize them anyway
+        self._write_lock: Optional[asyncio.Lock] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs threads (the server's worker threads) isn't safe
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def schedule(self, user_id: str, assignment_id: str, zip_path: Path):
+        """Index a graded submission without waiting for it."""
+        task = asyncio.create_task(self.index(user_id, assignment_id, zip_path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def index(self, user_id: str, assignment_id: str, zip_path: Path) -> Optional[int]:
+        try:
+            pool = self._executor()
+            try:
+                index = await asyncio.get_running_loop().run_in_executor(pool, fingerprint_zip, str(zip_path))
+            except BrokenProcessPool:
+                # A worker died (e.g. killed by the OOM killer); start a fresh pool for later submissions
+                if self._pool is pool:
+                    self._pool = None
+                raise
+            if index is None:
+                print(f"DEBUG: Similarity index skipped unreadable zip {zip_path}")
+                return None
+            if self._write_lock is None:
+                self._write_lock = asyncio.Lock()
+            async with self._write_lock:
+                stored = await asyncio.to_thread(store_index, user_id, assignment_id, index)
+            if stored > 0:
+                print(f"Similarity: {user_id}/{assignment_id} matches {stored} other submission(s)")
+            return stored
+        except Exception as e:
+            print(f"Similarity indexing failed for {user_id}/{assignment_id}: {e}")
+            return None
+
+    def reindex_assignment(self, assignment_id: str) -> int:
+        """Schedule every kept upload of an assignment; returns how many were scheduled."""
+        db = SessionLocal()
+        user_ids = [user_id for (user_id,) in db.query(Submissions.user_id).filter(
+            Submissions.assignment_id == assignment_id
+        )]
+        db.close()
+        scheduled = 0
+        for user_id in user_ids:
+            zip_path = SUBMISSIONS_DIR / f"{user_id}_{assignment_id}.zip"
+            if zip_path.exists():
+                self.schedule(user_id, assignment_id, zip_path)
+                scheduled += 1
+        return scheduled
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+similarity_indexer = SimilarityIndexer()
@@ -0,0 +1,175 @@
+# Bulk student import from CSV (admin students page and `python -m web.cli import-students`).
+# Rows are validated up front, then imported in batches: one query finds the batch's existing
+# accounts, bcrypt hashes are computed across a process pool sized to the cores, and the
+# batch is inserted/updated in a single transaction. Progress is reported after every batch.
+
+import asyncio
+import csv
+import io
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy.exc import IntegrityError
+from .config import IMPORT_BATCH_SIZE, IMPORT_HASH_WORKERS, IMPORT_MAX_ROWS
+from .database import SessionLocal, Users
+from .auth import hash_password
+from .catalog import invalidate_student
+from .events import event_bus
+from .grading.lifecycle import new_job_id
+
+STUDENT_ID_PATTERN = re.compile(r"^[A-Za-z0-9._@-]{1,64}$")
+ON_EXISTING = ("skip", "update")
+
+_running: Set[asyncio.Task] = set()
+
+@dataclass
+class ImportRow:
+    line: int
+    user_id: str
+    name: str
+    password: str
+
+@dataclass
+class ImportReport:
+    total: int = 0
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+
+    def as_dict(self) -> Dict:
+        return {"total": self.total, "created": self.created, "updated": self.updated, "skipped": self.skipped,
+                "errors": [{"line": line, "message": message} for line, message in self.errors]}
+
+def parse_csv(text: str) -> Tuple[List[ImportRow], List[Tuple[int, str]]]:
+    """Validate a CSV with student_id (or user_id), name and password columns.
+
+    Returns the valid rows and (line, message) errors for the rest.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    columns = {(name or "").strip().lower(): name for name in reader.fieldnames or []}
+    id_column = columns.get("student_id") or columns.get("user_id")
+    if not id_column or "name" not in columns or "password" not in columns:
+        return [], [(1, "Header must have student_id, name and password columns")]
+
+    rows, errors, seen = [], [], {}
+    for record in reader:
+        line = reader.line_num
+        if len(rows) + len(errors) >= IMPORT_MAX_ROWS:
+            errors.append((line, f"More than {IMPORT_MAX_ROWS} rows; the rest were not imported"))
+            break
+        user_id = (record.get(id_column) or "").strip()
+        name = (record.get(columns["name"]) or "").strip()
+        password = record.get(columns["password"]) or ""
+        if not user_id and not name and not password:
+            continue
+        if not STUDENT_ID_PATTERN.match(user_id):
+            errors.append((line, f"Invalid student ID '{user_id}'"))
+        elif not name:
+            errors.append((line, f"Missing name for {user_id}"))
+        elif not password:
+            errors.append((line, f"Missing password for {user_id}"))
+        elif user_id in seen:
+            errors.append((line, f"Duplicate student ID {user_id} (first on line {seen[user_id]})"))
+        else:
+            seen[user_id] = line
+            rows.append(ImportRow(line, user_id, name, password))
+    return rows, errors
+
+def _hash_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn, since the web server's process runs threads
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+def import_students(rows: List[ImportRow], on_existing: str = "skip",
+                    progress: Optional[Callable[[int, int], None]] = None,
+                    report: Optional[ImportReport] = None) -> ImportReport:
+    """Create (or, with on_existing="update", update) student accounts. Blocking.
+
+    progress(done, total) is called after each batch. Admin accounts are never modified.
+    """
+    report = report or ImportReport()
+    report.total += len(rows)
+    done = 0
+
+    with _hash_pool(max(1, min(IMPORT_HASH_WORKERS, len(rows)))) as pool:
+        for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+            batch = rows[start:start + IMPORT_BATCH_SIZE]
+            db = SessionLocal()
+            try:
+                existing = {user.user_id: user.role for user in db.query(Users.user_id, Users.role).filter(
+                    Users.user_id.in_([row.user_id for row in batch])
+                )}
+                to_create, to_update = [], []
+                for row in batch:
+                    role = existing.get(row.user_id)
+                    if role is None:
+                        to_create.append(row)
+                    elif role != "student":
+                        report.errors.append((row.line, f"{row.user_id} is an {role} account and was not changed"))
+                    elif on_existing == "update":
+                        to_update.append(row)
+                    else:
+                        report.skipped += 1
+
+                pending = to_create + to_update
+                chunksize = max(1, len(pending) // (IMPORT_HASH_WORKERS * 4))
+                hashes = list(pool.map(hash_password, [row.password for row in pending], chunksize=chunksize))
+                created_hashes, updated_hashes = hashes[:len(to_create)], hashes[len(to_create):]
+
+                db.bulk_insert_mappings(Users, [
+                    {"user_id": row.user_id, "name": row.name, "password_hash": password_hash, "role": "student"}
+                    for row, password_hash in zip(to_create, created_hashes)
+                ])
+                db.bulk_update_mappings(Users, [
+                    {"user_id": row.user_id, "name": row.name, "password_hash": password_hash}
+                    for row, password_hash in zip(to_update, updated_hashes)
+                ])
+                db.commit()
+                report.created += len(to_create)
+                report.updated += len(to_update)
+            except IntegrityError:
+                # Someone registered one of these IDs since the existence check
+                db.rollback()
+                report.errors.extend((row.line, f"{row.user_id} could not be saved (registered meanwhile?), "
+                                                "re-run the import") for row in pending)
+            finally:
+                db.close()
+
+            done += len(batch)
+            if progress:
+                progress(done, len(rows))
+
+    if report.updated:
+        invalidate_student()
+    return report
+
+def start_import_job(admin_id: str, rows: List[ImportRow], errors: List[Tuple[int, str]], on_existing: str) -> str:
+    """Import in the background, publishing progress to the admin's event stream; returns the job id."""
+    job_id = new_job_id()
+    task = asyncio.create_task(_run_import(job_id, admin_id, rows, errors, on_existing))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return job_id
+
+async def _run_import(job_id: str, admin_id: str, rows: List[ImportRow], errors: List[Tuple[int, str]],
+                      on_existing: str):
+    loop = asyncio.get_running_loop()
+
+    def publish(event: Dict):
+        event_bus.publish(admin_id, {"job_id": job_id, "kind": "student_import", **event})
+
+    def progress(done: int, total: int):
+        # Called from the importing thread
+        loop.call_soon_threadsafe(publish, {"stage": "importing", "done": done, "total": total})
+
+    report = ImportReport(errors=list(errors))
+    publish({"stage": "importing", "done": 0, "total": len(rows)})
+    try:
+        await asyncio.to_thread(import_students, rows, on_existing, progress, report)
+        report.errors.sort()
+        publish({"stage": "done", "report": report.as_dict()})
+    except Exception as e:
+        print(f"Student import {job_id} failed: {e}")
+        publish({"stage": "failed", "error": f"Import failed: {e}", "report": report.as_dict()})